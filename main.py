@@ -1,24 +1,57 @@
+import time
+# mốc thời gian khởi động, dùng để báo cáo time-to-ready
+_STARTED_AT = time.monotonic()
+
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, JSONResponse
 from contextlib import asynccontextmanager
-from src.database.load_database import load_graph_from_db
+from src.app.core import metrics, lazy_imports
+from src.app.core.body_limit import BodySizeLimitMiddleware
 from src.app.models.models_loader import load_flood_model
 
 from src.app.api.geocoding import router as geocoding_router
-from src.app.api.path_finding import init_routes as init_pathfinding_routes
+from src.app.api.analysis import router as analysis_router
+from src.app.api.admin import router as admin_router
+from src.app.api.tiles import router as tiles_router
+from src.app.core.database import dispose_engines
+from src.app.api.path_finding import router as pathfinding_router, init_routes as init_pathfinding_routes
+from src.services.routing_executor import routing_executor
+from src.services.graph_store import graph_store, watch_trigger_file
+from src.services import live_traffic, request_log
+from src.app.core.config import ROUTING_MODE, GRAPH_RELOAD_TRIGGER_FILE, GRAPH_RELOAD_POLL_SECONDS, \
+    LIVE_TRAFFIC_SOURCE, ZONE_MAX_PAYLOAD_BYTES
 
 # global variables
-G_base = None
 flood_model = None
+startup_state = {"state": "starting", "error": None, "time_to_ready_seconds": None}
 
+# các thư viện mà request đầu tiên sẽ cần; import sẵn trong lúc nạp dữ liệu ở nền
+_WARM_IMPORTS = ("osmnx", "geopandas", "sklearn.neighbors", "geopy.distance")
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """load data at startup"""
-    global G_base, flood_model
 
-    print("starting up...")
-    print("loading map data from postgis...")
-    G_base = load_graph_from_db()
+def _load_data():
+    """Chạy ở thread nền: import thư viện nặng, nạp đồ thị và model."""
+    global flood_model
+
+    for name in _WARM_IMPORTS:
+        lazy_imports.load(name)
+
+    if ROUTING_MODE == "tiled":
+        # các ô bản đồ được nạp dần từ postgis theo từng request (xem tile_service)
+        print("tiled routing mode: map tiles are loaded on demand.")
+    else:
+        print("loading map data from postgis...")
+        # graph_store giữ phiên bản đồ thị hiện tại; có thể nạp lại qua /api/v1/admin/reload-graph
+        if graph_store.reload() is None:
+            raise RuntimeError(graph_store.status["error"] or "không nạp được đồ thị")
+        if GRAPH_RELOAD_TRIGGER_FILE:
+            watch_trigger_file(graph_store, GRAPH_RELOAD_TRIGGER_FILE, GRAPH_RELOAD_POLL_SECONDS)
+        if LIVE_TRAFFIC_SOURCE:
+            # tốc độ trực tiếp được áp tại chỗ vào phiên bản đồ thị đang phục vụ
+            live_traffic.start_ingest(graph_store, LIVE_TRAFFIC_SOURCE)
+        # chạy lại các request phổ biến trong nhật ký ở nền (cả sau mỗi lần nạp lại đồ thị)
+        request_log.start_warmup(graph_store)
 
     print("loading flood prediction model...")
     flood_model = load_flood_model()
@@ -27,16 +60,46 @@ async def lifespan(app: FastAPI):
         print("flood model loaded successfully.")
     else:
         print("running without flood prediction model. smart routing disabled.")
+    init_pathfinding_routes(flood_model)
+
+
+async def _startup():
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _load_data)
+    except Exception as e:
+        startup_state.update(state="failed", error=str(e))
+        metrics.inc("startup_failures")
+        print(f"startup failed: {e}")
+        return
+    elapsed = time.monotonic() - _STARTED_AT
+    startup_state.update(state="ready", time_to_ready_seconds=elapsed)
+    metrics.set_gauge("startup_time_to_ready_seconds", elapsed)
+    print(f"api ready! ({elapsed:.1f}s)")
+
+
+def _is_ready() -> bool:
+    if startup_state["state"] != "ready":
+        return False
+    return ROUTING_MODE == "tiled" or graph_store.current is not None
 
-    # Register routers after data is loaded
-    pathfinding_router = init_pathfinding_routes(G_base, flood_model)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """bind ngay, nạp dữ liệu ở nền; /health/ready trả 503 cho tới khi xong"""
+    print("starting up...")
     app.include_router(pathfinding_router, prefix="/api/v1/routing", tags=["routing"])
     app.include_router(geocoding_router, prefix="/api/v1/geocoding", tags=["geocoding"])
+    app.include_router(analysis_router, prefix="/api/v1/analysis", tags=["analysis"])
+    app.include_router(admin_router, prefix="/api/v1/admin", tags=["admin"])
+    app.include_router(tiles_router, prefix="/tiles", tags=["tiles"])
 
-    print("api ready!")
+    startup_task = asyncio.create_task(_startup())
 
     yield
     print("shutting down...")
+    startup_task.cancel()
+    routing_executor.shutdown()
+    await dispose_engines()
 
 
 app = FastAPI(
@@ -45,11 +108,39 @@ app = FastAPI(
     description="api for smart routing and geocoding services",
     version="1.0.0"
 )
+# các endpoint nhận vùng ngập / vùng cấm: chặn thân request quá lớn trước khi parse
+app.add_middleware(
+    BodySizeLimitMiddleware, max_bytes=ZONE_MAX_PAYLOAD_BYTES,
+    paths=tuple(f"/api/v1/routing/{name}" for name in ("find-standard-route", "trip", "subscriptions")),
+)
 
 
 @app.get("/health", tags=["health"])
 def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy" if _is_ready() else startup_state["state"]}
+
+
+@app.get("/health/live", tags=["health"])
+def liveness():
+    """Process còn chạy (không phụ thuộc dữ liệu đã nạp xong hay chưa)"""
+    return {"status": "alive", "uptime_seconds": time.monotonic() - _STARTED_AT}
+
+
+@app.get("/health/ready", tags=["health"])
+def readiness():
+    """Sẵn sàng nhận request tìm đường: 503 cho tới khi đồ thị và model được nạp"""
+    body = {
+        **startup_state,
+        "graph_version": graph_store.current.version if graph_store.current else None,
+        "import_seconds": lazy_imports.import_times(),
+    }
+    return JSONResponse(status_code=200 if _is_ready() else 503, content=body)
+
+
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Số liệu vận hành (hàng đợi tìm đường, thời gian chờ...) theo định dạng Prometheus"""
+    return metrics.render_prometheus()
 
 
 if __name__ == "__main__":
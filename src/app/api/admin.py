@@ -0,0 +1,117 @@
+# src/app/api/admin.py
+from fastapi import APIRouter, Header, HTTPException, Query
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any
+
+from src.app.core.config import ADMIN_TOKEN, ROUTING_MODE
+from src.database.load_database import clear_table_meta
+from src.services import tile_service
+from src.services.graph_store import graph_store
+from src.services.region_registry import region_registry
+from src.services.zone_state import public as public_zone
+
+router = APIRouter()
+
+
+def _check_token(token: Optional[str]):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="sai admin token")
+
+
+@router.post("/reload-graph", status_code=202, summary="Nạp lại dữ liệu bản đồ không cần khởi động lại")
+def reload_graph(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Nạp phiên bản đồ thị mới ở nền rồi đổi vào khi xong.
+    Request đang chạy vẫn dùng phiên bản cũ; theo dõi tiến trình qua GET /graph.
+    """
+    _check_token(x_admin_token)
+    if ROUTING_MODE == "tiled":
+        # các ô được nạp lại từ postgis ở request kế tiếp
+        clear_table_meta()
+        tile_service.tile_cache.clear()
+        return {"started": True, "graph_version": f"tiles-{tile_service.tile_cache.generation}"}
+
+    started = graph_store.reload_in_background()
+    return {"started": started, **graph_store.stats()}
+
+
+@router.get("/traffic", summary="Trạng thái tốc độ giao thông trực tiếp")
+def traffic_status(x_admin_token: Optional[str] = Header(default=None)):
+    _check_token(x_admin_token)
+    version = graph_store.current
+    live = version.indexes.get("live_traffic") if version is not None else None
+    if live is None:
+        raise HTTPException(status_code=404, detail="chưa có dữ liệu tốc độ trực tiếp")
+    return {"graph_version": version.version, **live.stats()}
+
+
+@router.get("/graph", summary="Phiên bản đồ thị đang phục vụ")
+def graph_status(x_admin_token: Optional[str] = Header(default=None)):
+    _check_token(x_admin_token)
+    if ROUTING_MODE == "tiled":
+        return {"graph_version": f"tiles-{tile_service.tile_cache.generation}"}
+    return graph_store.stats()
+
+
+class ZoneCreate(BaseModel):
+    kind: str = Field(..., description="flood (vùng ngập) hoặc ban (vùng cấm)")
+    geometry: Dict[str, Any] = Field(..., description="geometry hoặc Feature GeoJSON của vùng")
+
+
+def _zones(region: Optional[str]):
+    zones = region_registry.zones_for(region)
+    if zones is None:
+        raise HTTPException(status_code=404, detail=f"không có vùng bản đồ {region}")
+    return zones
+
+
+_REGION_QUERY = Query(default=None, description="tên vùng bản đồ (REGIONS_FILE); bỏ trống = đồ thị mặc định")
+
+
+@router.get("/zones", summary="Các vùng ngập / vùng cấm đang có hiệu lực")
+def list_zones(region: Optional[str] = _REGION_QUERY, x_admin_token: Optional[str] = Header(default=None)):
+    _check_token(x_admin_token)
+    zone_state = _zones(region)
+    return {"version": zone_state.version, "zones": [public_zone(z) for z in zone_state.zones()]}
+
+
+@router.post("/zones", status_code=201, summary="Thêm vùng ngập / vùng cấm (hiển thị trên vector tile)")
+def add_zone(request: ZoneCreate, region: Optional[str] = _REGION_QUERY,
+             x_admin_token: Optional[str] = Header(default=None)):
+    _check_token(x_admin_token)
+    try:
+        zone = _zones(region).add(request.kind, request.geometry)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return public_zone(zone)
+
+
+@router.delete("/zones/{zone_id}", summary="Xóa một vùng")
+def delete_zone(zone_id: int, region: Optional[str] = _REGION_QUERY,
+                x_admin_token: Optional[str] = Header(default=None)):
+    _check_token(x_admin_token)
+    zone_state = _zones(region)
+    if zone_state.remove(zone_id) is None:
+        raise HTTPException(status_code=404, detail=f"không có vùng {zone_id}")
+    return {"deleted": zone_id, "version": zone_state.version}
+
+
+@router.delete("/zones", summary="Xóa tất cả các vùng")
+def clear_zones(region: Optional[str] = _REGION_QUERY, x_admin_token: Optional[str] = Header(default=None)):
+    _check_token(x_admin_token)
+    zone_state = _zones(region)
+    return {"deleted": zone_state.clear(), "version": zone_state.version}
+
+
+@router.get("/regions", summary="Các vùng bản đồ: đã nạp hay chưa, bộ nhớ, số lần nạp / đẩy ra")
+def region_status(x_admin_token: Optional[str] = Header(default=None)):
+    _check_token(x_admin_token)
+    return region_registry.stats()
+
+
+@router.post("/regions/{name}/evict", summary="Đẩy một vùng ra khỏi bộ nhớ (nạp lại ở request sau)")
+def evict_region(name: str, x_admin_token: Optional[str] = Header(default=None)):
+    _check_token(x_admin_token)
+    if region_registry.get(name) is None:
+        raise HTTPException(status_code=404, detail=f"không có vùng bản đồ {name}")
+    return {"evicted": region_registry.evict(name)}
@@ -0,0 +1,31 @@
+# src/app/api/analysis.py
+from fastapi import APIRouter
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any
+
+from src.services import map_data_service
+
+router = APIRouter()
+
+
+class ZonesRequest(BaseModel):
+    geometries: List[Dict[str, Any]] = Field(
+        default=[],
+        description="danh sách các đối tượng geojson (polygon, linestring, point) cần xem các đường bị ảnh hưởng"
+    )
+
+
+@router.post("/affected-edges", summary="Xem trước các đoạn đường bị ảnh hưởng bởi từng vùng")
+async def affected_edges_preview(request: ZonesRequest):
+    """
+    Trả về GeoJSON gộp các cạnh bị ảnh hưởng cho từng vùng (cùng thứ tự với input).
+    Truy vấn bất đồng bộ, tất cả vùng trong một round trip.
+    """
+    collected = await map_data_service.get_affected_edges_by_geometry_batch_async(request.geometries)
+    return {"zones": collected}
+
+
+@router.post("/affected-edge-ids", summary="Danh sách (u, v, key) bị ảnh hưởng bởi từng vùng")
+async def affected_edge_ids(request: ZonesRequest):
+    grouped = await map_data_service.get_affected_edge_ids_batch_async(request.geometries)
+    return {"zones": [[list(edge) for edge in edges] for edges in grouped]}
@@ -3,6 +3,7 @@ from pydantic import BaseModel
 
 # BƯỚC 1: Import service chuyên gia
 from src.services import geocoding_service
+from src.services.request_log import request_log
 
 router = APIRouter()
 
@@ -22,6 +23,7 @@ def loc_to_coords(request: AddressRequest):
     """
     # BƯỚC 2: Giao toàn bộ công việc cho service
     # Toàn bộ logic gọi requests.get đã được chuyển vào service
+    request_log.record("geocode", {"address": request.address})
     return geocoding_service.get_coords_from_address(request.address)
 
 
@@ -45,4 +47,5 @@ def coords_to_loc(
     Endpoint này nhận tọa độ, sau đó gọi geocoding_service để xử lý.
     """
     #BƯỚC 3: Giao toàn bộ công việc cho service
+    request_log.record("reverse", {"lat": latitude, "lon": longitude})
     return geocoding_service.get_address_from_coords(latitude, longitude)
\ No newline at end of file
@@ -1,26 +1,47 @@
 # src/app/api/path_finding.py
-from fastapi import APIRouter, HTTPException, Body
+import asyncio
+from datetime import datetime
+import json
+import re
+from fastapi import APIRouter, HTTPException, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List, Dict, Any
-import networkx as nx
-import time
-from src.services import geocoding_service, pathfinding_service
-from src.app.schemas.route_input_format import RouteRequest, Point
+from src.services import geocoding_service, pathfinding_service, vector_tiles, weight_service
+from src.services.graph_store import graph_store, GraphNotLoadedError
+from src.services.routing_executor import routing_executor, QueueFullError, DeadlineExceededError
+from src.services.request_log import request_log
+from src.services.route_subscriptions import subscription_registry, TooManySubscriptionsError
+from src.app.core.config import ROUTING_MODE, SUBSCRIPTION_KEEPALIVE_SECONDS
+from src.app.schemas.route_input_format import RouteRequest, TripRequest, MatchRequest, Point
 
-_G_base: Optional[nx.MultiDiGraph] = None
 _flood_model = None
+# session_id của client: không chứa ':' nên không trùng phiên nội bộ (vd. "subscription:<id>")
+_SESSION_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
 
 
 router = APIRouter()
 
 
-def init_routes(G_base: nx.MultiDiGraph, flood_model):
-    """Khởi tạo router với graph và model đã load từ main.py"""
-    global _G_base, _flood_model
-    _G_base = G_base
+def init_routes(flood_model):
+    """Khởi tạo router với model đã load từ main.py (đồ thị lấy từ graph_store)"""
+    global _flood_model
     _flood_model = flood_model
     return router
 
 
+async def _check_zones(*zone_lists) -> list:
+    """
+    Tiền xử lý các vùng ngập / vùng cấm của request (weight_service.preprocess_zones); 413 nếu vượt
+    giới hạn số đỉnh. Kết quả được truyền xuống lượt tìm đường (tham số zones) để không xử lý lại.
+    Kích thước thân request đã được BodySizeLimitMiddleware chặn trước khi parse.
+    """
+    try:
+        return await run_in_threadpool(weight_service.preprocess_zones, *zone_lists)
+    except weight_service.ZoneLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
 @router.post("/find-route", summary="Tìm đường thông minh với model dự đoán ngập")
 def find_route_endpoint(request: RouteRequest):
     raise HTTPException(
@@ -30,24 +51,43 @@ def find_route_endpoint(request: RouteRequest):
 
 
 @router.post("/find-standard-route", summary="Tìm đường tiêu chuẩn")
-def find_standard_route_endpoint(
+async def find_standard_route_endpoint(
     start_address: Optional[str] = Body(...),
     end_address: Optional[str] = Body(...),
     blocking_geometries: List[Dict[str, Any]] = Body(default=[]),
     flood_areas: List[Dict[str, Any]] = Body(default=[]),
-    ban_areas: List[Dict[str, Any]] = Body(default=[])
+    ban_areas: List[Dict[str, Any]] = Body(default=[]),
+    profile: str = Body(default="car"),
+    departure_time: Optional[datetime] = Body(default=None),
+    session_id: Optional[str] = Body(default=None)
 ):
-    """Tìm đường tiêu chuẩn từ địa chỉ A đến địa chỉ B."""
+    """
+    Tìm đường tiêu chuẩn từ địa chỉ A đến địa chỉ B.
+    Gửi cùng session_id ở các lần tìm lại (vd. sau khi thêm vùng cấm / vùng ngập) để tuyến được sửa
+    tăng dần từ lần trước thay vì tìm lại từ đầu.
+    """
     try:
-        if _G_base is None:
-            raise HTTPException(status_code=500, detail="Graph chưa được load")
+        if graph_store.current is None and ROUTING_MODE != "tiled":
+            raise HTTPException(
+                status_code=503, detail="bản đồ đang được tải, vui lòng thử lại sau", headers={"Retry-After": "5"}
+            )
 
         if not start_address or not end_address:
             raise HTTPException(status_code=400, detail="Thiếu địa chỉ đầu vào")
 
-        start_coords = geocoding_service.get_coords_from_address(start_address)
-        time.sleep(1.5)
-        end_coords = geocoding_service.get_coords_from_address(end_address)
+        if session_id is not None and not _SESSION_ID.fullmatch(session_id):
+            raise HTTPException(status_code=400, detail="session_id chỉ gồm chữ, số, '_' hoặc '-' (tối đa 64 ký tự)")
+
+        zones = await _check_zones(flood_areas, ban_areas, blocking_geometries)
+
+        request_log.record("geocode", {"address": start_address})
+        request_log.record("geocode", {"address": end_address})
+        # Geocoding là I/O chặn -> chạy trên threadpool, không giữ event loop
+        start_coords = await run_in_threadpool(geocoding_service.get_coords_from_address, start_address)
+        # giãn cách hai lần gọi Nominatim (không cần nếu điểm đến đã có trong cache)
+        if not geocoding_service.is_address_cached(end_address):
+            await asyncio.sleep(1.5)
+        end_coords = await run_in_threadpool(geocoding_service.get_coords_from_address, end_address)
 
         if not start_coords:
             raise HTTPException(
@@ -78,13 +118,30 @@ def find_standard_route_endpoint(
             ),
             blocking_geometries=blocking_geometries or [],
             flood_areas=flood_areas or [],
-            ban_areas=ban_areas or []
+            ban_areas=ban_areas or [],
+            profile=profile,
+            departure_time=departure_time
         )
 
-        result = pathfinding_service.find_standard_route(route_request, _G_base)
+        request_log.record_route(route_request)
+
+        # Tìm đường chạy trên pool worker riêng, có giới hạn hàng đợi và deadline
+        try:
+            if ROUTING_MODE == "tiled":
+                result = await routing_executor.run(pathfinding_service.find_standard_route_tiled, route_request)
+            else:
+                result = await routing_executor.run(
+                    pathfinding_service.find_standard_route_current, route_request, session_id=session_id, zones=zones
+                )
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except GraphNotLoadedError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        except DeadlineExceededError as e:
+            raise HTTPException(status_code=504, detail=str(e))
 
         if "error" in result:
-            return {"error": result["error"], "message": "Không tìm thấy đường đi"}
+            return {"error": result["error"], "message": "Không tìm thấy đường đi", "graph_version": result.get("graph_version")}
 
         return result
 
@@ -92,3 +149,146 @@ def find_standard_route_endpoint(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi không mong muốn: {str(e)}")
+
+
+@router.get("/base-map", summary="Khung bao và GeoJSON mạng đường cho bản đồ nền")
+async def base_map_endpoint():
+    """
+    Bản đồ nền cho frontend: dựng và serialize một lần cho mỗi phiên bản đồ thị, các lần gọi sau
+    trả thẳng bytes đã có. Client nên cache theo graph_version.
+    """
+    if ROUTING_MODE == "tiled":
+        raise HTTPException(status_code=501, detail="chế độ tiled không có bản đồ nền trong bộ nhớ, dùng /tiles")
+    try:
+        data = await run_in_threadpool(vector_tiles.base_map)
+        return Response(content=data, media_type="application/json")
+    except GraphNotLoadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+@router.post("/trip", summary="Tối ưu thứ tự ghé nhiều điểm")
+async def trip_endpoint(request: TripRequest):
+    """
+    Sắp thứ tự ghé các điểm (điểm đầu tiên là điểm xuất phát) để tổng thời gian đi nhỏ nhất
+    và trả về từng chặng kèm geometry. Vùng ngập / vùng cấm được áp một lần cho cả hành trình.
+    """
+    if ROUTING_MODE == "tiled":
+        raise HTTPException(status_code=501, detail="tối ưu hành trình chưa hỗ trợ ở chế độ tiled")
+    if graph_store.current is None:
+        raise HTTPException(
+            status_code=503, detail="bản đồ đang được tải, vui lòng thử lại sau", headers={"Retry-After": "5"}
+        )
+
+    zones = await _check_zones(request.flood_areas, request.ban_areas, request.blocking_geometries)
+    try:
+        result = await routing_executor.run(pathfinding_service.find_trip_current, request, zones=zones)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except GraphNotLoadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    if "error" in result:
+        return {"error": result["error"], "message": "Không tối ưu được hành trình", "order": result.get("order")}
+    return result
+
+
+@router.post("/match", summary="Khớp vết GPS vào các cạnh của bản đồ")
+async def match_endpoint(request: MatchRequest):
+    """
+    Khớp vết GPS (HMM / Viterbi) vào các cạnh của đồ thị theo hồ sơ phương tiện.
+    Vết bị tách thành nhiều đoạn nếu có quãng không khớp được; file lớn dùng
+    `python -m src.services.map_matching`.
+    """
+    if ROUTING_MODE == "tiled":
+        raise HTTPException(status_code=501, detail="khớp vết GPS chưa hỗ trợ ở chế độ tiled")
+    if graph_store.current is None:
+        raise HTTPException(
+            status_code=503, detail="bản đồ đang được tải, vui lòng thử lại sau", headers={"Retry-After": "5"}
+        )
+
+    try:
+        result = await routing_executor.run(pathfinding_service.match_trace_current, request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except GraphNotLoadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    if "error" in result:
+        return {"error": result["error"], "message": "Không khớp được vết GPS"}
+    return result
+
+
+@router.post("/subscriptions", status_code=201, summary="Đăng ký theo dõi một tuyến đường")
+async def subscribe_route(request: RouteRequest, http_request: Request):
+    """
+    Tính tuyến như /find-standard-route (cộng các vùng ngập / vùng cấm đang có hiệu lực ở server)
+    và giữ đăng ký: khi vùng hoặc tốc độ trực tiếp đổi trên tuyến, tuyến mới được đẩy qua
+    GET /subscriptions/{id}/events?token=... (Server-Sent Events).
+    Token trả về chỉ có ở phản hồi này; gắn luồng sự kiện và hủy đăng ký đều cần token.
+    """
+    if ROUTING_MODE == "tiled":
+        raise HTTPException(status_code=501, detail="theo dõi tuyến đường chưa hỗ trợ ở chế độ tiled")
+
+    await _check_zones(request.flood_areas, request.ban_areas, request.blocking_geometries)
+    try:
+        sub = await routing_executor.run(subscription_registry.subscribe, request)
+    except (QueueFullError, TooManySubscriptionsError) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except GraphNotLoadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    events = http_request.url_for("subscription_events", subscription_id=sub.id).include_query_params(token=sub.token)
+    return {
+        "subscription_id": sub.id,
+        "token": sub.token,
+        "events": f"{events.path}?{events.query}",
+        "route": sub.result,
+    }
+
+
+@router.get("/subscriptions/{subscription_id}/events", summary="Luồng SSE các tuyến mới của một đăng ký")
+async def subscription_events(subscription_id: int, request: Request, token: str = Query(...)):
+    """
+    Sự kiện `route` (JSON: subscription_id, reason, route) gồm tuyến hiện tại khi vừa kết nối
+    và mỗi khi tuyến đổi; `end` khi đăng ký bị xóa. Mỗi SUBSCRIPTION_KEEPALIVE_SECONDS có một dòng chú thích.
+    token là token nhận được khi đăng ký (query vì EventSource không gửi được header).
+    """
+    queue = subscription_registry.attach(subscription_id, token, asyncio.get_running_loop())
+    if queue is None:
+        raise HTTPException(status_code=404, detail=f"không có đăng ký {subscription_id}")
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SUBSCRIPTION_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    yield "event: end\ndata: {}\n\n"
+                    return
+                yield f"event: route\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            subscription_registry.detach(subscription_id, queue)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.delete("/subscriptions/{subscription_id}", summary="Hủy đăng ký theo dõi tuyến đường")
+async def unsubscribe_route(subscription_id: int, token: str = Query(...)):
+    if subscription_registry.authorize(subscription_id, token) is None \
+            or not subscription_registry.unsubscribe(subscription_id):
+        raise HTTPException(status_code=404, detail=f"không có đăng ký {subscription_id}")
+    return {"subscription_id": subscription_id, "deleted": True}
@@ -0,0 +1,40 @@
+# src/app/api/tiles.py
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+
+from src.app.core.config import ROUTING_MODE
+from src.services import vector_tiles
+from src.services.graph_store import graph_store, GraphNotLoadedError
+from src.services.region_registry import UnknownRegionError
+
+router = APIRouter()
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+@router.get("/{z}/{x}/{y}.mvt", summary="Vector tile mạng đường và các vùng ngập / vùng cấm")
+async def vector_tile(z: int, x: int, y: int, if_none_match: Optional[str] = Header(default=None),
+                      region: Optional[str] = Query(default=None, description="tên vùng bản đồ (mặc định: đồ thị chung)")):
+    """
+    Ô Mapbox Vector Tile gồm các lớp roads, flood, ban. Trình duyệt chỉ tải các ô đang hiển thị;
+    ETag đổi khi ô đổi (phiên bản đồ thị mới, thêm / xóa vùng), nên có thể kiểm tra lại bằng If-None-Match.
+    Có region thì ô lấy từ đồ thị và vùng ngập / vùng cấm của vùng đó (nạp vùng nếu cần).
+    """
+    if ROUTING_MODE != "tiled" and region is None and graph_store.current is None:
+        raise HTTPException(
+            status_code=503, detail="bản đồ đang được tải, vui lòng thử lại sau", headers={"Retry-After": "5"}
+        )
+    try:
+        data, etag = await run_in_threadpool(vector_tiles.get_tile, z, x, y, region)
+    except UnknownRegionError:
+        raise HTTPException(status_code=404, detail=f"không có vùng bản đồ {region}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except GraphNotLoadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if if_none_match == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=MVT_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,67 @@
+# src/app/core/body_limit.py
+"""
+Giới hạn kích thước thân request trước khi FastAPI đọc và parse JSON.
+
+Content-Length lớn hơn giới hạn bị từ chối ngay (413) mà không đọc thân; request không có
+Content-Length (chunked) được đếm byte trong lúc đọc và dừng ngay khi vượt giới hạn.
+"""
+from fastapi import HTTPException
+
+from src.app.core import metrics
+
+
+class PayloadTooLargeError(HTTPException):
+    def __init__(self, size: int, limit: int):
+        super().__init__(status_code=413, detail=f"request {size} byte, vượt giới hạn {limit}")
+
+
+class BodySizeLimitMiddleware:
+    """Middleware ASGI: thân request tới các đường dẫn trong paths không được vượt max_bytes."""
+
+    def __init__(self, app, max_bytes: int, paths: tuple):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(send, int(length))
+            return
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI để HTTPException lọt qua khi đọc thân -> trả 413
+                    raise PayloadTooLargeError(received, self.max_bytes)
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except PayloadTooLargeError:
+            if started:
+                raise
+            await self._reject(send, received)
+
+    async def _reject(self, send, size: int):
+        metrics.inc("request_payload_rejected")
+        error = PayloadTooLargeError(size, self.max_bytes)
+        body = ('{"detail": "%s"}' % error.detail).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
@@ -2,7 +2,6 @@
 
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
 
 load_dotenv()
 
@@ -12,4 +11,128 @@ LATITUDE = float(os.getenv("LATITUDE", "21.0245"))
 LONGITUDE = float(os.getenv("LONGITUDE", "105.8412"))
 MODEL_PATH = os.getenv("MODEL_PATH", "src/app/models/flood_model.joblib")
 
-engine=create_engine(DATABASE_URL)
+# Pool worker riêng cho tìm đường (CPU-bound), tách khỏi threadpool mặc định của Starlette
+ROUTING_WORKERS = int(os.getenv("ROUTING_WORKERS", "2"))
+# Số request tối đa được xếp hàng chờ worker; vượt quá sẽ trả 503 ngay
+ROUTING_QUEUE_SIZE = int(os.getenv("ROUTING_QUEUE_SIZE", "16"))
+# Deadline cho một lần tìm đường (tính từ lúc vào hàng đợi)
+ROUTING_TIMEOUT_SECONDS = float(os.getenv("ROUTING_TIMEOUT_SECONDS", "20"))
+
+# Chế độ định tuyến: "full" nạp toàn bộ đồ thị khi khởi động,
+# "tiled" chỉ nạp các ô (tile) trong hành lang quanh điểm đầu/cuối khi cần
+ROUTING_MODE = os.getenv("ROUTING_MODE", "full")
+# Kích thước ô lưới theo độ (WGS84), ~1.1km ở Hà Nội; phải khớp với lúc nạp dữ liệu (save_graph.py)
+TILE_SIZE_DEG = float(os.getenv("TILE_SIZE_DEG", "0.01"))
+# Giới hạn bộ nhớ của cache tile, tính theo tổng số cạnh đang giữ
+TILE_CACHE_MAX_EDGES = int(os.getenv("TILE_CACHE_MAX_EDGES", "300000"))
+# Độ rộng hành lang ban đầu / tối đa (số ô tính từ đoạn thẳng nối hai điểm)
+CORRIDOR_MARGIN_TILES = int(os.getenv("CORRIDOR_MARGIN_TILES", "1"))
+CORRIDOR_MAX_MARGIN_TILES = int(os.getenv("CORRIDOR_MAX_MARGIN_TILES", "8"))
+
+# Connection pool dùng chung cho toàn bộ app (xem src/app/core/database.py).
+# Mặc định đủ cho các worker tìm đường cộng với threadpool của các endpoint đồng bộ.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(ROUTING_WORKERS + 4)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "5"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+# Giới hạn thời gian của một câu lệnh SQL phía server (0 = không giới hạn)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# Nạp lại đồ thị không cần khởi động lại API (xem src/services/graph_store.py).
+# File được ingest_pipeline chạm vào sau khi thay bảng; API theo dõi mtime để tự nạp lại.
+GRAPH_RELOAD_TRIGGER_FILE = os.getenv("GRAPH_RELOAD_TRIGGER_FILE", "")
+GRAPH_RELOAD_POLL_SECONDS = float(os.getenv("GRAPH_RELOAD_POLL_SECONDS", "5"))
+# Token cho các endpoint quản trị (header X-Admin-Token); để trống thì không kiểm tra
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Nguồn dữ liệu đồ thị khi khởi động: "postgis" hoặc "arrow" (file do columnar_export ghi,
+# nạp bằng memory map từ GRAPH_EXPORT_DIR, không cần truy cập database)
+GRAPH_SOURCE = os.getenv("GRAPH_SOURCE", "postgis")
+GRAPH_EXPORT_DIR = os.getenv("GRAPH_EXPORT_DIR", "cache/graph")
+
+# Các vùng (quận / thành phố) phục vụ thêm ngoài đồ thị mặc định, xem src/services/region_registry.py:
+# file JSON [{"name": ..., "bbox": [min_lon, min_lat, max_lon, max_lat], "source": "postgis" |
+# "arrow:<thư mục>" | "graphml:<file>"}]. Vùng được nạp khi có request đầu tiên rơi vào bbox của nó
+# và bị đẩy ra theo LRU khi tổng bộ nhớ ước lượng vượt REGION_MEMORY_BUDGET_BYTES.
+REGIONS_FILE = os.getenv("REGIONS_FILE", "")
+REGION_MEMORY_BUDGET_BYTES = int(os.getenv("REGION_MEMORY_BUDGET_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Bảng hệ số theo giờ (tắc đường, ngập) tính trước bằng `python -m src.services.time_profiles`
+TIME_PROFILES_FILE = os.getenv("TIME_PROFILES_FILE", os.path.join(GRAPH_EXPORT_DIR, "time_profiles.npz"))
+
+# Tốc độ giao thông trực tiếp (xem src/services/live_traffic.py): "file:/path", "tcp://host:port"
+# hoặc để trống để tắt. Quan sát quá TTL hết hạn, cạnh quay về thời gian đi cơ sở.
+LIVE_TRAFFIC_SOURCE = os.getenv("LIVE_TRAFFIC_SOURCE", "")
+LIVE_TRAFFIC_TTL_SECONDS = float(os.getenv("LIVE_TRAFFIC_TTL_SECONDS", "600"))
+LIVE_TRAFFIC_BATCH_SIZE = int(os.getenv("LIVE_TRAFFIC_BATCH_SIZE", "20000"))
+LIVE_TRAFFIC_FLUSH_SECONDS = float(os.getenv("LIVE_TRAFFIC_FLUSH_SECONDS", "1"))
+# Hệ số tốc độ được làm tròn theo bậc (0.1 = mỗi bậc 10%) và weight version tăng nhiều nhất một lần mỗi
+# LIVE_TRAFFIC_PUBLISH_SECONDS, nên nhiễu nhỏ của từng lô không làm mất cache tuyến đường
+LIVE_TRAFFIC_FACTOR_STEP = float(os.getenv("LIVE_TRAFFIC_FACTOR_STEP", "0.1"))
+LIVE_TRAFFIC_PUBLISH_SECONDS = float(os.getenv("LIVE_TRAFFIC_PUBLISH_SECONDS", "5"))
+# Số tuyến đường giữ trong cache (khóa theo phiên bản đồ thị, weight version và request); 0 = tắt
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "256"))
+# Số phiên session_id của /find-standard-route giữ cây đường đi để sửa tăng dần; phiên của đăng ký
+# theo dõi tuyến được cộng thêm SUBSCRIPTION_MAX. Tổng bộ nhớ (g / rhs / chi phí cạnh) của các phiên
+# không quá ROUTE_SESSION_MAX_BYTES, vượt thì bỏ phiên lâu không dùng nhất
+ROUTE_SESSION_MAX = int(os.getenv("ROUTE_SESSION_MAX", "256"))
+ROUTE_SESSION_MAX_BYTES = int(os.getenv("ROUTE_SESSION_MAX_BYTES", str(512 * 1024 * 1024)))
+# Đổi quá tỉ lệ này số cạnh tìm kiếm thì tìm lại từ đầu thay vì sửa cây
+ROUTE_REPAIR_MAX_CHANGED_FRACTION = float(os.getenv("ROUTE_REPAIR_MAX_CHANGED_FRACTION", "0.05"))
+
+# Tối ưu hành trình nhiều điểm (/api/v1/routing/trip)
+TRIP_MAX_STOPS = int(os.getenv("TRIP_MAX_STOPS", "50"))
+# Thời gian tối đa cho bước cải thiện thứ tự (2-opt / Or-opt)
+TRIP_TIME_BUDGET_SECONDS = float(os.getenv("TRIP_TIME_BUDGET_SECONDS", "0.5"))
+
+# Khớp vết GPS (src/services/map_matching.py, /api/v1/routing/match)
+MATCH_MAX_POINTS = int(os.getenv("MATCH_MAX_POINTS", "5000"))
+# Bán kính tìm cạnh ứng viên quanh mỗi điểm GPS và số ứng viên tối đa mỗi điểm
+MATCH_SEARCH_RADIUS_METERS = float(os.getenv("MATCH_SEARCH_RADIUS_METERS", "50"))
+MATCH_MAX_CANDIDATES = int(os.getenv("MATCH_MAX_CANDIDATES", "8"))
+# Độ lệch chuẩn sai số GPS và thang đo xác suất chuyển (|quãng đường - đường chim bay|)
+MATCH_GPS_SIGMA_METERS = float(os.getenv("MATCH_GPS_SIGMA_METERS", "10"))
+MATCH_BETA_METERS = float(os.getenv("MATCH_BETA_METERS", "30"))
+# Quãng đường giữa hai điểm liên tiếp được dài hơn đường chim bay tối đa bấy nhiêu mét
+MATCH_MAX_DETOUR_METERS = float(os.getenv("MATCH_MAX_DETOUR_METERS", "500"))
+MATCH_MAX_SPEED_KPH = float(os.getenv("MATCH_MAX_SPEED_KPH", "150"))
+# Số cặp node giữ trong cache quãng đường chuyển tiếp (mỗi phiên bản đồ thị, mỗi hồ sơ)
+MATCH_TRANSITION_CACHE_SIZE = int(os.getenv("MATCH_TRANSITION_CACHE_SIZE", "100000"))
+
+# Vector tile (/tiles/{z}/{x}/{y}.mvt): dưới MIN_ZOOM trả ô rỗng, dưới DETAIL_ZOOM chỉ có đường chính
+VECTOR_TILE_MIN_ZOOM = int(os.getenv("VECTOR_TILE_MIN_ZOOM", "12"))
+VECTOR_TILE_DETAIL_ZOOM = int(os.getenv("VECTOR_TILE_DETAIL_ZOOM", "14"))
+VECTOR_TILE_MAX_ZOOM = int(os.getenv("VECTOR_TILE_MAX_ZOOM", "20"))
+VECTOR_TILE_CACHE_MAX_BYTES = int(os.getenv("VECTOR_TILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Theo dõi tuyến đường qua Server-Sent Events (/api/v1/routing/subscriptions)
+SUBSCRIPTION_MAX = int(os.getenv("SUBSCRIPTION_MAX", "1000"))
+# Đăng ký không có kết nối SSE nào trong khoảng này thì bị xóa
+SUBSCRIPTION_IDLE_SECONDS = float(os.getenv("SUBSCRIPTION_IDLE_SECONDS", "120"))
+SUBSCRIPTION_KEEPALIVE_SECONDS = float(os.getenv("SUBSCRIPTION_KEEPALIVE_SECONDS", "15"))
+# Chỉ đẩy tuyến mới khi đường đi đổi hoặc thời gian đi lệch ít nhất bấy nhiêu giây
+SUBSCRIPTION_MIN_DURATION_CHANGE_SECONDS = float(os.getenv("SUBSCRIPTION_MIN_DURATION_CHANGE_SECONDS", "30"))
+
+# Nhật ký request (JSONL gọn) để làm nóng cache khi khởi động / nạp lại đồ thị và làm tải benchmark,
+# xem src/services/request_log.py; để trống để tắt. File quá REQUEST_LOG_MAX_BYTES được đổi thành .1
+REQUEST_LOG_FILE = os.getenv("REQUEST_LOG_FILE", "cache/request_log.jsonl")
+REQUEST_LOG_MAX_BYTES = int(os.getenv("REQUEST_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+# Số request phổ biến nhất được chạy lại khi khởi động / sau mỗi lần nạp lại đồ thị; 0 = tắt
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "200"))
+# Nominatim giới hạn 1 request/giây: khoảng nghỉ giữa các lần geocode khi làm nóng
+WARMUP_GEOCODE_INTERVAL_SECONDS = float(os.getenv("WARMUP_GEOCODE_INTERVAL_SECONDS", "1"))
+# Cache kết quả geocoding (địa chỉ -> tọa độ, tọa độ -> địa chỉ)
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+GEOCODE_CACHE_TTL_SECONDS = float(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Tiền xử lý vùng ngập / vùng cấm gửi kèm request (src/services/weight_service.py).
+# Request có tổng số đỉnh các vùng quá ZONE_MAX_VERTICES, hoặc thân request (kèm vùng) quá
+# ZONE_MAX_PAYLOAD_BYTES, bị từ chối với 413
+ZONE_MAX_VERTICES = int(os.getenv("ZONE_MAX_VERTICES", "20000"))
+ZONE_MAX_PAYLOAD_BYTES = int(os.getenv("ZONE_MAX_PAYLOAD_BYTES", str(2 * 1024 * 1024)))
+# Vùng nhiều hơn ZONE_SIMPLIFY_MIN_VERTICES đỉnh được đơn giản hóa với dung sai
+# ZONE_SIMPLIFY_RATIO x độ dài trung vị của một đoạn đường
+ZONE_SIMPLIFY_MIN_VERTICES = int(os.getenv("ZONE_SIMPLIFY_MIN_VERTICES", "200"))
+ZONE_SIMPLIFY_RATIO = float(os.getenv("ZONE_SIMPLIFY_RATIO", "0.1"))
+# Số vùng đã chuẩn hóa (và số tập cạnh của mỗi phiên bản đồ thị) giữ trong cache
+ZONE_CACHE_SIZE = int(os.getenv("ZONE_CACHE_SIZE", "1024"))
@@ -0,0 +1,102 @@
+# src/app/core/database.py
+"""
+Kết nối PostGIS dùng chung.
+
+- `engine`: engine đồng bộ (psycopg2) duy nhất của ứng dụng, pool có giới hạn,
+  pre-ping và statement_timeout phía server.
+- `get_async_engine()`: engine bất đồng bộ (asyncpg) cho các endpoint async, tạo khi cần.
+- Số kết nối đang mượn và thời gian truy vấn được ghi vào src.app.core.metrics.
+"""
+import time
+
+from sqlalchemy import create_engine, event
+
+from src.app.core import metrics
+from src.app.core.config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_POOL_RECYCLE_SECONDS,
+    DB_STATEMENT_TIMEOUT_MS,
+)
+
+_POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=True,
+)
+
+
+def _instrument(sync_engine, name: str):
+    """Gắn các event đo độ bão hòa pool và độ trễ truy vấn cho một engine."""
+    pool = sync_engine.pool
+    capacity = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    metrics.set_gauge("db_pool_capacity", capacity, engine=name)
+
+    def _publish_pool(*_):
+        checked_out = pool.checkedout()
+        metrics.set_gauge("db_pool_checked_out", checked_out, engine=name)
+        metrics.set_gauge("db_pool_saturation", checked_out / capacity if capacity else 0.0, engine=name)
+
+    event.listen(pool, "checkout", _publish_pool)
+    event.listen(pool, "checkin", _publish_pool)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        metrics.observe("db_query_seconds", time.perf_counter() - started, engine=name)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+        metrics.inc("db_query_errors", engine=name)
+
+
+def create_db_engine(url: str = DATABASE_URL, statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS):
+    """Tạo engine đồng bộ với cấu hình pool chuẩn của dự án."""
+    connect_args = {}
+    if statement_timeout_ms:
+        connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+    sync_engine = create_engine(url, connect_args=connect_args, **_POOL_OPTIONS)
+    _instrument(sync_engine, "sync")
+    return sync_engine
+
+
+engine = create_db_engine()
+
+_async_engine = None
+
+
+def _async_url(url: str) -> str:
+    _, rest = url.split("://", 1)
+    return "postgresql+asyncpg://" + rest
+
+
+def get_async_engine():
+    """Engine asyncpg dùng chung, khởi tạo ở lần gọi đầu tiên."""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        connect_args = {}
+        if DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        _async_engine = create_async_engine(_async_url(DATABASE_URL), connect_args=connect_args, **_POOL_OPTIONS)
+        _instrument(_async_engine.sync_engine, "async")
+    return _async_engine
+
+
+async def dispose_engines():
+    """Đóng các pool khi tắt ứng dụng."""
+    engine.dispose()
+    if _async_engine is not None:
+        await _async_engine.dispose()
@@ -0,0 +1,42 @@
+# src/app/core/lazy_imports.py
+"""
+Import các thư viện nặng (osmnx, geopandas, sklearn, geopy, joblib) khi code cần tới,
+thay vì ngay lúc khởi động API.
+
+Thời gian import lần đầu của mỗi module được ghi vào metrics (import_seconds) để
+biết khởi động chậm vì đâu.
+"""
+import importlib
+import sys
+import threading
+import time
+
+from src.app.core import metrics
+
+_import_times = {}
+_lock = threading.Lock()
+
+
+def load(name: str):
+    """Trả về module `name`, import (và đo thời gian) ở lần gọi đầu tiên."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    # import của Python đã có lock riêng; lock này chỉ để thời gian đo không bị cộng dồn
+    # khi nhiều thread cùng chờ một module
+    with _lock:
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        elapsed = time.perf_counter() - started
+    _import_times[name] = elapsed
+    metrics.set_gauge("import_seconds", elapsed, module=name)
+    print(f"-> import {name}: {elapsed:.2f}s")
+    return module
+
+
+def import_times() -> dict:
+    """Thời gian import (giây) của các module đã nạp qua load()."""
+    return dict(_import_times)
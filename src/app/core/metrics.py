@@ -0,0 +1,75 @@
+# src/app/core/metrics.py
+"""
+Bộ đếm và đo lường đơn giản trong tiến trình.
+Xuất ra định dạng text của Prometheus qua endpoint /metrics.
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_summaries = {}  # key -> [count, sum, max]
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    """Tăng một counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Đặt giá trị tức thời cho một gauge."""
+    with _lock:
+        _gauges[_key(name, labels)] = float(value)
+
+
+def observe(name: str, value: float, **labels):
+    """Ghi nhận một giá trị đo (thời gian, kích thước...) vào summary."""
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.setdefault(key, [0, 0.0, 0.0])
+        summary[0] += 1
+        summary[1] += value
+        summary[2] = max(summary[2], value)
+
+
+def snapshot() -> dict:
+    """Trả về toàn bộ số liệu hiện tại dưới dạng dict (dùng cho debug / health)."""
+    def _fmt(key):
+        name, labels = key
+        if not labels:
+            return name
+        return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+    with _lock:
+        data = {_fmt(k): v for k, v in _counters.items()}
+        data.update({_fmt(k): v for k, v in _gauges.items()})
+        for k, (count, total, maximum) in _summaries.items():
+            data[_fmt(k)] = {"count": count, "sum": total, "max": maximum}
+    return data
+
+
+def render_prometheus() -> str:
+    """Xuất số liệu theo định dạng text exposition của Prometheus."""
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+    lines = []
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            lines.append(f"{name}_total{_labels(labels)} {value}")
+        for (name, labels), value in sorted(_gauges.items()):
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), (count, total, maximum) in sorted(_summaries.items()):
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}{_labels(labels, [('quantile', '1')])} {maximum}")
+    return "\n".join(lines) + "\n"
@@ -5,8 +5,11 @@ import time
 import os
 
 
-def create_graph_file():
-    """Tải và lưu đồ thị giao thông 4 phường ở Hà Nội thành file .graphml"""
+def create_graph_file(offline: bool = False):
+    """
+    Tải và lưu đồ thị giao thông 4 phường ở Hà Nội thành file .graphml
+    offline=True: dựng từ các response Overpass đã cache, không truy cập mạng
+    """
     file_path = Path("graph/vinhtuy.graphml")
 
     print(f"📁 Working dir: {os.getcwd()}")
@@ -31,14 +34,25 @@ def create_graph_file():
     ]
 
     graphs = []
-    for i, place in enumerate(places, start=1):
-        print(f"[{i}/{len(places)}] Đang tải: {place.split(',')[0]}...")
-        try:
-            G_part = ox.graph_from_place(place, network_type="all")
+    if offline:
+        from src.database.overpass_cache import build_index, build_ward_graphs, missing_wards
+
+        print("📦 Chế độ offline: dựng từ cache Overpass...")
+        index = build_index()
+        for place, reason in missing_wards(places, index):
+            print(f"   ❌ {place.split(',')[0]}: {reason}")
+        for place, G_part in build_ward_graphs(places, index).items():
             graphs.append(G_part)
-            print(f"   ✅ {len(G_part.nodes)} nodes, {len(G_part.edges)} edges")
-        except Exception as e:
-            print(f"   ❌ Lỗi: {e}")
+            print(f"   ✅ {place.split(',')[0]}: {len(G_part.nodes)} nodes, {len(G_part.edges)} edges")
+    else:
+        for i, place in enumerate(places, start=1):
+            print(f"[{i}/{len(places)}] Đang tải: {place.split(',')[0]}...")
+            try:
+                G_part = ox.graph_from_place(place, network_type="all")
+                graphs.append(G_part)
+                print(f"   ✅ {len(G_part.nodes)} nodes, {len(G_part.edges)} edges")
+            except Exception as e:
+                print(f"   ❌ Lỗi: {e}")
 
     if not graphs:
         print("❌ Không tải được dữ liệu khu vực nào.")
@@ -64,4 +78,5 @@ def create_graph_file():
 
 
 if __name__ == "__main__":
-    create_graph_file()
+    import sys
+    create_graph_file(offline="--offline" in sys.argv)
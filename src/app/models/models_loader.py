@@ -1,6 +1,6 @@
 # src/app/core/load_model.py
-import joblib
 import os
+from src.app.core import lazy_imports
 from src.app.core.config import MODEL_PATH
 
 
@@ -14,7 +14,7 @@ def load_flood_model():
         return None
 
     try:
-        flood_model = joblib.load(MODEL_PATH)
+        flood_model = lazy_imports.load("joblib").load(MODEL_PATH)
         print("AI model loaded successfully.")
         return flood_model
     except Exception as e:
@@ -1,5 +1,6 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 
 class Point(BaseModel):
@@ -40,6 +41,77 @@ class RouteRequest(BaseModel):
         default=[],
         description="danh sách các đối tượng geojson đại diện cho vùng cấm (chặn hoàn toàn)"
     )
+    profile: str = Field(
+        default="car",
+        description="hồ sơ phương tiện: car, motorbike hoặc foot"
+    )
+    departure_time: Optional[datetime] = Field(
+        default=None,
+        description="thời điểm xuất phát (không có múi giờ = giờ Hà Nội); có thì trọng số phụ thuộc giờ (tắc đường, ngập)"
+    )
+
+
+    
+
+class TripRequest(BaseModel):
+    """
+    định nghĩa yêu cầu tối ưu hành trình ghé nhiều điểm (điểm đầu tiên là điểm xuất phát)
+    """
+    stops: List[Point] = Field(
+        ...,
+        min_length=2,
+        description="danh sách các điểm cần ghé; điểm đầu tiên là điểm xuất phát"
+    )
+    round_trip: bool = Field(
+        default=False,
+        description="quay về điểm xuất phát sau điểm cuối cùng"
+    )
+    keep_last: bool = Field(
+        default=False,
+        description="giữ điểm cuối cùng trong danh sách làm điểm kết thúc"
+    )
+    blocking_geometries: List[Dict[str, Any]] = Field(
+        default=[],
+        description="danh sách các đối tượng geojson đại diện cho vùng cấm (legacy support)"
+    )
+    flood_areas: List[Dict[str, Any]] = Field(
+        default=[],
+        description="danh sách các đối tượng geojson đại diện cho vùng ngập (tăng gấp đôi trọng số)"
+    )
+    ban_areas: List[Dict[str, Any]] = Field(
+        default=[],
+        description="danh sách các đối tượng geojson đại diện cho vùng cấm (chặn hoàn toàn)"
+    )
+    profile: str = Field(
+        default="car",
+        description="hồ sơ phương tiện: car, motorbike hoặc foot"
+    )
 
 
-    
\ No newline at end of file
+class TracePoint(Point):
+    """
+    định nghĩa một điểm của vết GPS
+    """
+    timestamp: Optional[datetime] = Field(
+        default=None,
+        description="thời điểm ghi nhận (không có múi giờ = giờ Hà Nội); có thì loại các chuyển tiếp quá nhanh"
+    )
+
+
+class MatchRequest(BaseModel):
+    """
+    định nghĩa yêu cầu khớp một vết GPS vào các cạnh của đồ thị
+    """
+    points: List[TracePoint] = Field(
+        ...,
+        min_length=1,
+        description="các điểm của vết theo thứ tự thời gian"
+    )
+    profile: str = Field(
+        default="car",
+        description="hồ sơ phương tiện: car, motorbike hoặc foot"
+    )
+    include_geometry: bool = Field(
+        default=True,
+        description="trả kèm geometry (GeoJSON) của từng đoạn đã khớp"
+    )
@@ -0,0 +1,242 @@
+# src/database/columnar_export.py
+"""
+Xuất nodes/edges ra file cột (Arrow IPC hoặc GeoParquet, geometry dạng WKB) và nạp lại
+trực tiếp thành CompactGraph, để replica khởi động từ volume dùng chung mà không cần PostGIS.
+
+File Arrow IPC được ghi không nén, một record batch, node sắp theo osmid và cạnh sắp theo
+node đầu (thứ tự CSR), kèm cột chỉ số u_idx / v_idx. Nhờ vậy khi nạp bằng memory map,
+các mảng topology và thuộc tính số là view trỏ thẳng vào file (zero-copy); chỉ geometry
+phải giải mã WKB thành buffer tọa độ.
+
+    python -m src.database.columnar_export                      # từ PostGIS -> GRAPH_EXPORT_DIR (arrow)
+    python -m src.database.columnar_export --format parquet --out /data/graph
+    python -m src.database.columnar_export --graphml src/app/models/graph/vinhtuy.graphml
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import shapely
+
+from src.app.core.config import GRAPH_EXPORT_DIR
+
+NODE_FILE_COLUMNS = ("osmid", "x", "y", "street_count", "tile_x", "tile_y")
+EDGE_FILE_COLUMNS = ("u", "v", "key", "u_idx", "v_idx", "length", "travel_time", "speed_kph",
+                     "highway", "name", "access", "maxspeed", "oneway", "tile_x", "tile_y")
+# Cột chuỗi được ghi dạng dictionary của Arrow (khớp với mã hóa từ điển của CompactGraph)
+_DICTIONARY_COLUMNS = ("highway", "name", "access", "maxspeed")
+
+_EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet"}
+# Kiểu lưu trong file trùng với kiểu mảng của CompactGraph để khi nạp không phải ép kiểu (zero-copy)
+_COLUMN_TYPES = {
+    "osmid": "int64", "u": "int64", "v": "int64", "key": "int32", "u_idx": "int32", "v_idx": "int32",
+    "x": "float64", "y": "float64", "length": "float32", "travel_time": "float32", "speed_kph": "float32",
+    "street_count": "int32", "tile_x": "int32", "tile_y": "int32",
+}
+
+
+def _file(directory, table: str, fmt: str) -> Path:
+    return Path(directory) / f"{table}{_EXTENSIONS[fmt]}"
+
+
+def _prepare(nodes, edges) -> tuple:
+    """Chọn cột định tuyến, sắp node theo osmid và cạnh theo thứ tự CSR."""
+    nodes = nodes.reset_index() if "osmid" not in nodes.columns else nodes
+    edges = edges.reset_index() if "u" not in edges.columns else edges
+    nodes = nodes.sort_values("osmid", kind="stable").reset_index(drop=True)
+    if "x" not in nodes.columns:
+        nodes["x"] = nodes.geometry.x
+        nodes["y"] = nodes.geometry.y
+
+    node_osmid = nodes["osmid"].to_numpy(dtype=np.int64)
+    edges = edges.copy()
+    edges["u_idx"] = np.searchsorted(node_osmid, edges["u"].to_numpy(dtype=np.int64)).astype(np.int32)
+    edges["v_idx"] = np.searchsorted(node_osmid, edges["v"].to_numpy(dtype=np.int64)).astype(np.int32)
+    edges = edges.sort_values("u_idx", kind="stable").reset_index(drop=True)
+    for column in _DICTIONARY_COLUMNS:
+        if column in edges.columns:
+            # list (vd. highway = ['residential', 'service']) lưu dạng chuỗi như trong PostGIS
+            edges[column] = edges[column].map(lambda v: str(v) if isinstance(v, list) else v)
+
+    nodes = nodes[[c for c in NODE_FILE_COLUMNS if c in nodes.columns] + ["geometry"]]
+    edges = edges[[c for c in EDGE_FILE_COLUMNS if c in edges.columns] + ["geometry"]]
+    for gdf in (nodes, edges):
+        for column, dtype in _COLUMN_TYPES.items():
+            if column in gdf.columns and not gdf[column].isna().any():
+                gdf[column] = gdf[column].astype(dtype)
+    return nodes, edges
+
+
+def _to_arrow(gdf):
+    import pyarrow as pa
+
+    columns, fields = [], []
+    for name in gdf.columns:
+        if name == "geometry":
+            continue
+        array = pa.array(gdf[name], from_pandas=True)
+        if name in _DICTIONARY_COLUMNS:
+            array = array.cast(pa.string()).dictionary_encode()
+        columns.append(array)
+        fields.append(pa.field(name, array.type))
+
+    crs = gdf.crs.to_json_dict() if gdf.crs is not None else None
+    columns.append(pa.array(shapely.to_wkb(gdf.geometry.values), type=pa.binary()))
+    fields.append(pa.field("geometry", pa.binary(), metadata={"ARROW:extension:name": "geoarrow.wkb"}))
+    # metadata "geo" theo GeoParquet để các công cụ khác đọc được geometry
+    geo = {"version": "1.0.0", "primary_column": "geometry",
+           "columns": {"geometry": {"encoding": "WKB", "crs": crs}}}
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields, metadata={"geo": json.dumps(geo)}))
+
+
+def write_tables(nodes, edges, out_dir=GRAPH_EXPORT_DIR, fmt: str = "arrow") -> list:
+    """Ghi nodes/edges (GeoDataFrame WGS84) ra out_dir; trả về danh sách file đã ghi."""
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    nodes, edges = _prepare(nodes, edges)
+
+    written = []
+    for table, gdf in (("nodes", nodes), ("edges", edges)):
+        path = _file(out_dir, table, fmt)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        if fmt == "parquet":
+            gdf.to_parquet(tmp, index=False)
+        else:
+            arrow_table = _to_arrow(gdf)
+            with pa.OSFile(str(tmp), "wb") as sink:
+                with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                    writer.write_table(arrow_table, max_chunksize=max(len(gdf), 1))
+        # đổi tên nguyên tử để replica đang đọc không thấy file ghi dở
+        tmp.replace(path)
+        written.append(path)
+        print(f"[export] {len(gdf)} dòng -> {path}")
+    return written
+
+
+# ======================================================================
+# Nạp lại thành CompactGraph
+# ======================================================================
+
+def _read_table(directory, table: str, fmt: str):
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+
+    path = _file(directory, table, fmt)
+    if fmt == "parquet":
+        return pq.read_table(path)
+    # memory map: dữ liệu chỉ được đọc từ đĩa khi chạm tới, các process dùng chung page cache
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+
+def _column(table, name: str, dtype, fill=np.nan) -> np.ndarray:
+    """Cột dưới dạng mảng NumPy: view zero-copy khi đúng kiểu và không có null, ngược lại sao chép."""
+    import pyarrow.compute as pc
+
+    if name not in table.column_names:
+        return np.full(table.num_rows, fill, dtype=dtype)
+    array = table.column(name).combine_chunks()
+    if array.null_count:
+        array = pc.fill_null(array, fill)
+    values = array.to_numpy(zero_copy_only=False)
+    return values if values.dtype == dtype else values.astype(dtype)
+
+
+def _dictionary(table, name: str) -> tuple:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if name not in table.column_names:
+        return np.full(table.num_rows, -1, dtype=np.int16), []
+    array = table.column(name).combine_chunks()
+    if not pa.types.is_dictionary(array.type):
+        array = array.dictionary_encode()
+    indices = array.indices
+    if indices.null_count:
+        indices = pc.fill_null(indices, -1)
+    return indices.to_numpy(zero_copy_only=False), array.dictionary.to_pylist()
+
+
+def read_compact_graph(directory=GRAPH_EXPORT_DIR, fmt: str = None):
+    """Nạp file do write_tables ghi thành CompactGraph (định dạng tự nhận theo phần mở rộng)."""
+    from src.services.compact_graph import CompactGraph, STRING_ATTRS
+
+    fmt = fmt or ("arrow" if _file(directory, "edges", "arrow").exists() else "parquet")
+    started = time.perf_counter()
+    nodes = _read_table(directory, "nodes", fmt)
+    edges = _read_table(directory, "edges", fmt)
+
+    node_osmid = _column(nodes, "osmid", np.int64, 0)
+    edge_source = _column(edges, "u_idx", np.int32, 0)
+    indptr = np.zeros(len(node_osmid) + 1, dtype=np.int32)
+    np.cumsum(np.bincount(edge_source, minlength=len(node_osmid)), out=indptr[1:])
+
+    geometries = shapely.from_wkb(edges.column("geometry").combine_chunks().to_numpy(zero_copy_only=False))
+    geom_offsets = np.zeros(len(geometries) + 1, dtype=np.int64)
+    np.cumsum(shapely.get_num_coordinates(geometries), out=geom_offsets[1:])
+
+    compact = CompactGraph(
+        node_osmid=node_osmid,
+        node_x=_column(nodes, "x", np.float64),
+        node_y=_column(nodes, "y", np.float64),
+        indptr=indptr,
+        edge_source=edge_source,
+        edge_target=_column(edges, "v_idx", np.int32, 0),
+        edge_key=_column(edges, "key", np.int32, 0),
+        length=_column(edges, "length", np.float32, 0.0),
+        travel_time=_column(edges, "travel_time", np.float32),
+        speed_kph=_column(edges, "speed_kph", np.float32),
+        oneway=_column(edges, "oneway", np.bool_, False),
+        strings={name: _dictionary(edges, name) for name in STRING_ATTRS},
+        geom_offsets=geom_offsets,
+        geom_coords=shapely.get_coordinates(geometries),
+        crs="EPSG:4326",
+    )
+    print(f"[columnar] nạp {compact.num_nodes} node, {compact.num_edges} cạnh từ {directory} "
+          f"({time.perf_counter() - started:.2f}s)", file=sys.stderr)
+    return compact
+
+
+# ======================================================================
+# Lệnh độc lập
+# ======================================================================
+
+def _tables_from_db() -> tuple:
+    from src.app.core.database import engine
+    from src.database.load_database import read_geo_table, NODE_COLUMNS, EDGE_COLUMNS
+
+    with engine.connect() as conn:
+        nodes = read_geo_table(conn, "nodes", NODE_COLUMNS + ("tile_x", "tile_y"))
+        edges = read_geo_table(conn, "edges", EDGE_COLUMNS + ("tile_x", "tile_y"))
+    return nodes.to_crs(epsg=4326), edges.to_crs(epsg=4326)
+
+
+def _tables_from_graphml(path: str) -> tuple:
+    import osmnx as ox
+
+    G = ox.project_graph(ox.load_graphml(path), to_crs="EPSG:4326")
+    if not all("travel_time" in d for _, _, d in G.edges(data=True)):
+        G = ox.add_edge_travel_times(ox.add_edge_speeds(G, fallback=30))
+    nodes, edges = ox.graph_to_gdfs(G)
+    return nodes, edges
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất nodes/edges ra Arrow IPC hoặc GeoParquet")
+    parser.add_argument("--out", default=GRAPH_EXPORT_DIR, help="thư mục đích")
+    parser.add_argument("--format", choices=sorted(_EXTENSIONS), default="arrow")
+    parser.add_argument("--graphml", help="xuất từ file graphml thay vì từ PostGIS")
+    args = parser.parse_args(argv)
+
+    nodes, edges = _tables_from_graphml(args.graphml) if args.graphml else _tables_from_db()
+    write_tables(nodes, edges, args.out, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+# src/database/ingest_pipeline.py
+"""
+Pipeline nạp dữ liệu bản đồ vào PostGIS, có thể chạy lại từng phần.
+
+Các bước:
+  1. ward   : tải + parse đồ thị từng phường song song trong process pool,
+              lưu graphml vào INGEST_CACHE_DIR/wards (chỉ làm lại phường bị yêu cầu refresh)
+  2. merge  : project, consolidate_intersections, thêm tốc độ/thời gian cho từng phường (cache theo
+              fingerprint của phường, chỉ làm lại phường đã đổi), rồi gộp các phường; bản gộp
+              được cache theo fingerprint của tất cả phường
+  3. export : chuyển sang GeoDataFrame WGS84, gán ô lưới (tile_x, tile_y)
+  4. load   : COPY hàng loạt vào bảng staging, tạo chỉ mục, rồi đổi tên sang nodes/edges
+              trong một transaction, nên API không bao giờ thấy bảng rỗng
+"""
+import argparse
+import ast
+import hashlib
+import io
+import json
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+from sqlalchemy import text
+
+# Danh sách khu vực cần tải dữ liệu
+WARDS = [
+    "Phường Vĩnh Tuy, Hà Nội, Việt Nam",
+    "Phường Mai Động, Hà Nội, Việt Nam",
+    "Phường Vĩnh Hưng, Hà Nội, Việt Nam",
+    "Phường Thanh Lương, Hà Nội, Việt Nam",
+    "Phường Tương Mai, Hà Nội, Việt Nam",
+    "Phường Bạch Mai, Hà Nội, Việt Nam",
+    "Phường Hai Bà Trưng, Hà Nội, Việt Nam",
+    "Phường Hoàng Mai, Hà Nội, Việt Nam",
+    "Phường Lĩnh Nam, Hà Nội, Việt Nam"
+]
+
+NETWORK_TYPE = "all"
+CONSOLIDATE_TOLERANCE = 15
+INGEST_CACHE_DIR = Path(os.getenv("INGEST_CACHE_DIR", "cache/ingest"))
+TILE_SIZE_DEG = float(os.getenv("TILE_SIZE_DEG", "0.01"))
+GRAPH_EXPORT_DIR = os.getenv("GRAPH_EXPORT_DIR", "cache/graph")
+
+# Schema của bảng; cột không có trong dữ liệu được ghi NULL
+NODE_SCHEMA = {
+    "osmid": "bigint",
+    "y": "double precision",
+    "x": "double precision",
+    "street_count": "integer",
+    "tile_x": "integer",
+    "tile_y": "integer",
+}
+EDGE_SCHEMA = {
+    "u": "bigint",
+    "v": "bigint",
+    "key": "integer",
+    "osmid": "text",
+    "highway": "text",
+    "name": "text",
+    "ref": "text",
+    "oneway": "boolean",
+    "reversed": "text",
+    "lanes": "text",
+    "maxspeed": "text",
+    "service": "text",
+    "access": "text",
+    "bridge": "text",
+    "tunnel": "text",
+    "junction": "text",
+    "width": "text",
+    "length": "double precision",
+    "speed_kph": "double precision",
+    "travel_time": "double precision",
+    "tile_x": "integer",
+    "tile_y": "integer",
+}
+_INT_TYPES = ("bigint", "integer")
+
+# Chỉ mục tạo trên bảng staging, được đổi về tên chuẩn khi swap
+_INDEXES = {
+    "nodes": [
+        ("idx_nodes_geometry", "USING GIST (geometry)"),
+        ("idx_nodes_osmid", "(osmid)"),
+        ("idx_nodes_tile", "(tile_x, tile_y)"),
+    ],
+    "edges": [
+        ("idx_edges_geometry", "USING GIST (geometry)"),
+        ("idx_edges_uvk", "(u, v, key)"),
+        ("idx_edges_tile", "(tile_x, tile_y)"),
+    ],
+}
+_UNIQUE_INDEXES = {"idx_nodes_osmid", "idx_edges_uvk"}
+
+
+# ======================================================================
+# Bước 1: tải từng phường
+# ======================================================================
+
+def _slug(place: str) -> str:
+    name = place.split(",")[0].replace("Đ", "D").replace("đ", "d")
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", ascii_name.lower()).strip("-")
+
+
+def _ward_path(place: str) -> Path:
+    return INGEST_CACHE_DIR / "wards" / f"{_slug(place)}-{NETWORK_TYPE}.graphml"
+
+
+def _file_fingerprint(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download_ward(place: str, out_path: str) -> tuple:
+    """Chạy trong process con: tải một phường và lưu graphml. Trả về (place, số nút, số cạnh)."""
+    import osmnx as ox
+
+    G = ox.graph_from_place(place, network_type=NETWORK_TYPE)
+    tmp_path = out_path + ".tmp"
+    ox.save_graphml(G, tmp_path)
+    os.replace(tmp_path, out_path)
+    return place, len(G.nodes), len(G.edges)
+
+
+def _build_wards_offline(places: list, workers: int):
+    """Dựng các phường từ cache Overpass của osmnx thay vì tải qua mạng."""
+    import osmnx as ox
+    from src.database.overpass_cache import build_index, build_ward_graphs, missing_wards
+
+    index = build_index(workers=workers)
+    missing = missing_wards(places, index, NETWORK_TYPE)
+    if missing:
+        details = "\n".join(f"   {place}: {reason}" for place, reason in missing)
+        raise SystemExit(f"[ward] không dựng offline được các phường sau:\n{details}")
+
+    for place, G in build_ward_graphs(places, index, NETWORK_TYPE, workers).items():
+        ox.save_graphml(G, _ward_path(place))
+        print(f"   {place.split(',')[0]} (offline): {len(G.nodes)} nút, {len(G.edges)} cạnh")
+
+
+def fetch_wards(places: list, refresh: set, workers: int, offline: bool = False) -> dict:
+    """
+    Đảm bảo mỗi phường có graphml trong cache, tải song song những phường còn thiếu
+    hoặc nằm trong `refresh`. Trả về {place: fingerprint}.
+    """
+    (INGEST_CACHE_DIR / "wards").mkdir(parents=True, exist_ok=True)
+    todo = [p for p in places if p in refresh or not _ward_path(p).exists()]
+    print(f"[ward] {len(places) - len(todo)} phường dùng cache, {len(todo)} phường cần tải")
+
+    if todo and offline:
+        _build_wards_offline(todo, workers)
+    elif todo:
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+            futures = {pool.submit(_download_ward, p, str(_ward_path(p))): p for p in todo}
+            for future in as_completed(futures):
+                place, n_nodes, n_edges = future.result()
+                print(f"   {place.split(',')[0]}: {n_nodes} nút, {n_edges} cạnh")
+
+    return {p: _file_fingerprint(_ward_path(p)) for p in places}
+
+
+# ======================================================================
+# Bước 2: gộp và xử lý đồ thị
+# ======================================================================
+
+def _fill_missing_geometry(G):
+    from shapely.geometry import LineString
+
+    for u, v, k, data in G.edges(keys=True, data=True):
+        if 'geometry' not in data or data['geometry'] is None:
+            u_node = G.nodes[u]
+            v_node = G.nodes[v]
+            data['geometry'] = LineString([
+                (u_node['x'], u_node['y']),
+                (v_node['x'], v_node['y'])
+            ])
+
+
+def _consolidated_path(place: str, fingerprint: str) -> Path:
+    name = f"{_slug(place)}-{NETWORK_TYPE}-{fingerprint[:16]}-t{CONSOLIDATE_TOLERANCE}.graphml"
+    return INGEST_CACHE_DIR / "consolidated" / name
+
+
+def _original_osmids(value) -> list:
+    """osmid_original của node sau consolidate: một osmid hoặc list (dạng chuỗi khi đọc lại từ graphml)."""
+    if isinstance(value, str):
+        value = ast.literal_eval(value)
+    return [int(v) for v in value] if isinstance(value, (list, tuple)) else [int(value)]
+
+
+def _consolidate_ward(place: str, fingerprint: str) -> str:
+    """
+    Chạy được trong process con: project, consolidate và thêm tốc độ/thời gian cho một phường,
+    lưu graphml đã xử lý. Id cụm của osmnx (0, 1, ...) trùng nhau giữa các phường nên node được
+    đặt lại id là osmid nhỏ nhất trong cụm.
+    """
+    import networkx as nx
+    import osmnx as ox
+
+    path = _consolidated_path(place, fingerprint)
+    G = ox.project_graph(ox.load_graphml(_ward_path(place)))
+    G = ox.consolidate_intersections(G, tolerance=CONSOLIDATE_TOLERANCE)
+    G = nx.relabel_nodes(G, {n: min(_original_osmids(d["osmid_original"])) for n, d in G.nodes(data=True)})
+    G = ox.add_edge_speeds(G, fallback=30)
+    G = ox.add_edge_travel_times(G)
+    _fill_missing_geometry(G)
+
+    # xóa bản cũ của phường này, chỉ giữ bản hiện tại
+    for old in path.parent.glob(f"{_slug(place)}-{NETWORK_TYPE}-*.graphml"):
+        old.unlink()
+    tmp_path = path.with_suffix(".tmp")
+    ox.save_graphml(G, tmp_path)
+    os.replace(tmp_path, path)
+    return str(path)
+
+
+def _join_wards(graphs: list):
+    """
+    Gộp các phường đã consolidate. Node nằm trên ranh giới có mặt ở nhiều phường và có thể thuộc
+    các cụm khác nhau: các node có chung osmid gốc được gộp làm một (id nhỏ nhất).
+    """
+    import networkx as nx
+    import osmnx as ox
+
+    crs = graphs[0].graph["crs"]
+    graphs = [G if G.graph["crs"] == crs else ox.project_graph(G, to_crs=crs) for G in graphs]
+
+    parent = {}
+
+    def find(n):
+        while parent.setdefault(n, n) != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    owner = {}
+    for G in graphs:
+        for n, data in G.nodes(data=True):
+            for osmid in _original_osmids(data.get("osmid_original", n)):
+                if osmid in owner:
+                    a, b = find(owner[osmid]), find(n)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+                else:
+                    owner[osmid] = n
+
+    G = nx.compose_all(graphs)
+    mapping = {n: find(n) for n in parent if find(n) != n}
+    if mapping:
+        # cạnh nối hai node vừa được gộp trở thành vòng lặp: bỏ
+        G.remove_edges_from([
+            (u, v, k) for u, v, k in G.edges(keys=True) if u != v and mapping.get(u, u) == mapping.get(v, v)
+        ])
+        G = nx.relabel_nodes(G, mapping)
+        print(f"[merge] gộp {len(mapping)} node trùng trên ranh giới giữa các phường")
+    return G
+
+
+def merge_wards(fingerprints: dict, workers: int = 1):
+    """
+    Gộp các phường thành đồ thị đã consolidate. Mỗi phường được consolidate riêng và cache theo
+    fingerprint của nó, nên khi một phường đổi chỉ phường đó được xử lý lại trước khi gộp;
+    bản gộp được cache theo fingerprint của tất cả phường.
+    """
+    import osmnx as ox
+
+    key_source = json.dumps(
+        {"wards": sorted(fingerprints.items()), "tolerance": CONSOLIDATE_TOLERANCE}, ensure_ascii=False
+    )
+    merge_key = hashlib.sha1(key_source.encode("utf-8")).hexdigest()[:16]
+    merged_path = INGEST_CACHE_DIR / f"merged-{merge_key}.graphml"
+
+    if merged_path.exists():
+        print(f"[merge] dùng cache {merged_path.name}")
+        return ox.load_graphml(merged_path)
+
+    (INGEST_CACHE_DIR / "consolidated").mkdir(parents=True, exist_ok=True)
+    todo = [p for p, fp in fingerprints.items() if not _consolidated_path(p, fp).exists()]
+    print(f"[merge] {len(fingerprints) - len(todo)} phường dùng cache đã consolidate, {len(todo)} phường cần xử lý")
+    if len(todo) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            for future in as_completed([pool.submit(_consolidate_ward, p, fingerprints[p]) for p in todo]):
+                future.result()
+    else:
+        for place in todo:
+            _consolidate_ward(place, fingerprints[place])
+
+    G = _join_wards([ox.load_graphml(_consolidated_path(p, fp)) for p, fp in fingerprints.items()])
+    print(f"[merge] sau khi gộp: {len(G.nodes)} nút, {len(G.edges)} cạnh")
+
+    # xóa các bản merge cũ, chỉ giữ bản hiện tại
+    for old in INGEST_CACHE_DIR.glob("merged-*.graphml"):
+        old.unlink()
+    tmp_path = merged_path.with_suffix(".tmp")
+    ox.save_graphml(G, tmp_path)
+    os.replace(tmp_path, merged_path)
+    return G
+
+
+# ======================================================================
+# Bước 3: chuyển sang bảng
+# ======================================================================
+
+def graph_to_tables(G) -> tuple:
+    """Chuyển đồ thị sang (nodes, edges) GeoDataFrame ở WGS84 với cột ô lưới."""
+    import osmnx as ox
+
+    nodes, edges = ox.graph_to_gdfs(G)
+    nodes = nodes.to_crs(epsg=4326)
+    edges = edges.to_crs(epsg=4326)
+    nodes['x'] = nodes.geometry.x
+    nodes['y'] = nodes.geometry.y
+    nodes.reset_index(inplace=True)
+    edges.reset_index(inplace=True)
+
+    # Mỗi cạnh thuộc ô của node đầu (u), xem tile_service
+    nodes['tile_x'] = np.floor(nodes['x'] / TILE_SIZE_DEG).astype('int32')
+    nodes['tile_y'] = np.floor(nodes['y'] / TILE_SIZE_DEG).astype('int32')
+    node_tiles = nodes.set_index('osmid')[['tile_x', 'tile_y']]
+    edges['tile_x'] = edges['u'].map(node_tiles['tile_x']).astype('int32')
+    edges['tile_y'] = edges['u'].map(node_tiles['tile_y']).astype('int32')
+    return nodes, edges
+
+
+def _truthy(value) -> bool:
+    return str(value).strip().lower() in ("true", "yes", "1", "-1")
+
+
+def _scalar(value, sql_type: str):
+    """
+    Giá trị list / tuple (cạnh gộp sau simplify / consolidate, vd. highway = ['residential', 'service'],
+    oneway = [False, True]) -> một giá trị đúng kiểu cột để COPY.
+    """
+    if not isinstance(value, (list, tuple, set)):
+        return _truthy(value) if sql_type == "boolean" and isinstance(value, str) else value
+    if sql_type == "text":
+        return str(list(value))  # như cách graphml lưu
+    if sql_type == "boolean":
+        # một đoạn bất kỳ là một chiều thì cả cạnh là một chiều
+        return any(_truthy(v) for v in value)
+    numbers = pd.to_numeric(pd.Series(list(value), dtype=object), errors="coerce").dropna()
+    return numbers.max() if len(numbers) else None
+
+
+def _to_copy_frame(gdf, schema: dict) -> pd.DataFrame:
+    """Chuẩn bị DataFrame đúng thứ tự cột của schema, geometry dạng hex EWKB."""
+    frame = pd.DataFrame(index=gdf.index)
+    for column, sql_type in schema.items():
+        if column not in gdf.columns:
+            frame[column] = None
+            continue
+        values = gdf[column].map(lambda v, t=sql_type: _scalar(v, t))
+        if sql_type in _INT_TYPES:
+            values = pd.to_numeric(values, errors="coerce").round().astype("Int64")
+        elif sql_type == "double precision":
+            values = pd.to_numeric(values, errors="coerce")
+        frame[column] = values
+    geometry = shapely.set_srid(gdf.geometry.values, 4326)
+    frame["geometry"] = shapely.to_wkb(geometry, hex=True, include_srid=True)
+    return frame
+
+
+# ======================================================================
+# Bước 4: nạp vào PostGIS
+# ======================================================================
+
+def _copy_into(raw_conn, table: str, frame: pd.DataFrame):
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ", ".join(frame.columns)
+    with raw_conn.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def load_tables(engine, nodes, edges):
+    """COPY vào bảng staging, tạo chỉ mục, rồi swap sang nodes/edges trong một transaction."""
+    geometry_types = {"nodes": "Point", "edges": "LineString"}
+    frames = {"nodes": _to_copy_frame(nodes, NODE_SCHEMA), "edges": _to_copy_frame(edges, EDGE_SCHEMA)}
+    schemas = {"nodes": NODE_SCHEMA, "edges": EDGE_SCHEMA}
+
+    with engine.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis;"))
+        conn.commit()
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            for table, schema in schemas.items():
+                columns = ", ".join(f"{name} {sql_type}" for name, sql_type in schema.items())
+                cur.execute(f"DROP TABLE IF EXISTS {table}__staging;")
+                cur.execute(
+                    f"CREATE TABLE {table}__staging ({columns}, "
+                    f"geometry geometry({geometry_types[table]}, 4326));"
+                )
+        for table, frame in frames.items():
+            started = time.time()
+            _copy_into(raw_conn, f"{table}__staging", frame)
+            print(f"[load] COPY {len(frame)} dòng vào {table}__staging ({time.time() - started:.1f}s)")
+        with raw_conn.cursor() as cur:
+            for table, indexes in _INDEXES.items():
+                for name, definition in indexes:
+                    unique = "UNIQUE " if name in _UNIQUE_INDEXES else ""
+                    cur.execute(f"CREATE {unique}INDEX {name}__staging ON {table}__staging {definition};")
+                cur.execute(f"ANALYZE {table}__staging;")
+        raw_conn.commit()
+
+        # Swap: DDL trong PostgreSQL có tính giao dịch, người đọc thấy bảng cũ cho tới khi commit
+        with raw_conn.cursor() as cur:
+            for table, indexes in _INDEXES.items():
+                cur.execute(f"DROP TABLE IF EXISTS {table} CASCADE;")
+                cur.execute(f"ALTER TABLE {table}__staging RENAME TO {table};")
+                for name, _ in indexes:
+                    cur.execute(f"ALTER INDEX {name}__staging RENAME TO {name};")
+        raw_conn.commit()
+        print("[load] đã thay bảng nodes/edges")
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+
+
+def _touch_reload_trigger():
+    """Báo cho API (nếu đang theo dõi GRAPH_RELOAD_TRIGGER_FILE) nạp lại đồ thị mới."""
+    from src.app.core.config import GRAPH_RELOAD_TRIGGER_FILE
+
+    if GRAPH_RELOAD_TRIGGER_FILE:
+        path = Path(GRAPH_RELOAD_TRIGGER_FILE)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(str(time.time()))
+        print(f"[load] đã báo API nạp lại đồ thị ({path})")
+
+
+def run_pipeline(places: list = None, refresh: set = (), workers: int = 4, skip_load: bool = False,
+                 offline: bool = False, export_dir: str | None = GRAPH_EXPORT_DIR, export_format: str = "arrow"):
+    from src.app.core.database import create_db_engine
+    from src.database.columnar_export import write_tables
+
+    places = places or WARDS
+    started = time.time()
+
+    fingerprints = fetch_wards(places, set(refresh), workers, offline)
+    G = merge_wards(fingerprints, workers)
+    nodes, edges = graph_to_tables(G)
+    print(f"[export] {len(nodes)} nút, {len(edges)} cạnh, {len(nodes[['tile_x', 'tile_y']].drop_duplicates())} ô lưới")
+
+    if export_dir:
+        # file cột cho các replica khởi động với GRAPH_SOURCE=arrow
+        write_tables(nodes, edges, export_dir, export_format)
+
+    if not skip_load:
+        # không giới hạn statement_timeout vì COPY và tạo chỉ mục có thể chạy lâu
+        engine = create_db_engine(statement_timeout_ms=0)
+        load_tables(engine, nodes, edges)
+        _touch_reload_trigger()
+
+    print(f"Hoàn tất sau {time.time() - started:.1f} giây")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nạp dữ liệu bản đồ vào PostGIS")
+    parser.add_argument("--refresh", action="append", default=[],
+                        help="tên phường cần tải lại (có thể lặp lại), vd. 'Phường Vĩnh Tuy, Hà Nội, Việt Nam'")
+    parser.add_argument("--refresh-all", action="store_true", help="tải lại tất cả các phường")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "4")))
+    parser.add_argument("--skip-load", action="store_true", help="chỉ dựng cache, không ghi vào database")
+    parser.add_argument("--offline", action="store_true",
+                        help="dựng các phường từ cache Overpass (cache/*.json), không truy cập mạng")
+    parser.add_argument("--export-dir", default=GRAPH_EXPORT_DIR,
+                        help="thư mục ghi file Arrow/GeoParquet của nodes/edges (xem columnar_export)")
+    parser.add_argument("--export-format", choices=["arrow", "parquet"], default="arrow")
+    parser.add_argument("--no-export", action="store_true", help="không ghi file cột")
+    args = parser.parse_args(argv)
+
+    refresh = set(WARDS) if args.refresh_all else set(args.refresh)
+    unknown = refresh - set(WARDS)
+    if unknown:
+        parser.error(f"không có trong danh sách phường: {', '.join(sorted(unknown))}")
+
+    print("=" * 70)
+    print("NHẬP DỮ LIỆU BẢN ĐỒ VÀO CƠ SỞ DỮ LIỆU")
+    print("=" * 70)
+    run_pipeline(WARDS, refresh, args.workers, args.skip_load, args.offline,
+                 None if args.no_export else args.export_dir, args.export_format)
+
+
+if __name__ == "__main__":
+    main()
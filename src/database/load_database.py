@@ -1,38 +1,75 @@
-from sqlalchemy import create_engine
-import geopandas as gpd
-import osmnx as ox
-from src.app.core.config import DATABASE_URL
+import sys
 
-engine = create_engine(DATABASE_URL)
+from sqlalchemy import text
+import pandas as pd
+import shapely
+from src.app.core import lazy_imports
+from src.app.core.database import engine
 
 #CRS: hệ quy chiếu, bao gồm geographic CRS: định vị điểm trên bề mặt cong của trái đất, đang sử dụng WGS 84 (ESPG 4326): xác định vị trí dự trên lat/lon
 #project CRS: hệ quy chiếu lên bản đồ phẳng để tính khoảng cách 
 
-def load_graph_from_db():
-    """Tải dữ liệu bản đồ từ PostGIS và tạo đồ thị OSMnx"""
-    print("Đang tải dữ liệu bản đồ từ PostGIS...")
-
-    # Đọc dữ liệu nodes và edges từ PostGIS
-    nodes_gdf = gpd.read_postgis(
-        "SELECT * FROM nodes",
-        engine,
-        index_col='osmid',
-        geom_col='geometry'
-    )
-
-    edges_gdf = gpd.read_postgis(
-        "SELECT * FROM edges",
-        engine,
-        index_col=['u', 'v', 'key'],
-        geom_col='geometry'
-    )
-
-    # Kiểm tra dữ liệu có hợp lệ không
-    if nodes_gdf.empty or edges_gdf.empty:
-        print("Lỗi: bảng nodes hoặc edges trống trong cơ sở dữ liệu.")
-        return None
-
-    # Đặt/chuẩn hóa hệ tọa độ về WGS84 (EPSG:4326)
+# Chỉ lấy các cột mà định tuyến thực sự dùng; cột nào không có trong bảng sẽ được bỏ qua
+NODE_COLUMNS = ("osmid", "street_count")
+EDGE_COLUMNS = ("u", "v", "key", "length", "travel_time", "speed_kph", "highway", "name", "access",
+                "maxspeed", "oneway")
+TILE_COLUMNS = ("tile_x", "tile_y")
+
+_table_meta = {}
+
+
+def _get_table_meta(conn, table: str) -> tuple:
+    """Trả về (tập cột của bảng, SRID của cột geometry); cache theo tên bảng."""
+    if table not in _table_meta:
+        columns = {
+            row[0] for row in conn.execute(
+                text(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = :table"
+                ),
+                {"table": table},
+            )
+        }
+        try:
+            srid = conn.execute(
+                text("SELECT Find_SRID(current_schema()::text, :table, 'geometry')"), {"table": table}
+            ).scalar() or 0
+        except Exception:
+            conn.rollback()
+            srid = 0
+        _table_meta[table] = (columns, srid)
+    return _table_meta[table]
+
+
+def clear_table_meta():
+    """Xóa cache metadata (sau khi bảng được ghi lại)."""
+    _table_meta.clear()
+
+
+def read_geo_table(conn, table: str, columns: tuple, joins: str = "", where: str = "",
+                   params: dict | None = None, index_col=None) -> "geopandas.GeoDataFrame":
+    """
+    Đọc một bảng không gian với đúng các cột cần thiết, geometry được lấy dạng WKB nhị phân
+    và parse hàng loạt bằng shapely (nhanh hơn nhiều so với SELECT * + read_postgis).
+    `joins` / `where` có thể tham chiếu bảng qua alias `g`, tham số theo kiểu %(name)s.
+    """
+    available, srid = _get_table_meta(conn, table)
+    selected = [c for c in columns if c in available]
+    select_list = ", ".join([f"g.{c}" for c in selected] + ["ST_AsBinary(g.geometry) AS geom_wkb"])
+    sql = f"SELECT {select_list} FROM {table} g {joins} {'WHERE ' + where if where else ''}"
+
+    rows = conn.exec_driver_sql(sql, params or {}).fetchall()
+    df = pd.DataFrame.from_records(rows, columns=selected + ["geom_wkb"])
+    geometry = shapely.from_wkb([bytes(b) if b is not None else None for b in df.pop("geom_wkb")])
+    gpd = lazy_imports.load("geopandas")
+    gdf = gpd.GeoDataFrame(df, geometry=geometry, crs=srid or None)
+    if index_col is not None:
+        gdf.set_index(index_col, inplace=True)
+    return gdf
+
+
+def normalize_gdfs_to_wgs84(nodes_gdf, edges_gdf):
+    """Chuẩn hóa hệ tọa độ của nodes/edges về WGS84 (EPSG:4326)"""
     def _looks_projected(gdf) -> bool:
         try:
             xs = gdf.geometry.x
@@ -69,14 +106,46 @@ def load_graph_from_db():
     except Exception:
         pass
 
+    return nodes_gdf, edges_gdf
+
+
+def load_graph_from_export(directory: str = None):
+    """
+    Nạp đồ thị từ file Arrow/GeoParquet do columnar_export ghi, trả về CompactGraph.
+    graph_store dùng nó làm chỉ mục compact_graph và chỉ dựng đồ thị NetworkX khi có đường xử lý cần tới.
+    """
+    from src.app.core.config import GRAPH_EXPORT_DIR
+    from src.database.columnar_export import read_compact_graph
+
+    return read_compact_graph(directory or GRAPH_EXPORT_DIR)
+
+
+def load_graph_from_db():
+    """Tải dữ liệu bản đồ từ PostGIS và tạo đồ thị OSMnx"""
+    print("Đang tải dữ liệu bản đồ từ PostGIS...", file=sys.stderr)
+    # bảng có thể vừa được pipeline thay thế -> đọc lại cột/SRID
+    clear_table_meta()
+
+    # Đọc dữ liệu nodes và edges từ PostGIS (chỉ các cột cần cho định tuyến, geometry dạng WKB)
+    with engine.connect() as conn:
+        nodes_gdf = read_geo_table(conn, "nodes", NODE_COLUMNS, index_col='osmid')
+        edges_gdf = read_geo_table(conn, "edges", EDGE_COLUMNS, index_col=['u', 'v', 'key'])
+
+    # Kiểm tra dữ liệu có hợp lệ không
+    if nodes_gdf.empty or edges_gdf.empty:
+        print("Lỗi: bảng nodes hoặc edges trống trong cơ sở dữ liệu.", file=sys.stderr)
+        return None
+
+    nodes_gdf, edges_gdf = normalize_gdfs_to_wgs84(nodes_gdf, edges_gdf)
+
     # Kiểm tra geometry bị thiếu
     missing_geom = edges_gdf['geometry'].isna().sum()
-    print(f"   Số lượng nodes: {len(nodes_gdf)}")
-    print(f"   Số lượng edges: {len(edges_gdf)}")
-    print(f"   Số cạnh có geometry: {len(edges_gdf) - missing_geom}")
+    print(f"   Số lượng nodes: {len(nodes_gdf)}", file=sys.stderr)
+    print(f"   Số lượng edges: {len(edges_gdf)}", file=sys.stderr)
+    print(f"   Số cạnh có geometry: {len(edges_gdf) - missing_geom}", file=sys.stderr)
 
     if missing_geom > 0:
-        print(f"   Cảnh báo: có {missing_geom} cạnh thiếu geometry.")
+        print(f"   Cảnh báo: có {missing_geom} cạnh thiếu geometry.", file=sys.stderr)
 
     # Đồng bộ cột x/y với geometry sau khi chuyển CRS về WGS84
     try:
@@ -86,15 +155,15 @@ def load_graph_from_db():
         pass
 
     # Tạo đồ thị OSMnx từ GeoDataFrame
-    G_base = ox.graph_from_gdfs(nodes_gdf, edges_gdf)
+    G_base = lazy_imports.load("osmnx").graph_from_gdfs(nodes_gdf, edges_gdf)
 
     # Kiểm tra ngẫu nhiên một cạnh
     sample_edge = list(G_base.edges(keys=True, data=True))[0]
     u, v, k, data = sample_edge
     if 'geometry' in data and data['geometry'] is not None:
-        print(f"   Cạnh mẫu có geometry gồm {len(data['geometry'].coords)} điểm.")
+        print(f"   Cạnh mẫu có geometry gồm {len(data['geometry'].coords)} điểm.", file=sys.stderr)
     else:
-        print("   Cạnh mẫu không có geometry.")
+        print("   Cạnh mẫu không có geometry.", file=sys.stderr)
 
-    print("Dữ liệu bản đồ đã được tải thành công.")
+    print("Dữ liệu bản đồ đã được tải thành công.", file=sys.stderr)
     return G_base
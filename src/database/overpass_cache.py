@@ -0,0 +1,244 @@
+# src/database/overpass_cache.py
+"""
+Dựng đồ thị hoàn toàn offline từ cache của osmnx (các thư mục cache/*.json).
+
+osmnx lưu mỗi response dưới tên sha1 của URL nên không thể tra ngược theo tên phường.
+Module này đọc nội dung các file (song song) và lập chỉ mục:
+  - response Nominatim (geocode): polygon của phường, tra theo tên đã bỏ dấu
+  - response Overpass: bbox vùng dữ liệu và loại mạng đường (all / drive)
+Sau đó dựng đồ thị từng phường giống ox.graph_from_place(network_type='all')
+mà không cần truy cập mạng, và báo cáo các phường chưa có trong cache.
+
+    python -m src.database.overpass_cache            # báo cáo độ phủ của cache
+"""
+import json
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Các thư mục cache osmnx trong repo (mỗi nơi chạy script tạo một thư mục cache riêng)
+CACHE_DIRS = [
+    Path("cache"),
+    Path("src/app/models/cache"),
+    Path("src/database/cache"),
+    Path("src/frontend/cache"),
+    Path("src/services/cache"),
+]
+
+# Giống graph_from_polygon của osmnx: tải dữ liệu trong vùng đệm 500m rồi cắt lại
+PERIPHERY_BUFFER_METERS = 500
+# Tỷ lệ vùng đệm phải được các response Overpass phủ để coi là đủ dữ liệu
+MIN_COVERAGE = 0.95
+
+# Các loại đường bị loại khỏi network_type='drive'; response có các loại này là của mạng 'all'
+_NON_DRIVE_HIGHWAYS = {"footway", "path", "pedestrian", "steps", "service", "track", "cycleway", "corridor"}
+_PLACE_PREFIXES = ("phuong", "xa", "thi tran", "quan", "huyen")
+_PLACE_SUFFIXES = ("ward", "commune", "district")
+
+
+def place_key(name: str) -> str:
+    """Khóa tra cứu của một địa danh: thành phần đầu, bỏ dấu, bỏ 'Phường' / 'Ward'."""
+    first = name.split(",")[0].replace("Đ", "D").replace("đ", "d")
+    folded = unicodedata.normalize("NFKD", first).encode("ascii", "ignore").decode().lower()
+    folded = re.sub(r"\s+", " ", folded).strip()
+    for prefix in _PLACE_PREFIXES:
+        if folded.startswith(prefix + " "):
+            folded = folded[len(prefix) + 1:]
+    for suffix in _PLACE_SUFFIXES:
+        if folded.endswith(" " + suffix):
+            folded = folded[: -len(suffix) - 1]
+    return folded.strip()
+
+
+# ======================================================================
+# Lập chỉ mục
+# ======================================================================
+
+def _scan_file(path: str) -> dict | None:
+    """Chạy trong process con: phân loại một file cache và trích thông tin cần cho chỉ mục."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if isinstance(data, list):
+        # Nominatim: osmnx dùng kết quả Polygon/MultiPolygon đầu tiên
+        for result in data:
+            geojson = result.get("geojson") or {}
+            if geojson.get("type") in ("Polygon", "MultiPolygon"):
+                return {
+                    "kind": "geocode",
+                    "path": path,
+                    "key": place_key(result.get("display_name", "")),
+                    "display_name": result.get("display_name"),
+                    "geojson": geojson,
+                }
+        return None
+
+    if isinstance(data, dict) and "elements" in data:
+        lons, lats, highways = [], [], set()
+        for element in data["elements"]:
+            if element.get("type") == "node":
+                lons.append(element["lon"])
+                lats.append(element["lat"])
+            elif element.get("type") == "way":
+                highways.add(element.get("tags", {}).get("highway"))
+        if not lons:
+            return None
+        return {
+            "kind": "overpass",
+            "path": path,
+            "bbox": (min(lons), min(lats), max(lons), max(lats)),
+            "network": "all" if highways & _NON_DRIVE_HIGHWAYS else "drive",
+            "timestamp": data.get("osm3s", {}).get("timestamp_osm_base"),
+        }
+    return None
+
+
+class CacheIndex:
+    def __init__(self, geocodes: dict, overpass: list):
+        self.geocodes = geocodes  # place_key -> entry
+        self.overpass = overpass  # [entry, ...]
+
+    def ward_sources(self, place: str, network_type: str = "all") -> tuple:
+        """
+        Trả về (polygon, vùng đệm, [đường dẫn response Overpass], độ phủ) của một phường,
+        hoặc (None, None, [], 0.0) nếu chưa có geocode trong cache.
+        """
+        from shapely.geometry import box, shape
+        from shapely.ops import unary_union
+        import osmnx as ox
+
+        entry = self.geocodes.get(place_key(place))
+        if entry is None:
+            return None, None, [], 0.0
+
+        polygon = shape(entry["geojson"])
+        poly_proj, crs_utm = ox.projection.project_geometry(polygon)
+        poly_buff, _ = ox.projection.project_geometry(
+            poly_proj.buffer(PERIPHERY_BUFFER_METERS), crs=crs_utm, to_latlong=True
+        )
+
+        paths, boxes = [], []
+        for item in self.overpass:
+            if network_type == "all" and item["network"] != "all":
+                continue
+            item_box = box(*item["bbox"])
+            if item_box.intersects(poly_buff):
+                paths.append(item["path"])
+                boxes.append(item_box)
+
+        coverage = unary_union(boxes).intersection(poly_buff).area / poly_buff.area if boxes else 0.0
+        return polygon, poly_buff, sorted(paths), coverage
+
+
+def build_index(cache_dirs: list = None, workers: int = None) -> CacheIndex:
+    """Đọc song song toàn bộ file cache (bỏ trùng theo tên file) và lập chỉ mục."""
+    files = {}
+    for directory in cache_dirs or CACHE_DIRS:
+        for path in sorted(Path(directory).glob("*.json")):
+            files.setdefault(path.name, str(path))
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        entries = [e for e in pool.map(_scan_file, files.values(), chunksize=4) if e]
+
+    geocodes, overpass = {}, []
+    for entry in entries:
+        if entry["kind"] == "geocode":
+            geocodes.setdefault(entry["key"], entry)
+        else:
+            overpass.append(entry)
+    return CacheIndex(geocodes, overpass)
+
+
+def missing_wards(places: list, index: CacheIndex, network_type: str = "all") -> list:
+    """Danh sách (phường, lý do) không dựng được offline."""
+    missing = []
+    for place in places:
+        polygon, _, paths, coverage = index.ward_sources(place, network_type)
+        if polygon is None:
+            missing.append((place, "chưa có kết quả geocode trong cache"))
+        elif not paths:
+            missing.append((place, "chưa có response Overpass nào"))
+        elif coverage < MIN_COVERAGE:
+            missing.append((place, f"response Overpass chỉ phủ {coverage:.0%} khu vực"))
+    return missing
+
+
+# ======================================================================
+# Dựng đồ thị
+# ======================================================================
+
+def _load_responses(paths: list) -> list:
+    responses = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            responses.append(json.load(f))
+    return responses
+
+
+def _build_ward_graph(polygon_wkt: str, poly_buff_wkt: str, paths: list, network_type: str = "all"):
+    """
+    Chạy trong process con: dựng đồ thị một phường từ các response Overpass đã cache,
+    theo đúng các bước của ox.graph_from_polygon (clean_periphery, simplify).
+    """
+    import networkx as nx
+    import osmnx as ox
+    from shapely import wkt
+
+    polygon = wkt.loads(polygon_wkt)
+    poly_buff = wkt.loads(poly_buff_wkt)
+
+    bidirectional = network_type in ox.settings.bidirectional_network_types
+    G_buff = ox.graph._create_graph(_load_responses(paths), retain_all=True, bidirectional=bidirectional)
+    G_buff = ox.truncate.truncate_graph_polygon(G_buff, poly_buff, True, False)
+    G_buff = ox.simplify_graph(G_buff)
+    G = ox.truncate.truncate_graph_polygon(G_buff, polygon, False, False)
+
+    spn = ox.stats.count_streets_per_node(G_buff, nodes=G.nodes)
+    nx.set_node_attributes(G, values=spn, name="street_count")
+    return G
+
+
+def build_ward_graphs(places: list, index: CacheIndex = None, network_type: str = "all",
+                      workers: int = None) -> dict:
+    """
+    Dựng song song đồ thị các phường từ cache. Trả về {place: MultiDiGraph};
+    phường thiếu dữ liệu bị bỏ qua (xem missing_wards).
+    """
+    index = index or build_index(workers=workers)
+    skipped = {place for place, _ in missing_wards(places, index, network_type)}
+
+    jobs = {}
+    for place in places:
+        if place in skipped:
+            continue
+        polygon, poly_buff, paths, _ = index.ward_sources(place, network_type)
+        jobs[place] = (polygon.wkt, poly_buff.wkt, paths, network_type)
+
+    graphs = {}
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count())) as pool:
+            futures = {place: pool.submit(_build_ward_graph, *args) for place, args in jobs.items()}
+            for place, future in futures.items():
+                graphs[place] = future.result()
+    return graphs
+
+
+def main():
+    from src.database.ingest_pipeline import WARDS
+
+    index = build_index()
+    print(f"Cache: {len(index.geocodes)} geocode, {len(index.overpass)} response Overpass "
+          f"({sum(1 for o in index.overpass if o['network'] == 'all')} loại 'all')")
+    missing = dict(missing_wards(WARDS, index))
+    for place in WARDS:
+        print(f"   {'THIẾU' if place in missing else 'OK   '} {place}"
+              + (f" - {missing[place]}" if place in missing else ""))
+
+
+if __name__ == "__main__":
+    main()
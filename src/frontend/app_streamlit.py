@@ -1,18 +1,25 @@
+import uuid
+
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
-from folium.plugins import Draw
+from folium.plugins import Draw, VectorGridProtobuf
 import requests
 import osmnx as ox
-import networkx as nx
 from pathlib import Path
 
 # --- Cấu hình ---
 GEOCODING_URL = "http://127.0.0.1:8000/api/v1/geocoding/loc-to-coords"
 FIND_ROUTE_URL = "http://127.0.0.1:8000/api/v1/routing/find-standard-route"
+BASE_MAP_URL = "http://127.0.0.1:8000/api/v1/routing/base-map"
+# Lớp mạng đường lấy từ vector tile: trình duyệt chỉ tải các ô đang hiển thị
+TILES_URL = "http://127.0.0.1:8000/tiles/{z}/{x}/{y}.mvt"
+
+# File graph do src/app/models/map_init.py tạo ra, dùng khi API chưa chạy
+GRAPH_FILE = Path(__file__).resolve().parents[1] / "app" / "models" / "graph" / "vinhtuy.graphml"
 
-# File lưu graph
-GRAPH_FILE = Path("src/models/graph/vinhtuy.graphml")
+# Sau khoảng này mới hỏi lại API (đồ thị có thể đã được nạp lại với phiên bản mới)
+BASE_MAP_TTL_SECONDS = 600
 
 # --- Khởi tạo Session State ---
 if 'blocking_geometries' not in st.session_state:
@@ -27,50 +34,51 @@ if 'ban_areas' not in st.session_state:
 if 'oneway_areas' not in st.session_state:
     st.session_state['oneway_areas'] = []
 
-if 'custom_graph' not in st.session_state:
-    st.session_state['custom_graph'] = None
-
 if 'current_route' not in st.session_state:
     st.session_state['current_route'] = None
 
-
-def load_or_create_graph():
-    """Load graph từ file hoặc tạo mới nếu chưa có"""
-    if GRAPH_FILE.exists():
-        st.info(f"Đang load graph từ file {GRAPH_FILE}...")
-        G = ox.load_graphml(GRAPH_FILE)
-        st.success("Đã load graph từ cache!")
-        return G
-    else:
-        st.warning("Chưa có file cache. Đang tải từ OSM ...")
-        places_names = [
-            "Phường Vĩnh Tuy, Hà Nội, Việt Nam",
-            "Phường Mai Động, Hà Nội, Việt Nam",
-            "Phường Vĩnh Hưng, Hà Nội, Việt Nam",
-            "Phường Thanh Lương, Hà Nội, Việt Nam"
-        ]
-
-        graphs = []
-        progress_bar = st.progress(0)
-        for i, place in enumerate(places_names):
-            st.write(f"Đang tải {place}...")
-            G = ox.graph_from_place(place, network_type='all')
-            graphs.append(G)
-            progress_bar.progress((i + 1) / len(places_names))
-
-        G = graphs[0]
-        for graph in graphs[1:]:
-            G = nx.compose(G, graph)
-
-        st.write("Đang xử lý graph...")
-        G = ox.project_graph(G)
-        G = ox.consolidate_intersections(G, tolerance=15)
-
-        # Lưu lại
-        ox.save_graphml(G, GRAPH_FILE)
-        st.success(f"Đã lưu graph vào {GRAPH_FILE}. Lần sau sẽ load nhanh hơn!")
-
-        return G
+# Gửi kèm mỗi lần tìm đường: khi chỉ thêm / bớt vùng, server sửa tuyến trước đó thay vì tìm lại từ đầu
+if 'route_session_id' not in st.session_state:
+    st.session_state['route_session_id'] = uuid.uuid4().hex
+
+
+def _base_map_from_file() -> dict:
+    """Khung bao của file graph cục bộ, cùng dạng với /api/v1/routing/base-map (không có mạng đường)"""
+    G = ox.load_graphml(GRAPH_FILE)
+    if G.graph.get("crs") and str(G.graph["crs"]).upper() != "EPSG:4326":
+        G = ox.project_graph(G, to_crs="EPSG:4326")
+    edges = ox.graph_to_gdfs(G, nodes=False)
+
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in edges.total_bounds)
+    return {
+        "graph_version": None,
+        "bounds": [min_lon, min_lat, max_lon, max_lat],
+        "center": [(min_lat + max_lat) / 2, (min_lon + max_lon) / 2],
+    }
+
+
+@st.cache_resource(ttl=BASE_MAP_TTL_SECONDS, show_spinner="Đang tải bản đồ nền...")
+def load_base_map() -> dict:
+    """
+    Khung bao bản đồ nền dùng chung cho mọi phiên trong tiến trình: lấy từ API, nếu API chưa chạy thì
+    đọc GRAPH_FILE. Chỉ giữ khung bao và tâm, mạng đường được vẽ từ vector tile.
+    """
+    try:
+        response = requests.get(BASE_MAP_URL, timeout=30)
+        response.raise_for_status()
+        base = response.json()
+    except Exception as e:
+        print(f"[frontend] không lấy được bản đồ nền từ API ({e}), đọc {GRAPH_FILE}")
+        base = _base_map_from_file()
+
+    min_lon, min_lat, max_lon, max_lat = base["bounds"]
+    # Padding rất nhỏ để giới hạn chặt (~100m)
+    padding = 0.001
+    return {
+        "graph_version": base["graph_version"],
+        "center": base["center"],
+        "bounds": [[min_lat - padding, min_lon - padding], [max_lat + padding, max_lon + padding]],
+    }
 
 # --- Giao diện Streamlit ---
 st.set_page_config(layout="wide")
@@ -82,57 +90,13 @@ col1, col2 = st.columns([3, 2])  # 3 phần cho bản đồ, 2 phần cho bảng
 with col1:
     st.header("Bản đồ tương tác")
 
-    # Load custom graph nếu chưa có
-    if st.session_state['custom_graph'] is None:
-        with st.spinner("Đang tải bản đồ từ OSMnx..."):
-            places_names = [
-                "Phường Vĩnh Tuy, Hà Nội, Việt Nam",
-                "Phường Mai Động, Hà Nội, Việt Nam",
-                "Phường Vĩnh Hưng, Hà Nội, Việt Nam",
-                "Phường Thanh Lương, Hà Nội, Việt Nam"
-            ]
-
-            graphs = []
-            for place in places_names:
-                G = ox.graph_from_place(place, network_type='all')
-                graphs.append(G)
-
-            G = graphs[0]
-            for graph in graphs[1:]:
-                G = nx.compose(G, graph)
-
-            G = ox.project_graph(G)
-            G = ox.consolidate_intersections(G, tolerance=15)
-
-            st.session_state['custom_graph'] = G
-
-    # Tạo bản đồ từ custom graph
-    G = st.session_state['custom_graph']
-    G_latlon = ox.project_graph(G, to_crs='EPSG:4326')
-
-    # Lấy tọa độ từ graph
-    nodes = ox.graph_to_gdfs(G_latlon, edges=False)
-    edges = ox.graph_to_gdfs(G_latlon, nodes=False)
-
-    # Tính bounds từ EDGES
-    min_lat = edges.geometry.bounds['miny'].min()
-    max_lat = edges.geometry.bounds['maxy'].max()
-    min_lon = edges.geometry.bounds['minx'].min()
-    max_lon = edges.geometry.bounds['maxx'].max()
-
-    center_lat = (min_lat + max_lat) / 2
-    center_lon = (min_lon + max_lon) / 2
-
-    # Padding rất nhỏ để giới hạn chặt
-    padding = 0.001  # ~100m
-    bounds = [
-        [min_lat - padding, min_lon - padding],
-        [max_lat + padding, max_lon + padding]
-    ]
+    # Bản đồ nền dùng chung (cache theo tiến trình, không tải lại cho mỗi phiên)
+    base_map = load_base_map()
+    bounds = base_map["bounds"]
 
     # Tạo bản đồ với giới hạn chặt chẽ
     m = folium.Map(
-        location=[center_lat, center_lon],
+        location=base_map["center"],
         zoom_start=15,
         min_zoom=14,
         max_zoom=18,
@@ -141,6 +105,19 @@ with col1:
     )
     m.fit_bounds(bounds)
 
+    # Lớp mạng đường từ vector tile (/tiles): không dựng lại GeoJSON cả mạng đường mỗi lần vẽ lại
+    VectorGridProtobuf(
+        TILES_URL,
+        "Mạng đường",
+        {
+            "vectorTileLayerStyles": {
+                "roads": {"color": "#555555", "weight": 1.5, "opacity": 0.5},
+                "flood": {"color": "blue", "weight": 1, "fill": True, "fillOpacity": 0.2},
+                "ban": {"color": "red", "weight": 1, "fill": True, "fillOpacity": 0.2},
+            },
+        },
+    ).add_to(m)
+
     # Thêm plugin Draw vào bản đồ
     Draw(export=True).add_to(m)
 
@@ -458,7 +435,8 @@ if st.button("Tìm đường", type="primary"):
                 "end_address": end_address,
                 "blocking_geometries": st.session_state['blocking_geometries'],
                 "flood_areas": st.session_state['flood_areas'],
-                "ban_areas": st.session_state['ban_areas']
+                "ban_areas": st.session_state['ban_areas'],
+                "session_id": st.session_state['route_session_id']
             }
 
             response = requests.post(
@@ -0,0 +1,307 @@
+# src/services/compact_graph.py
+"""
+Biểu diễn gọn của đồ thị định tuyến, dựng từ MultiDiGraph G_base.
+
+- Node được đánh lại chỉ số liên tục int32, sắp theo osmid nên tra osmid -> chỉ số
+  bằng tìm kiếm nhị phân trên node_osmid (không cần dict).
+- Cạnh lưu theo dạng CSR (indptr/edge_target) sắp theo node đầu; mỗi cạnh (u, v, key)
+  của G_base có một chỉ số cạnh e.
+- Thuộc tính số là mảng NumPy có kiểu, chuỗi được mã hóa từ điển (mã int + bảng giá trị),
+  geometry là một buffer tọa độ phẳng kèm offsets.
+
+    python -m src.services.compact_graph [file.graphml]   # báo cáo bộ nhớ so với MultiDiGraph
+"""
+import itertools
+import sys
+
+import networkx as nx
+import numpy as np
+
+# Các thuộc tính chuỗi được mã hóa từ điển; giá trị list (sau simplify) được giữ dạng tuple
+STRING_ATTRS = ("highway", "name", "access", "maxspeed")
+
+
+def _encode(values: list) -> tuple:
+    """Mã hóa từ điển: trả về (mảng mã, danh sách giá trị). Mã -1 = không có giá trị."""
+    table, lookup = [], {}
+    codes = np.full(len(values), -1, dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        if isinstance(value, list):
+            value = tuple(value)
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(table)
+            table.append(value)
+        codes[i] = code
+    dtype = np.int16 if len(table) < np.iinfo(np.int16).max else np.int32
+    return codes.astype(dtype), table
+
+
+class CompactGraph:
+    def __init__(self, node_osmid, node_x, node_y, indptr, edge_source, edge_target, edge_key,
+                 length, travel_time, speed_kph, oneway, strings: dict,
+                 geom_offsets, geom_coords, crs=None):
+        self.node_osmid = node_osmid      # int64 [N], tăng dần
+        self.node_x = node_x              # float64 [N]
+        self.node_y = node_y              # float64 [N]
+        self.indptr = indptr              # int32 [N + 1]
+        self.edge_source = edge_source    # int32 [E]
+        self.edge_target = edge_target    # int32 [E]
+        self.edge_key = edge_key          # int32 [E]
+        self.length = length              # float32 [E], mét
+        self.travel_time = travel_time    # float32 [E], giây
+        self.speed_kph = speed_kph        # float32 [E]
+        self.oneway = oneway              # bool [E]
+        self.strings = strings            # tên thuộc tính -> (mã [E], bảng giá trị)
+        self.geom_offsets = geom_offsets  # int64 [E + 1], khoảng rỗng = đoạn thẳng u -> v
+        self.geom_coords = geom_coords    # float64 [M, 2] (x, y)
+        self.crs = crs
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_osmid)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edge_target)
+
+    # ------------------------------------------------------------------
+    # Tra cứu
+    # ------------------------------------------------------------------
+
+    def node_index(self, osmid) -> int:
+        """osmid -> chỉ số node; KeyError nếu không có."""
+        i = int(np.searchsorted(self.node_osmid, osmid))
+        if i >= len(self.node_osmid) or self.node_osmid[i] != osmid:
+            raise KeyError(osmid)
+        return i
+
+    def node_indices(self, osmids) -> np.ndarray:
+        """Phiên bản vector của node_index; osmid không có cho kết quả -1."""
+        osmids = np.asarray(osmids, dtype=np.int64)
+        idx = np.searchsorted(self.node_osmid, osmids)
+        idx = np.minimum(idx, len(self.node_osmid) - 1)
+        return np.where(self.node_osmid[idx] == osmids, idx, -1).astype(np.int32)
+
+    def osmid(self, index: int) -> int:
+        return self.node_osmid[index].item()
+
+    def out_edges(self, index: int) -> range:
+        return range(self.indptr[index], self.indptr[index + 1])
+
+    def edge_id(self, u, v, key=0) -> int:
+        """(u, v, key) theo osmid -> chỉ số cạnh; KeyError nếu không có."""
+        ui, vi = self.node_index(u), self.node_index(v)
+        for e in self.out_edges(ui):
+            if self.edge_target[e] == vi and self.edge_key[e] == key:
+                return e
+        raise KeyError((u, v, key))
+
+    def edge_tuple(self, e: int) -> tuple:
+        return (
+            self.osmid(self.edge_source[e]), self.osmid(self.edge_target[e]), int(self.edge_key[e])
+        )
+
+    def string_attr(self, name: str, e: int):
+        codes, table = self.strings[name]
+        code = codes[e]
+        return table[code] if code >= 0 else None
+
+    def edge_coords(self, e: int) -> np.ndarray:
+        start, end = self.geom_offsets[e], self.geom_offsets[e + 1]
+        if start == end:
+            u, v = self.edge_source[e], self.edge_target[e]
+            return np.array([[self.node_x[u], self.node_y[u]], [self.node_x[v], self.node_y[v]]])
+        return self.geom_coords[start:end]
+
+    def edge_geometry(self, e: int):
+        from shapely.geometry import LineString
+        return LineString(self.edge_coords(e))
+
+    def edge_geometries(self) -> np.ndarray:
+        """Mảng LineString của mọi cạnh (dựng hàng loạt từ buffer tọa độ)."""
+        import shapely
+
+        counts = np.diff(self.geom_offsets)
+        missing = np.flatnonzero(counts == 0)
+        geometries = np.empty(self.num_edges, dtype=object)
+        present = np.flatnonzero(counts > 0)
+        if len(present):
+            geometries[present] = shapely.linestrings(
+                self.geom_coords, indices=np.repeat(np.arange(len(present)), counts[present])
+            )
+        for e in missing:
+            geometries[e] = self.edge_geometry(e)
+        return geometries
+
+    def edge_attrs(self, e: int) -> dict:
+        attrs = {
+            "length": float(self.length[e]),
+            "travel_time": float(self.travel_time[e]),
+            "speed_kph": float(self.speed_kph[e]),
+            "oneway": bool(self.oneway[e]),
+        }
+        for name in self.strings:
+            value = self.string_attr(name, e)
+            if value is not None:
+                attrs[name] = list(value) if isinstance(value, tuple) else value
+        return attrs
+
+    def to_networkx(self) -> nx.MultiDiGraph:
+        """Dựng lại MultiDiGraph (cho các đường xử lý còn dùng NetworkX)."""
+        G = nx.MultiDiGraph(crs=self.crs)
+        G.add_nodes_from(
+            (osmid, {"x": x, "y": y})
+            for osmid, x, y in zip(self.node_osmid.tolist(), self.node_x.tolist(), self.node_y.tolist())
+        )
+        for e in range(self.num_edges):
+            u, v, key = self.edge_tuple(e)
+            G.add_edge(u, v, key, geometry=self.edge_geometry(e), **self.edge_attrs(e))
+        return G
+
+    # ------------------------------------------------------------------
+    # Bộ nhớ
+    # ------------------------------------------------------------------
+
+    def nbytes(self) -> int:
+        total = sum(
+            a.nbytes for a in (
+                self.node_osmid, self.node_x, self.node_y, self.indptr, self.edge_source,
+                self.edge_target, self.edge_key, self.length, self.travel_time, self.speed_kph,
+                self.oneway, self.geom_offsets, self.geom_coords,
+            )
+        )
+        for codes, table in self.strings.values():
+            total += codes.nbytes + sum(deep_sizeof(v) for v in table)
+        return total
+
+
+def build_compact_graph(G: nx.MultiDiGraph) -> CompactGraph:
+    """Dựng CompactGraph từ MultiDiGraph (node phải có x, y)."""
+    node_osmid = np.array(sorted(G.nodes), dtype=np.int64)
+    position = {osmid: i for i, osmid in enumerate(node_osmid.tolist())}
+    node_x = np.array([G.nodes[n]["x"] for n in node_osmid.tolist()], dtype=np.float64)
+    node_y = np.array([G.nodes[n]["y"] for n in node_osmid.tolist()], dtype=np.float64)
+
+    edges = list(G.edges(keys=True, data=True))
+    sources = np.array([position[u] for u, _, _, _ in edges], dtype=np.int32)
+    # sắp cạnh theo node đầu (ổn định để giữ thứ tự key của cạnh song song)
+    order = np.argsort(sources, kind="stable")
+    edges = [edges[i] for i in order]
+    edge_source = sources[order]
+    edge_target = np.array([position[v] for _, v, _, _ in edges], dtype=np.int32)
+    edge_key = np.array([k for _, _, k, _ in edges], dtype=np.int32)
+    indptr = np.zeros(len(node_osmid) + 1, dtype=np.int32)
+    np.cumsum(np.bincount(edge_source, minlength=len(node_osmid)), out=indptr[1:])
+
+    def _numeric(name, default=np.nan):
+        return np.array([d.get(name, default) for _, _, _, d in edges], dtype=np.float32)
+
+    strings = {name: _encode([d.get(name) for _, _, _, d in edges]) for name in STRING_ATTRS}
+
+    geom_offsets = np.zeros(len(edges) + 1, dtype=np.int64)
+    parts = []
+    for i, (_, _, _, d) in enumerate(edges):
+        geom = d.get("geometry")
+        coords = np.asarray(geom.coords, dtype=np.float64) if geom is not None else np.empty((0, 2))
+        parts.append(coords[:, :2])
+        geom_offsets[i + 1] = geom_offsets[i] + len(coords)
+    geom_coords = np.concatenate(parts) if parts else np.empty((0, 2))
+
+    return CompactGraph(
+        node_osmid, node_x, node_y, indptr, edge_source, edge_target, edge_key,
+        length=_numeric("length", 0.0),
+        travel_time=_numeric("travel_time"),
+        speed_kph=_numeric("speed_kph"),
+        oneway=np.array([bool(d.get("oneway", False)) for _, _, _, d in edges], dtype=bool),
+        strings=strings,
+        geom_offsets=geom_offsets,
+        geom_coords=geom_coords,
+        crs=G.graph.get("crs"),
+    )
+
+
+# ======================================================================
+# Báo cáo bộ nhớ
+# ======================================================================
+
+def deep_sizeof(obj, seen: set = None) -> int:
+    """
+    Ước lượng bộ nhớ của một đối tượng Python (đệ quy qua dict/list/tuple).
+    Geometry shapely được tính thêm phần tọa độ nằm trong GEOS (16 byte/điểm + header).
+    """
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "geom_type") and hasattr(obj, "coords"):
+        size += 16 * len(obj.coords) + 64
+    return size
+
+
+def sampled_sizeof(container, sample: int = 500) -> int:
+    """
+    Như deep_sizeof cho một list / tuple / set / dict lớn: chỉ đo sample phần tử đầu rồi nhân lên.
+    Mỗi phần tử được đo riêng (không khử trùng lặp) nên số nguyên nhỏ được Python dùng chung vẫn tính
+    ~28 byte / phần tử, như khi các phần tử là các số khác nhau.
+    """
+    items = container.items() if isinstance(container, dict) else container
+    picked = list(itertools.islice(items, sample))
+    size = sys.getsizeof(container)
+    if picked:
+        size += int(sum(deep_sizeof(item) for item in picked) * len(container) / len(picked))
+    return size
+
+
+def networkx_sizeof(G: nx.MultiDiGraph, sample: int = None) -> int:
+    """
+    Ước lượng bộ nhớ của MultiDiGraph: các dict kề, thuộc tính node/cạnh và geometry.
+    sample: chỉ đo sample node đầu rồi nhân lên (nhanh, cho đồ thị lớn).
+    """
+    seen = set()
+    if sample is None or G.number_of_nodes() <= sample:
+        return deep_sizeof(G._node, seen) + deep_sizeof(G._succ, seen) + deep_sizeof(G._pred, seen)
+    nodes = list(itertools.islice(G.nodes, sample))
+    sampled = sum(
+        deep_sizeof(G._node[n], seen) + deep_sizeof(G._succ[n], seen) + deep_sizeof(G._pred[n], seen)
+        for n in nodes
+    )
+    return int(sampled * G.number_of_nodes() / len(nodes)) + sys.getsizeof(G._node) * 3
+
+
+def memory_report(G: nx.MultiDiGraph, compact: CompactGraph = None) -> dict:
+    compact = compact or build_compact_graph(G)
+    networkx_bytes = networkx_sizeof(G)
+    compact_bytes = compact.nbytes()
+    return {
+        "nodes": compact.num_nodes,
+        "edges": compact.num_edges,
+        "networkx_bytes": networkx_bytes,
+        "compact_bytes": compact_bytes,
+        "reduction": 1 - compact_bytes / networkx_bytes if networkx_bytes else 0.0,
+    }
+
+
+def main(argv=None):
+    import osmnx as ox
+
+    argv = argv if argv is not None else sys.argv[1:]
+    path = argv[0] if argv else "src/app/models/graph/vinhtuy.graphml"
+    G = ox.load_graphml(path)
+    G = ox.project_graph(G, to_crs="EPSG:4326")
+    report = memory_report(G)
+    print(f"{report['nodes']} node, {report['edges']} cạnh")
+    print(f"MultiDiGraph : {report['networkx_bytes'] / 1e6:8.2f} MB")
+    print(f"CompactGraph : {report['compact_bytes'] / 1e6:8.2f} MB")
+    print(f"Giảm         : {report['reduction']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
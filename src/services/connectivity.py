@@ -0,0 +1,132 @@
+# src/services/connectivity.py
+"""
+Chỉ mục liên thông của đồ thị gốc, dựng một lần cho mỗi phiên bản đồ thị.
+
+- Nhãn thành phần liên thông mạnh (SCC): hai node khác SCC thì chắc chắn không có đường,
+  trả lời ngay mà không cần tìm kiếm.
+- Cây cầu (bridge tree) của đồ thị vô hướng: nếu vùng cấm chặn hết một cây cầu nằm trên
+  đường nối hai thành phần 2-liên thông cạnh của điểm đầu và điểm cuối thì cũng không thể
+  có đường, phát hiện được chỉ bằng vài phép so sánh trên cây.
+"""
+import networkx as nx
+import numpy as np
+
+from src.app.core import lazy_imports, metrics
+from .compact_graph import CompactGraph
+
+
+class ConnectivityIndex:
+    def __init__(self, compact: CompactGraph, allowed: np.ndarray | None = None):
+        """allowed: mặt nạ các cạnh được đi (theo hồ sơ phương tiện); mặc định tất cả."""
+        self.compact = compact
+        self.allowed = allowed if allowed is not None else np.ones(compact.num_edges, dtype=bool)
+        n = compact.num_nodes
+        csgraph = lazy_imports.load("scipy.sparse.csgraph")
+        sparse = lazy_imports.load("scipy.sparse")
+
+        adjacency = sparse.csr_matrix(
+            (np.ones(int(self.allowed.sum()), dtype=np.int8),
+             (compact.edge_source[self.allowed], compact.edge_target[self.allowed])),
+            shape=(n, n),
+        )
+        count, labels = csgraph.connected_components(adjacency, directed=True, connection="strong")
+        self.scc_label = labels.astype(np.int32)
+        self.scc_size = np.bincount(self.scc_label, minlength=count)
+        self.largest_scc = int(self.scc_size.argmax()) if count else -1
+        metrics.set_gauge("graph_scc_count", count)
+        metrics.set_gauge("graph_largest_scc_nodes", int(self.scc_size.max()) if count else 0)
+
+        self._build_bridge_tree()
+
+    # ------------------------------------------------------------------
+    # Cây cầu
+    # ------------------------------------------------------------------
+
+    def _build_bridge_tree(self):
+        c = self.compact
+        undirected = nx.Graph()
+        undirected.add_nodes_from(range(c.num_nodes))
+        undirected.add_edges_from(zip(c.edge_source[self.allowed].tolist(), c.edge_target[self.allowed].tolist()))
+        bridges = {tuple(sorted(pair)) for pair in nx.bridges(undirected)}
+
+        # thành phần 2-liên thông cạnh: bỏ các cây cầu rồi lấy thành phần liên thông
+        undirected.remove_edges_from(bridges)
+        self.block_label = np.empty(c.num_nodes, dtype=np.int32)
+        for label, nodes in enumerate(nx.connected_components(undirected)):
+            self.block_label[list(nodes)] = label
+
+        # các cạnh gốc (hai chiều, kể cả cạnh song song) tạo nên từng cây cầu
+        pairs = np.minimum(c.edge_source, c.edge_target).astype(np.int64) * c.num_nodes \
+            + np.maximum(c.edge_source, c.edge_target)
+        bridge_keys = np.array([a * c.num_nodes + b for a, b in bridges], dtype=np.int64)
+        is_bridge_edge = np.isin(pairs, bridge_keys) & self.allowed
+        self._edge_pair = pairs
+        self.bridge_edges = {}
+        for e in np.flatnonzero(is_bridge_edge).tolist():
+            self.bridge_edges.setdefault(int(pairs[e]), []).append(e)
+        self.is_bridge_edge = is_bridge_edge
+
+        # cây các khối: đánh số vào/ra theo DFS để kiểm tra "nằm trong cây con" trong O(1)
+        tree = nx.Graph()
+        tree.add_nodes_from(range(int(self.block_label.max()) + 1 if c.num_nodes else 0))
+        child_of = {}
+        for a, b in bridges:
+            tree.add_edge(int(self.block_label[a]), int(self.block_label[b]), key=a * c.num_nodes + b)
+        self.tin = np.zeros(tree.number_of_nodes(), dtype=np.int64)
+        self.tout = np.zeros(tree.number_of_nodes(), dtype=np.int64)
+        clock = 0
+        for root in tree.nodes:
+            if self.tout[root]:
+                continue
+            stack = [(root, None, iter(tree[root]))]
+            self.tin[root] = clock = clock + 1
+            while stack:
+                node, parent, neighbors = stack[-1]
+                child = next(neighbors, None)
+                if child is None:
+                    self.tout[node] = clock = clock + 1
+                    stack.pop()
+                elif child != parent and not self.tin[child]:
+                    child_of[tree[node][child]["key"]] = child
+                    self.tin[child] = clock = clock + 1
+                    stack.append((child, node, iter(tree[child])))
+        # cây cầu -> khối ở phía xa gốc
+        self.bridge_child = child_of
+        metrics.set_gauge("graph_bridges", len(bridges))
+
+    # ------------------------------------------------------------------
+    # Truy vấn
+    # ------------------------------------------------------------------
+
+    def same_scc(self, a: int, b: int) -> bool:
+        """a, b: chỉ số node của CompactGraph."""
+        return self.scc_label[a] == self.scc_label[b]
+
+    def scc_of_osmid(self, osmid) -> int:
+        return int(self.scc_label[self.compact.node_index(osmid)])
+
+    def _in_subtree(self, block: int, root: int) -> bool:
+        return self.tin[root] <= self.tin[block] and self.tout[block] <= self.tout[root]
+
+    def cut_by_bans(self, a: int, b: int, banned: np.ndarray | None) -> bool:
+        """
+        True nếu các cạnh bị cấm chặn hết một cây cầu nằm giữa a và b, tức chắc chắn không có đường.
+        False không có nghĩa là có đường (chiều một chiều vẫn có thể làm mất liên thông).
+        """
+        if banned is None:
+            return False
+        touched = np.unique(self._edge_pair[banned & self.is_bridge_edge])
+        if not len(touched):
+            return False
+        block_a, block_b = self.block_label[a], self.block_label[b]
+        for key in touched.tolist():
+            if not banned[self.bridge_edges[key]].all():
+                continue
+            child = self.bridge_child[key]
+            if self._in_subtree(block_a, child) != self._in_subtree(block_b, child):
+                return True
+        return False
+
+
+def build_connectivity_index(compact: CompactGraph) -> ConnectivityIndex:
+    return ConnectivityIndex(compact)
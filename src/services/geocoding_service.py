@@ -1,8 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+
 import requests
 from fastapi import HTTPException
 
+from src.app.core import metrics
+from src.app.core.config import GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL_SECONDS
+
+
+class GeocodeCache:
+    """Cache LRU có hạn dùng cho kết quả Nominatim (chỉ kết quả thành công)."""
+
+    def __init__(self, max_entries: int = GEOCODE_CACHE_SIZE, ttl: float = GEOCODE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.inc("geocode_cache_hits" if entry is not None else "geocode_cache_misses")
+        return dict(entry[1]) if entry is not None else None
+
+    def put(self, key, result: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() - entry[0] <= self.ttl
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+geocode_cache = GeocodeCache()
+
+
+def _address_key(address: str) -> tuple:
+    return ("search", " ".join(address.lower().split()))
+
+
+def is_address_cached(address: str) -> bool:
+    return _address_key(address) in geocode_cache
+
 
 def get_coords_from_address(address: str) -> dict:
+    key = _address_key(address)
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        cached["address"] = address
+        return cached
+
     url = "https://nominatim.openstreetmap.org/search"
     params = {"q": address, "format": "json", "limit": 1, "countrycodes": "vn"}
     headers = {"User-Agent": "my_app"}
@@ -21,16 +83,25 @@ def get_coords_from_address(address: str) -> dict:
         if not lat_str or not lon_str:
             raise HTTPException(status_code=400, detail=f"api không trả về tọa độ hợp lệ cho: {address}")
 
-        return {
+        result = {
             "address": address,
             "latitude": float(lat_str),
             "longitude": float(lon_str)
         }
+        geocode_cache.put(key, result)
+        return result
     except requests.exceptions.RequestException as e:
         raise HTTPException(status_code=500, detail=f"lỗi khi gọi nominatim api: {e}")
 
 
 def get_address_from_coords(latitude: float, longitude: float) -> dict:
+    # làm tròn ~1 m để các tọa độ gần như trùng nhau dùng chung kết quả
+    key = ("reverse", round(latitude, 5), round(longitude, 5))
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        cached.update(latitude=latitude, longitude=longitude)
+        return cached
+
     url = "https://nominatim.openstreetmap.org/reverse"
     params = {"lat": latitude, "lon": longitude, "format": "json"}
     headers = {"User-Agent": "my_app"}
@@ -43,11 +114,13 @@ def get_address_from_coords(latitude: float, longitude: float) -> dict:
         if "error" in data:
             raise HTTPException(status_code=404, detail="không tìm thấy địa chỉ cho tọa độ này")
 
-        return {
+        result = {
             "latitude": latitude,
             "longitude": longitude,
             "address": data.get("display_name", "không có tên hiển thị")
         }
+        geocode_cache.put(key, result)
+        return result
     except requests.exceptions.RequestException as e:
         raise HTTPException(status_code=500, detail=f"lỗi khi gọi nominatim api: {e}")
 
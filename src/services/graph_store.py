@@ -0,0 +1,260 @@
+# src/services/graph_store.py
+"""
+Quản lý phiên bản đồ thị đang phục vụ.
+
+- Mỗi lần nạp tạo một GraphVersion gồm đồ thị và các chỉ mục dẫn xuất
+  (được dựng bởi các hàm đăng ký qua register_index_builder).
+- Việc nạp chạy nền; khi xong, phiên bản mới được đổi vào một cách nguyên tử.
+  Request mới dùng phiên bản mới, request đang chạy hoàn tất trên phiên bản cũ.
+- Phiên bản cũ được giải phóng khi request cuối cùng dùng nó kết thúc.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from src.app.core import metrics
+from .compact_graph import CompactGraph
+
+# name -> fn(graph, indexes) -> index; dựng theo thứ tự đăng ký mỗi khi có phiên bản mới,
+# `indexes` chứa các chỉ mục đã dựng trước đó nên chỉ mục sau có thể dùng chỉ mục trước
+_INDEX_BUILDERS = {}
+
+
+# GraphStore đang dựng chỉ mục cho phiên bản mới (để builder lấy chỉ mục của phiên bản nó thay thế)
+_publishing = contextvars.ContextVar("graph_store_publishing", default=None)
+
+
+def register_index_builder(name: str, builder):
+    """Đăng ký một chỉ mục dẫn xuất được dựng cho mọi phiên bản đồ thị."""
+    _INDEX_BUILDERS[name] = builder
+
+
+def previous_index(name: str):
+    """Gọi trong builder: chỉ mục `name` của phiên bản sắp bị thay thế (cùng GraphStore), hoặc None."""
+    store = _publishing.get()
+    previous = store.current if store is not None else None
+    return previous.indexes.get(name) if previous is not None else None
+
+
+class GraphNotLoadedError(Exception):
+    """Chưa có phiên bản đồ thị nào sẵn sàng."""
+
+
+class GraphVersion:
+    def __init__(self, version: str, graph, indexes: dict):
+        self.version = version
+        self._graph = graph
+        self._graph_lock = threading.Lock()
+        self.indexes = indexes
+        self.loaded_at = time.time()
+        self.active_requests = 0
+
+    @property
+    def graph(self):
+        """
+        Đồ thị NetworkX. Phiên bản nạp thẳng thành CompactGraph (vd. từ file Arrow) chỉ dựng nó
+        (to_networkx) ở lần đầu có đường xử lý cần tới.
+        """
+        if self._graph is None and "compact_graph" in self.indexes:
+            with self._graph_lock:
+                if self._graph is None:
+                    started = time.perf_counter()
+                    self._graph = self.indexes["compact_graph"].to_networkx()
+                    metrics.observe("graph_networkx_build_seconds", time.perf_counter() - started)
+        return self._graph
+
+    @property
+    def graph_built(self) -> bool:
+        """Đồ thị NetworkX đã có trong bộ nhớ chưa (không dựng nếu chưa)."""
+        return self._graph is not None
+
+
+class GraphStore:
+    def __init__(self, loader=None, name: str = "default"):
+        self.name = name
+        self._loader = loader
+        self._current = None
+        self._draining = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        self._unload_listeners = []
+        self.status = {"state": "empty", "error": None, "last_load_seconds": None}
+
+    # ------------------------------------------------------------------
+    # Đọc
+    # ------------------------------------------------------------------
+
+    @property
+    def current(self) -> GraphVersion | None:
+        return self._current
+
+    @contextmanager
+    def acquire(self):
+        """Mượn phiên bản hiện tại trong suốt một request."""
+        with self._lock:
+            version = self._current
+            if version is None:
+                raise GraphNotLoadedError("bản đồ đang được tải, vui lòng thử lại sau")
+            version.active_requests += 1
+        try:
+            yield version
+        finally:
+            with self._lock:
+                version.active_requests -= 1
+                if version is not self._current and version.active_requests == 0:
+                    self._release(version)
+
+    # ------------------------------------------------------------------
+    # Ghi
+    # ------------------------------------------------------------------
+
+    def _release(self, version: GraphVersion):
+        # gọi khi đang giữ self._lock
+        if version in self._draining:
+            self._draining.remove(version)
+            metrics.inc("graph_versions_released", store=self.name)
+            print(f"[{self.name}] đã giải phóng phiên bản đồ thị {version.version}")
+        metrics.set_gauge("graph_versions_draining", len(self._draining), store=self.name)
+
+    def subscribe(self, listener):
+        """listener(version) được gọi sau mỗi lần một phiên bản mới được đổi vào."""
+        self._listeners.append(listener)
+
+    def subscribe_unload(self, listener):
+        """listener(version) được gọi sau khi phiên bản hiện tại bị bỏ bằng unload()."""
+        self._unload_listeners.append(listener)
+
+    def publish(self, graph, indexes: dict = None) -> GraphVersion:
+        """
+        Dựng chỉ mục cho đồ thị rồi đổi nó thành phiên bản hiện tại.
+        graph: đồ thị NetworkX, hoặc CompactGraph (đồ thị NetworkX được dựng lười, xem GraphVersion.graph;
+        builder nhận graph = None).
+        indexes: các chỉ mục loader đã có sẵn (không dựng lại).
+        """
+        indexes = dict(indexes or {})
+        if isinstance(graph, CompactGraph):
+            graph, indexes["compact_graph"] = None, graph
+        token = _publishing.set(self)
+        try:
+            for name, builder in _INDEX_BUILDERS.items():
+                if name in indexes:
+                    continue
+                started = time.perf_counter()
+                indexes[name] = builder(graph, indexes)
+                metrics.observe("graph_index_build_seconds", time.perf_counter() - started, index=name)
+        finally:
+            _publishing.reset(token)
+
+        with self._lock:
+            self._sequence += 1
+            # tên phiên bản là khóa cache (tuyến đường, vector tile): thêm tên store để các vùng không trùng
+            prefix = "" if self.name == "default" else f"{self.name}-"
+            version = GraphVersion(
+                f"{prefix}v{self._sequence}-{datetime.now().strftime('%Y%m%d%H%M%S')}", graph, indexes
+            )
+            previous = self._current
+            self._current = version
+            if previous is not None:
+                self._draining.append(previous)
+                if previous.active_requests == 0:
+                    self._release(previous)
+            metrics.set_gauge("graph_versions_draining", len(self._draining), store=self.name)
+        metrics.inc("graph_versions_published", store=self.name)
+        print(f"[{self.name}] phiên bản đồ thị {version.version} đã sẵn sàng")
+        for listener in self._listeners:
+            listener(version)
+        return version
+
+    def unload(self) -> bool:
+        """Bỏ phiên bản hiện tại (vd. vùng bị đẩy khỏi bộ nhớ); request đang chạy vẫn dùng nó tới khi xong."""
+        with self._lock:
+            previous, self._current = self._current, None
+            if previous is None:
+                return False
+            self._draining.append(previous)
+            if previous.active_requests == 0:
+                self._release(previous)
+            self.status.update(state="empty")
+        metrics.inc("graph_versions_unloaded", store=self.name)
+        print(f"[{self.name}] đã bỏ phiên bản đồ thị {previous.version} khỏi bộ nhớ")
+        for listener in self._unload_listeners:
+            listener(previous)
+        return True
+
+    def reload(self) -> GraphVersion | None:
+        """Nạp đồ thị bằng loader và publish. Chỉ một lần nạp chạy tại một thời điểm."""
+        with self._reload_lock:
+            self.status.update(state="loading", error=None)
+            started = time.perf_counter()
+            try:
+                # loader trả về đồ thị (NetworkX hoặc CompactGraph), hoặc (đồ thị, {tên chỉ mục: chỉ mục dựng sẵn})
+                loaded = self._loader()
+                graph, indexes = loaded if isinstance(loaded, tuple) else (loaded, None)
+                if graph is None:
+                    raise RuntimeError("loader không trả về đồ thị")
+                version = self.publish(graph, indexes)
+            except Exception as e:
+                self.status.update(state="failed", error=str(e))
+                metrics.inc("graph_reload_failures", store=self.name)
+                print(f"[{self.name}] lỗi khi nạp đồ thị: {e}")
+                return None
+            elapsed = time.perf_counter() - started
+            self.status.update(state="ready", last_load_seconds=elapsed)
+            metrics.observe("graph_load_seconds", elapsed, store=self.name)
+            return version
+
+    def reload_in_background(self) -> bool:
+        """Bắt đầu nạp phiên bản mới ở thread nền; False nếu đang có lần nạp khác."""
+        if self._reload_lock.locked():
+            return False
+        threading.Thread(target=self.reload, name=f"graph-reload-{self.name}", daemon=True).start()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            current = self._current
+            return {
+                "store": self.name,
+                "version": current.version if current else None,
+                "loaded_at": current.loaded_at if current else None,
+                "active_requests": current.active_requests if current else 0,
+                "draining_versions": [
+                    {"version": v.version, "active_requests": v.active_requests} for v in self._draining
+                ],
+                "indexes": sorted(current.indexes) if current else [],
+                **self.status,
+            }
+
+
+def watch_trigger_file(store: GraphStore, path: str, interval: float = 5.0):
+    """
+    Theo dõi mtime của một file (vd. do ingest_pipeline ghi sau khi swap bảng)
+    và nạp lại đồ thị khi file thay đổi.
+    """
+    import os
+
+    def _loop():
+        last_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        while True:
+            time.sleep(interval)
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            if mtime is not None and mtime != last_mtime:
+                last_mtime = mtime
+                print(f"[{store.name}] phát hiện dữ liệu mới ({path}), đang nạp lại đồ thị...")
+                store.reload_in_background()
+
+    threading.Thread(target=_loop, name=f"graph-watch-{store.name}", daemon=True).start()
+
+
+def _load_default():
+    from src.app.core.config import GRAPH_SOURCE
+    from src.database.load_database import load_graph_from_db, load_graph_from_export
+
+    return load_graph_from_export() if GRAPH_SOURCE == "arrow" else load_graph_from_db()
+
+
+graph_store = GraphStore(loader=_load_default)
@@ -0,0 +1,390 @@
+# src/services/live_traffic.py
+"""
+Tốc độ giao thông trực tiếp, cập nhật tại chỗ vào mảng thời gian đi của đồ thị đang phục vụ.
+
+- Mỗi phiên bản đồ thị có một LiveTraffic: mảng thời gian đi cơ sở, mảng thời gian đi trực tiếp
+  (cùng chỉ số cạnh với CompactGraph) và thời điểm quan sát của từng cạnh. Không sao chép đồ thị.
+- Cập nhật được áp theo lô, tra cạnh hàng loạt bằng tìm kiếm nhị phân trên khóa (u, v, key) đã sắp.
+  Quan sát cũ hơn LIVE_TRAFFIC_TTL_SECONDS hết hạn, cạnh quay về thời gian đi cơ sở.
+- Định tuyến dùng hệ số (trực tiếp / cơ sở) đã làm tròn theo bậc LIVE_TRAFFIC_FACTOR_STEP. Khi hệ số
+  làm tròn của cạnh nào đó đổi, `version` (weight version) tăng, nhiều nhất một lần mỗi
+  LIVE_TRAFFIC_PUBLISH_SECONDS; cache tuyến đường và các bước tiền xử lý dùng nó làm khóa.
+  Các hàm đăng ký qua subscribe nhận chỉ số các cạnh vừa đổi hệ số.
+
+Dòng cập nhật dạng CSV "u,v,key,speed_kph,timestamp" hoặc JSON
+{"u": ..., "v": ..., "key": ..., "speed": ..., "timestamp": ...}; timestamp là unix giây hoặc ISO 8601.
+Nguồn: "file:/path" (đọc nối tiếp như tail -f), "tcp://host:port" (mỗi kết nối gửi các dòng),
+hoặc một queue.Queue chứa các dòng.
+
+    python -m src.services.live_traffic --bench 200000        # đo thông lượng trên đồ thị graphml
+    python -m src.services.live_traffic --replay updates.csv  # áp một file cập nhật, in thống kê
+"""
+import argparse
+import json
+import queue
+import socketserver
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from src.app.core import metrics
+from src.app.core.config import LIVE_TRAFFIC_TTL_SECONDS, LIVE_TRAFFIC_BATCH_SIZE, LIVE_TRAFFIC_FLUSH_SECONDS, \
+    LIVE_TRAFFIC_FACTOR_STEP, LIVE_TRAFFIC_PUBLISH_SECONDS
+from .compact_graph import CompactGraph
+
+
+class LiveTraffic:
+    def __init__(self, compact: CompactGraph, ttl: float = LIVE_TRAFFIC_TTL_SECONDS, previous=None,
+                 factor_step: float = LIVE_TRAFFIC_FACTOR_STEP, publish_seconds: float = LIVE_TRAFFIC_PUBLISH_SECONDS):
+        """previous: LiveTraffic của phiên bản đồ thị trước, các quan sát còn hạn được chuyển sang."""
+        self.compact = compact
+        self.ttl = ttl
+        self.factor_step = factor_step
+        self.publish_seconds = publish_seconds
+        travel_time = compact.travel_time.astype(np.float32)
+        fallback = (compact.length / (30 / 3.6)).astype(np.float32)
+        self.baseline = np.where(np.isfinite(travel_time), travel_time, fallback)
+        self.travel_time = self.baseline.copy()         # float32 [E], giây
+        self.observed_at = np.full(compact.num_edges, np.nan)
+        self.factor = np.ones(compact.num_edges, dtype=np.float32)    # hệ số đang phục vụ (đã làm tròn)
+        self._target = self.factor.copy()                              # hệ số làm tròn theo quan sát mới nhất
+        self._pending = []                                             # các cạnh có _target khác factor
+        self._published_at = -np.inf
+        self.version = 0
+        self._lock = threading.Lock()
+        self._snapshot = (0, None)
+        self._listeners = []
+
+        # khóa (u_idx, v_idx, key) gộp thành một số int64, sắp tăng dần
+        self._key_base = int(compact.edge_key.max()) + 1 if compact.num_edges else 1
+        keys = self._pack(compact.edge_source, compact.edge_target, compact.edge_key)
+        self._key_order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._key_order]
+
+        if previous is not None:
+            self._carry_over(previous)
+
+    def _pack(self, u_idx, v_idx, key) -> np.ndarray:
+        n = self.compact.num_nodes
+        return (u_idx.astype(np.int64) * n + v_idx) * self._key_base + key
+
+    def edge_ids(self, u, v, key) -> np.ndarray:
+        """(u, v, key) theo osmid -> chỉ số cạnh, -1 nếu không có (vector)."""
+        u_idx = self.compact.node_indices(u)
+        v_idx = self.compact.node_indices(v)
+        key = np.asarray(key, dtype=np.int64)
+        valid = (u_idx >= 0) & (v_idx >= 0) & (key >= 0) & (key < self._key_base)
+        packed = self._pack(u_idx, v_idx, np.where(valid, key, 0))
+        pos = np.minimum(np.searchsorted(self._sorted_keys, packed), len(self._sorted_keys) - 1)
+        found = valid & (self._sorted_keys[pos] == packed) if len(self._sorted_keys) else valid & False
+        return np.where(found, self._key_order[pos], -1)
+
+    def _carry_over(self, previous: "LiveTraffic"):
+        with previous._lock:
+            edges = np.flatnonzero(np.isfinite(previous.observed_at))
+            speed = previous.compact.length[edges] / previous.travel_time[edges] * 3.6
+            timestamp = previous.observed_at[edges]
+        old = previous.compact
+        self.apply(old.node_osmid[old.edge_source[edges]], old.node_osmid[old.edge_target[edges]],
+                   old.edge_key[edges], speed, timestamp)
+
+    # ------------------------------------------------------------------
+    # Cập nhật
+    # ------------------------------------------------------------------
+
+    def subscribe(self, listener):
+        """listener(edges) được gọi (ngoài khóa) với chỉ số các cạnh vừa đổi thời gian đi."""
+        self._listeners.append(listener)
+
+    def _changed(self, edges: np.ndarray):
+        metrics.set_gauge("live_traffic_weight_version", self.version)
+        for listener in self._listeners:
+            listener(edges)
+
+    def _stage(self, edges: np.ndarray):
+        """Tính hệ số làm tròn của các cạnh vừa đổi thời gian đi; cạnh có hệ số khác bản đang phục vụ chờ công bố."""
+        baseline = self.baseline[edges]
+        ratio = np.divide(self.travel_time[edges], baseline, out=np.ones(len(edges)), where=baseline > 0)
+        if self.factor_step > 0:
+            ratio = np.power(1 + self.factor_step, np.rint(np.log(ratio) / np.log1p(self.factor_step)))
+        self._target[edges] = ratio
+        moved = edges[self._target[edges] != self.factor[edges]]
+        if len(moved):
+            self._pending.append(moved)
+
+    def _publish(self, force: bool = False) -> np.ndarray | None:
+        """Công bố các hệ số đang chờ (tăng version) nếu đã qua publish_seconds kể từ lần trước."""
+        now = time.monotonic()
+        if not self._pending or (not force and now - self._published_at < self.publish_seconds):
+            return None
+        edges = np.unique(np.concatenate(self._pending))
+        self._pending = []
+        edges = edges[self._target[edges] != self.factor[edges]]
+        if not len(edges):
+            return None
+        self.factor[edges] = self._target[edges]
+        self._published_at = now
+        self.version += 1
+        return edges
+
+    def apply(self, u, v, key, speed_kph, timestamp) -> int:
+        """Áp một lô quan sát; trả về số cạnh được cập nhật. Quan sát mới nhất của mỗi cạnh thắng."""
+        edges = self.edge_ids(u, v, key)
+        speed_kph = np.asarray(speed_kph, dtype=np.float64)
+        timestamp = np.asarray(timestamp, dtype=np.float64)
+        ok = (edges >= 0) & np.isfinite(speed_kph) & (speed_kph > 0) & np.isfinite(timestamp)
+        metrics.inc("live_traffic_updates_rejected", float((~ok).sum()))
+        edges, speed_kph, timestamp = edges[ok], speed_kph[ok], timestamp[ok]
+        if not len(edges):
+            return 0
+
+        # giữ quan sát mới nhất của mỗi cạnh trong lô
+        order = np.argsort(timestamp, kind="stable")[::-1]
+        _, first = np.unique(edges[order], return_index=True)
+        pick = order[first]
+        edges, speed_kph, timestamp = edges[pick], speed_kph[pick], timestamp[pick]
+
+        with self._lock:
+            newer = ~(self.observed_at[edges] > timestamp)
+            edges, speed_kph, timestamp = edges[newer], speed_kph[newer], timestamp[newer]
+            if len(edges):
+                self.travel_time[edges] = self.compact.length[edges] / (speed_kph / 3.6)
+                self.observed_at[edges] = timestamp
+                self._stage(edges)
+            published = self._publish()
+        metrics.inc("live_traffic_updates_applied", float(len(edges)))
+        if published is not None:
+            self._changed(published)
+        return len(edges)
+
+    def expire(self, now: float = None) -> int:
+        """Đưa các cạnh có quan sát quá TTL về thời gian đi cơ sở; trả về số cạnh hết hạn."""
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = np.flatnonzero(self.observed_at < now - self.ttl)
+            if len(stale):
+                self.travel_time[stale] = self.baseline[stale]
+                self.observed_at[stale] = np.nan
+                self._stage(stale)
+            published = self._publish()
+        if len(stale):
+            metrics.inc("live_traffic_expired", float(len(stale)))
+        if published is not None:
+            self._changed(published)
+        return len(stale)
+
+    def flush(self) -> int:
+        """Công bố ngay các hệ số đang chờ, bỏ qua publish_seconds; trả về số cạnh đổi hệ số."""
+        with self._lock:
+            published = self._publish(force=True)
+        if published is None:
+            return 0
+        self._changed(published)
+        return len(published)
+
+    # ------------------------------------------------------------------
+    # Đọc
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> tuple:
+        """
+        (weight version, hệ số thời gian đi trực tiếp / cơ sở theo cạnh, đã làm tròn) — None nếu mọi cạnh
+        đang ở thời gian đi cơ sở. Bản sao hệ số được tạo một lần cho mỗi version.
+        """
+        with self._lock:
+            version, factor = self._snapshot
+            if version != self.version:
+                factor = self.factor.copy() if (self.factor != 1).any() else None
+                self._snapshot = (self.version, factor)
+            return self._snapshot
+
+    def stats(self) -> dict:
+        with self._lock:
+            observed = np.isfinite(self.observed_at)
+            return {
+                "weight_version": self.version,
+                "observed_edges": int(observed.sum()),
+                "adjusted_edges": int((self.factor != 1).sum()),
+                "pending_edges": len(np.unique(np.concatenate(self._pending))) if self._pending else 0,
+                "oldest_observation": float(np.nanmin(self.observed_at)) if observed.any() else None,
+                "ttl_seconds": self.ttl,
+            }
+
+
+def build_live_traffic(compact: CompactGraph, previous=None) -> LiveTraffic:
+    return LiveTraffic(compact, previous=previous)
+
+
+# ======================================================================
+# Đọc dòng cập nhật
+# ======================================================================
+
+def _timestamp(value) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_lines(lines: list) -> tuple:
+    """Các dòng CSV / JSON -> (u, v, key, speed, timestamp) dạng mảng; bỏ qua dòng hỏng."""
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            if line.startswith("{"):
+                d = json.loads(line)
+                rows.append((int(d["u"]), int(d["v"]), int(d.get("key", 0)), float(d["speed"]),
+                             _timestamp(d.get("timestamp", time.time()))))
+            else:
+                u, v, key, speed, ts = line.split(",")[:5]
+                rows.append((int(u), int(v), int(key), float(speed), _timestamp(ts)))
+        except (ValueError, KeyError, TypeError):
+            metrics.inc("live_traffic_lines_malformed")
+    if not rows:
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty.astype(np.int64), empty, empty
+    u, v, key, speed, ts = zip(*rows)
+    return (np.array(u, dtype=np.int64), np.array(v, dtype=np.int64), np.array(key, dtype=np.int64),
+            np.array(speed), np.array(ts))
+
+
+def _follow_file(path: str, lines: queue.Queue, stop: threading.Event):
+    """Đọc file từ đầu rồi tiếp tục đọc phần được ghi thêm (như tail -f)."""
+    while not Path(path).exists() and not stop.is_set():
+        time.sleep(1)
+    with open(path, "r", encoding="utf-8") as f:
+        while not stop.is_set():
+            line = f.readline()
+            if line:
+                lines.put(line)
+            else:
+                time.sleep(0.2)
+
+
+def _serve_tcp(address: str, lines: queue.Queue, stop: threading.Event):
+    host, port = address.rsplit(":", 1)
+
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                lines.put(raw.decode("utf-8", "replace"))
+
+    class _Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    with _Server((host, int(port)), _Handler) as server:
+        print(f"[traffic] nhận cập nhật tại tcp://{host}:{port}")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stop.wait()
+        server.shutdown()
+
+
+def open_source(source, stop: threading.Event) -> queue.Queue:
+    """Nguồn -> queue các dòng (thread đọc chạy nền). Truyền queue.Queue thì dùng trực tiếp."""
+    if isinstance(source, queue.Queue):
+        return source
+    lines = queue.Queue(maxsize=LIVE_TRAFFIC_BATCH_SIZE * 10)
+    if source.startswith("tcp://"):
+        target, args = _serve_tcp, (source[len("tcp://"):], lines, stop)
+    else:
+        path = source[len("file:"):] if source.startswith("file:") else source
+        target, args = _follow_file, (path, lines, stop)
+    threading.Thread(target=target, args=args, name="traffic-source", daemon=True).start()
+    return lines
+
+
+def consume(lines: queue.Queue, get_traffic, stop: threading.Event,
+            batch_size: int = LIVE_TRAFFIC_BATCH_SIZE, flush_seconds: float = LIVE_TRAFFIC_FLUSH_SECONDS):
+    """
+    Gom dòng thành lô (tối đa batch_size hoặc sau flush_seconds) rồi áp vào get_traffic();
+    đồng thời cho các quan sát quá hạn hết hạn. get_traffic trả về LiveTraffic hiện tại hoặc None.
+    """
+    batch, deadline = [], time.monotonic() + flush_seconds
+    while not stop.is_set():
+        try:
+            batch.append(lines.get(timeout=max(deadline - time.monotonic(), 0.01)))
+        except queue.Empty:
+            pass
+        if len(batch) < batch_size and time.monotonic() < deadline:
+            continue
+        traffic = get_traffic()
+        if traffic is not None:
+            started = time.perf_counter()
+            applied = traffic.apply(*parse_lines(batch)) if batch else 0
+            traffic.expire()
+            if batch:
+                metrics.observe("live_traffic_batch_seconds", time.perf_counter() - started)
+                metrics.observe("live_traffic_batch_edges", applied)
+        batch, deadline = [], time.monotonic() + flush_seconds
+
+
+def start_ingest(store, source) -> threading.Event:
+    """Bắt đầu nhận cập nhật vào LiveTraffic của phiên bản đồ thị hiện tại; trả về Event để dừng."""
+    stop = threading.Event()
+    lines = open_source(source, stop)
+
+    def current_traffic():
+        version = store.current
+        return version.indexes.get("live_traffic") if version is not None else None
+
+    threading.Thread(target=consume, args=(lines, current_traffic, stop), name="traffic-ingest",
+                     daemon=True).start()
+    print(f"[traffic] đang nhận cập nhật tốc độ từ {source}")
+    return stop
+
+
+# ======================================================================
+# Lệnh độc lập
+# ======================================================================
+
+def _bench(traffic: LiveTraffic, count: int):
+    c = traffic.compact
+    rng = np.random.default_rng(0)
+    edges = rng.integers(0, c.num_edges, count)
+    u = c.node_osmid[c.edge_source[edges]]
+    v = c.node_osmid[c.edge_target[edges]]
+    lines = [f"{a},{b},{k},{s:.1f},{t:.3f}" for a, b, k, s, t in zip(
+        u.tolist(), v.tolist(), c.edge_key[edges].tolist(), rng.uniform(5, 60, count).tolist(),
+        (time.time() + np.arange(count) * 1e-3).tolist())]
+
+    started = time.perf_counter()
+    parsed = parse_lines(lines)
+    parse_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for i in range(0, count, LIVE_TRAFFIC_BATCH_SIZE):
+        traffic.apply(*(a[i:i + LIVE_TRAFFIC_BATCH_SIZE] for a in parsed))
+    apply_seconds = time.perf_counter() - started
+    print(f"{count} cập nhật: parse {count / parse_seconds:,.0f}/s, áp {count / apply_seconds:,.0f}/s, "
+          f"tổng {count / (parse_seconds + apply_seconds):,.0f}/s")
+    print(traffic.stats())
+
+
+def main(argv=None):
+    import osmnx as ox
+    from .compact_graph import build_compact_graph
+
+    parser = argparse.ArgumentParser(description="Áp / đo thông lượng cập nhật tốc độ trực tiếp")
+    parser.add_argument("--graphml", default="src/app/models/graph/vinhtuy.graphml")
+    parser.add_argument("--bench", type=int, metavar="N", help="đo với N cập nhật ngẫu nhiên")
+    parser.add_argument("--replay", help="áp các dòng trong file cập nhật")
+    args = parser.parse_args(argv)
+
+    G = ox.project_graph(ox.load_graphml(args.graphml), to_crs="EPSG:4326")
+    traffic = LiveTraffic(build_compact_graph(G))
+    if args.bench:
+        _bench(traffic, args.bench)
+    if args.replay:
+        with open(args.replay, "r", encoding="utf-8") as f:
+            applied = traffic.apply(*parse_lines(f.readlines()))
+        print(f"đã áp {applied} cạnh; {traffic.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
 # src/services/map_data_service.py
 
 from sqlalchemy import text
-import geopandas as gpd
 import json
-import osmnx as ox
+import math
 import networkx as nx
-from src.app.core.config import engine
-from shapely.geometry import box
+from shapely.geometry import shape
+from src.app.core import lazy_imports
+from src.app.core.database import engine, get_async_engine
 
 BUFFER_METERS_AROUND_POINT = 20.0
 
@@ -20,69 +20,150 @@ def get_subgraph_from_bbox(bbox: tuple) -> nx.MultiDiGraph:
     Tải một phần đồ thị (nodes, edges) từ PostGIS dựa trên bounding box.
     bbox: (min_lon, min_lat, max_lon, max_lat)
     """
-    bbox_polygon = box(*bbox)
-    bbox_wkt = bbox_polygon.wkt
+    from src.database.load_database import (
+        read_geo_table, normalize_gdfs_to_wgs84, NODE_COLUMNS, EDGE_COLUMNS
+    )
 
-    nodes_sql = """
-        SELECT * FROM nodes 
-        WHERE ST_Intersects(geometry, ST_GeomFromText(%(bbox_wkt)s, 4326));
-    """
-    edges_sql = """
-        SELECT * FROM edges 
-        WHERE ST_Intersects(geometry, ST_GeomFromText(%(bbox_wkt)s, 4326));
-    """
+    params = dict(zip(("min_lon", "min_lat", "max_lon", "max_lat"), bbox))
+    # toán tử && dùng trực tiếp chỉ mục GIST trên geometry
+    where = "g.geometry && ST_MakeEnvelope(%(min_lon)s, %(min_lat)s, %(max_lon)s, %(max_lat)s, 4326)"
 
     with engine.connect() as conn:
-        nodes_gdf = gpd.read_postgis(
-            nodes_sql, conn, params={"bbox_wkt": bbox_wkt},
-            index_col='osmid', geom_col='geometry'
-        )
-        edges_gdf = gpd.read_postgis(
-            edges_sql, conn, params={"bbox_wkt": bbox_wkt},
-            index_col=['u', 'v', 'key'], geom_col='geometry'
+        nodes_gdf = read_geo_table(conn, "nodes", NODE_COLUMNS, where=where, params=params, index_col='osmid')
+        edges_gdf = read_geo_table(
+            conn, "edges", EDGE_COLUMNS, where=where, params=params, index_col=['u', 'v', 'key']
         )
 
     if nodes_gdf.empty or edges_gdf.empty:
-        return ox.MultiDiGraph()
+        return nx.MultiDiGraph()
 
-    nodes_gdf.set_crs("EPSG:4326", inplace=True)
-    edges_gdf.set_crs("EPSG:4326", inplace=True)
+    nodes_gdf, edges_gdf = normalize_gdfs_to_wgs84(nodes_gdf, edges_gdf)
+    nodes_gdf['x'] = nodes_gdf.geometry.x
+    nodes_gdf['y'] = nodes_gdf.geometry.y
+    # bỏ các cạnh có node cuối nằm ngoài bbox
+    edges_gdf = edges_gdf[
+        edges_gdf.index.get_level_values('u').isin(nodes_gdf.index)
+        & edges_gdf.index.get_level_values('v').isin(nodes_gdf.index)
+    ]
 
-    return ox.graph_from_gdfs(nodes_gdf, edges_gdf)
+    return lazy_imports.load("osmnx").graph_from_gdfs(nodes_gdf, edges_gdf)
 
 
-def _graph_bounds(G: nx.MultiDiGraph) -> tuple:
+def get_tiles_from_db(tile_keys: list) -> tuple:
     """
-    Trả về (min_lat, min_lon, max_lat, max_lon) dựa trên thuộc tính node 'y' (lat) và 'x' (lon).
+    Tải nodes/edges thuộc các ô lưới (tile_x, tile_y) cho trước từ PostGIS.
+    Cạnh được gán vào ô của node đầu (u), xem save_graph.py.
+    Trả về (nodes_gdf, edges_gdf) ở WGS84, có cột tile_x/tile_y để tách theo ô.
     """
-    ys = [data.get('y') for _, data in G.nodes(data=True) if data.get('y') is not None]
-    xs = [data.get('x') for _, data in G.nodes(data=True) if data.get('x') is not None]
-    if not xs or not ys:
-        return 0.0, 0.0, 0.0, 0.0
-    return min(ys), min(xs), max(ys), max(xs)
+    from src.database.load_database import (
+        read_geo_table, normalize_gdfs_to_wgs84, NODE_COLUMNS, EDGE_COLUMNS, TILE_COLUMNS
+    )
+
+    params = {
+        "xs": [int(tx) for tx, _ in tile_keys],
+        "ys": [int(ty) for _, ty in tile_keys],
+    }
+    joins = "JOIN unnest(%(xs)s::int[], %(ys)s::int[]) AS t(x, y) ON g.tile_x = t.x AND g.tile_y = t.y"
+
+    with engine.connect() as conn:
+        nodes_gdf = read_geo_table(conn, "nodes", NODE_COLUMNS + TILE_COLUMNS, joins=joins, params=params)
+        edges_gdf = read_geo_table(conn, "edges", EDGE_COLUMNS + TILE_COLUMNS, joins=joins, params=params)
+
+    return normalize_gdfs_to_wgs84(nodes_gdf, edges_gdf)
+
+
+_EARTH_RADIUS_M = 6371008.8
+
+
+class NodeIndex:
+    """Chỉ mục không gian các node (BallTree haversine), dựng một lần cho mỗi phiên bản đồ thị."""
+
+    def __init__(self, G: nx.MultiDiGraph = None, node_ids=None, coords=None):
+        """Từ đồ thị G, hoặc trực tiếp từ node_ids và coords [N, 2] (lat, lon) (vd. của CompactGraph)."""
+        import numpy as np
+        BallTree = lazy_imports.load("sklearn.neighbors").BallTree
+
+        if G is not None:
+            node_ids = list(G.nodes)
+            coords = [[data['y'], data['x']] for _, data in G.nodes(data=True)]
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        # sắp theo osmid để tra tọa độ bằng tìm kiếm nhị phân
+        order = np.argsort(node_ids, kind="stable")
+        self.node_ids, self.coords = node_ids[order], coords[order]
+        self._tree = BallTree(np.radians(self.coords), metric='haversine') if len(self.coords) else None
+
+    def location(self, node_id: int) -> tuple:
+        """(lat, lon) của một node."""
+        import numpy as np
 
+        lat, lon = self.coords[np.searchsorted(self.node_ids, node_id)]
+        return float(lat), float(lon)
 
-def find_nearest_node(G: nx.MultiDiGraph, lat: float, lon: float) -> int:
+    def nearest(self, lat: float, lon: float, allowed=None):
+        """
+        osmid của node gần nhất; allowed(osmid) -> bool giới hạn tập node được chọn
+        (vd. cùng thành phần liên thông). Trả về None nếu không có node nào thỏa mãn.
+        """
+        import numpy as np
+
+        point = np.radians([[lat, lon]])
+        if allowed is None:
+            _, idx = self._tree.query(point, k=1)
+            return self.node_ids[idx[0][0]].item()
+
+        total = len(self.node_ids)
+        k = 8
+        while True:
+            k = min(k, total)
+            _, idx = self._tree.query(point, k=k)
+            for i in idx[0]:
+                node_id = self.node_ids[i].item()
+                if allowed(node_id):
+                    return node_id
+            if k == total:
+                return None
+            k *= 8
+
+
+    def nearest_many(self, lats: list, lons: list) -> tuple:
+        """(osmid, khoảng cách mét) của node gần nhất cho nhiều điểm trong một lượt truy vấn."""
+        import numpy as np
+
+        distances, idx = self._tree.query(np.radians(np.column_stack([lats, lons])), k=1)
+        return self.node_ids[idx[:, 0]].tolist(), (distances[:, 0] * _EARTH_RADIUS_M).tolist()
+
+
+def build_node_index(G: nx.MultiDiGraph, compact=None) -> NodeIndex:
+    """Dựng từ CompactGraph nếu có (không cần tới đồ thị NetworkX), ngược lại từ G."""
+    if compact is not None:
+        import numpy as np
+
+        return NodeIndex(node_ids=compact.node_osmid, coords=np.column_stack([compact.node_y, compact.node_x]))
+    return NodeIndex(G)
+
+
+def find_nearest_node(G: nx.MultiDiGraph, lat: float, lon: float, node_index: NodeIndex = None,
+                      allowed=None) -> int:
     """
     Tìm osmid của node gần nhất với một cặp tọa độ (lat, lon) trong đồ thị G.
+    node_index: chỉ mục dựng sẵn cho G (cùng tập node), tránh dựng lại cây mỗi lần gọi;
+    khi có node_index thì G không được đọc tới (có thể là None).
+    allowed: hàm osmid -> bool giới hạn các node được snap tới (cần node_index).
     """
-    from geopy.distance import geodesic
-
-    # 1) kiểm tra điểm đầu vào có nằm trong phạm vi đồ thị với padding nhỏ hay không
-    min_lat, min_lon, max_lat, max_lon = _graph_bounds(G)
-    padding_deg = 0.03  # ~2-3km quanh biên, tránh chặn sớm trước bước snap
-    if not (
-        (min_lat - padding_deg) <= lat <= (max_lat + padding_deg)
-        and (min_lon - padding_deg) <= lon <= (max_lon + padding_deg)
-    ):
-        # Không chặn sớm; vẫn thử snap rồi kiểm tra khoảng cách thực tế
-        pass
-
-    # 2) tìm node gần nhất
-    nearest_node_id = ox.nearest_nodes(G, X=lon, Y=lat)
-    node_data = G.nodes[nearest_node_id]
-    node_lat = node_data['y']
-    node_lon = node_data['x']
+    geodesic = lazy_imports.load("geopy.distance").geodesic
+
+    # tìm node gần nhất; không chặn sớm theo khung bao đồ thị, kiểm tra khoảng cách thực tế sau khi snap
+    if node_index is not None and node_index._tree is not None:
+        nearest_node_id = node_index.nearest(lat, lon, allowed)
+        if nearest_node_id is None:
+            raise ValueError("Không tìm thấy đoạn đường phù hợp gần địa chỉ đã chọn.")
+        node_lat, node_lon = node_index.location(nearest_node_id)
+    else:
+        nearest_node_id = lazy_imports.load("osmnx").nearest_nodes(G, X=lon, Y=lat)
+        node_data = G.nodes[nearest_node_id]
+        node_lat = node_data['y']
+        node_lon = node_data['x']
     # Nếu toạ độ node không hợp lệ (do CRS/x,y bị đảo), thử hoán đổi
     if abs(node_lat) > 90 or abs(node_lon) > 180:
         node_lat, node_lon = node_lon, node_lat
@@ -103,6 +184,11 @@ def find_nearest_node(G: nx.MultiDiGraph, lat: float, lon: float) -> int:
 # Các hàm xử lý vùng cấm và truy vấn vùng bị ảnh hưởng
 # ======================================================================
 
+def _meters_to_degrees(meters: float, lat: float) -> float:
+    """Quy đổi (dư) khoảng cách mét sang độ tại vĩ độ lat, dùng cho lọc thô theo bbox."""
+    return meters / (111320.0 * max(math.cos(math.radians(lat)), 0.01))
+
+
 def _get_affected_edges_sql_clause(input_geojson: dict) -> tuple | None:
     """
     Xây dựng câu lệnh SQL và tham số lọc các cạnh (edges) bị ảnh hưởng
@@ -113,10 +199,7 @@ def _get_affected_edges_sql_clause(input_geojson: dict) -> tuple | None:
         return None
 
     try:
-        gdf = gpd.GeoDataFrame.from_features([
-            {"type": "Feature", "geometry": input_geojson, "properties": {}}
-        ])
-        geom_wkt = gdf.geometry.to_wkt().iloc[0]
+        geom_wkt = shape(input_geojson).wkt
     except Exception:
         return None
 
@@ -125,17 +208,39 @@ def _get_affected_edges_sql_clause(input_geojson: dict) -> tuple | None:
     if geom_type in ["Polygon", "LineString"]:
         sql_where_clause = "ST_Intersects(geometry, ST_GeomFromText(:geom_wkt, 4326))"
     elif geom_type == "Point":
+        # Lọc thô bằng ST_DWithin trên geometry (độ) để dùng được chỉ mục GIST,
+        # sau đó mới kiểm tra chính xác theo mét bằng geography trên tập nhỏ còn lại
         sql_where_clause = (
-            "ST_DWithin(geometry::geography, "
+            "ST_DWithin(geometry, ST_GeomFromText(:geom_wkt, 4326), :buffer_deg) "
+            "AND ST_DWithin(geometry::geography, "
             "ST_GeomFromText(:geom_wkt, 4326)::geography, :buffer)"
         )
         params["buffer"] = BUFFER_METERS_AROUND_POINT
+        params["buffer_deg"] = _meters_to_degrees(BUFFER_METERS_AROUND_POINT, input_geojson["coordinates"][1])
     else:
         return None
 
     return sql_where_clause, params
 
 
+def _collected_geometry_query(sql_where_clause: str, params: dict) -> tuple:
+    sql = text(f"""
+        SELECT ST_AsGeoJSON(ST_Collect(geometry)) AS collected_geom
+        FROM edges
+        WHERE {sql_where_clause};
+    """)
+    return sql, params
+
+
+def _edge_ids_query(sql_where_clause: str, params: dict) -> tuple:
+    sql = text(f"""
+        SELECT u, v, key
+        FROM edges
+        WHERE {sql_where_clause};
+    """)
+    return sql, params
+
+
 def get_affected_edges_by_geometry(input_geojson: dict) -> dict | None:
     """
     Trả về GeoJSON của các edges bị ảnh hưởng (dùng để hiển thị preview).
@@ -144,12 +249,7 @@ def get_affected_edges_by_geometry(input_geojson: dict) -> dict | None:
     if not clause_tuple:
         return None
 
-    sql_where_clause, params = clause_tuple
-    sql = text(f"""
-        SELECT ST_AsGeoJSON(ST_Collect(geometry)) AS collected_geom
-        FROM edges
-        WHERE {sql_where_clause};
-    """)
+    sql, params = _collected_geometry_query(*clause_tuple)
 
     with engine.connect() as conn:
         result = conn.execute(sql, params).scalar_one_or_none()
@@ -165,14 +265,225 @@ def get_affected_edge_ids(input_geojson: dict) -> list:
     if not clause_tuple:
         return []
 
-    sql_where_clause, params = clause_tuple
-    sql = text(f"""
-        SELECT u, v, key
-        FROM edges
-        WHERE {sql_where_clause};
-    """)
+    sql, params = _edge_ids_query(*clause_tuple)
 
     with engine.connect() as conn:
         rows = conn.execute(sql, params).fetchall()
 
     return [(row.u, row.v, row.key) for row in rows]
+
+
+# ======================================================================
+# Phiên bản theo lô: nhiều vùng trong một lượt truy vấn
+# ======================================================================
+
+# Vùng dạng đường/đa giác dùng ST_Intersects; vùng dạng điểm dùng bán kính BUFFER_METERS_AROUND_POINT
+_INTERSECT_TYPES = ("Polygon", "MultiPolygon", "LineString", "MultiLineString")
+
+# CTE dựng bảng tạm các vùng từ hai mảng tham số (mỗi phần tử là một vùng, idx bắt đầu từ 1)
+_ZONES_CTE = """
+    WITH zones AS (
+        SELECT z.idx, ST_GeomFromText(z.wkt, 4326) AS geom, z.buffer_deg
+        FROM unnest(CAST(:wkts AS text[]), CAST(:buffer_degs AS float8[]))
+             WITH ORDINALITY AS z(wkt, buffer_deg, idx)
+    ),
+    affected AS (
+        SELECT zones.idx, e.u, e.v, e.key, e.geometry
+        FROM zones JOIN edges e
+          ON zones.buffer_deg IS NULL AND ST_Intersects(e.geometry, zones.geom)
+        UNION ALL
+        SELECT zones.idx, e.u, e.v, e.key, e.geometry
+        FROM zones JOIN edges e
+          ON zones.buffer_deg IS NOT NULL
+         AND ST_DWithin(e.geometry, zones.geom, zones.buffer_deg)
+         AND ST_DWithin(e.geometry::geography, zones.geom::geography, :buffer)
+    )
+"""
+
+
+_BATCH_IDS_SQL = text(_ZONES_CTE + "SELECT idx, u, v, key FROM affected;")
+_BATCH_COLLECTED_SQL = text(
+    _ZONES_CTE + "SELECT idx, ST_AsGeoJSON(ST_Collect(geometry)) AS collected_geom FROM affected GROUP BY idx;"
+)
+
+
+def _group_edge_ids(rows, positions: list, grouped: list) -> list:
+    for row in rows:
+        grouped[positions[row.idx - 1]].append((row.u, row.v, row.key))
+    return grouped
+
+
+def _group_collected(rows, positions: list, collected: list) -> list:
+    for row in rows:
+        if row.collected_geom:
+            collected[positions[row.idx - 1]] = json.loads(row.collected_geom)
+    return collected
+
+
+def _zones_params(input_geojsons: list) -> tuple:
+    """
+    Chuyển danh sách GeoJSON (geometry hoặc Feature) thành tham số mảng cho _ZONES_CTE.
+    Trả về (params, positions) với positions[i] là vị trí trong input của vùng thứ i+1 được gửi đi;
+    vùng không hợp lệ hoặc không hỗ trợ bị bỏ qua.
+    """
+    wkts, buffer_degs, positions = [], [], []
+    for position, geojson in enumerate(input_geojsons):
+        geom_data = geojson.get("geometry", geojson) if isinstance(geojson, dict) else None
+        if not geom_data:
+            continue
+        try:
+            geom = shape(geom_data)
+        except Exception:
+            continue
+        if geom.is_empty:
+            continue
+        if geom.geom_type in _INTERSECT_TYPES:
+            buffer_deg = None
+        elif geom.geom_type == "Point":
+            buffer_deg = _meters_to_degrees(BUFFER_METERS_AROUND_POINT, geom.y)
+        else:
+            continue
+        wkts.append(geom.wkt)
+        buffer_degs.append(buffer_deg)
+        positions.append(position)
+
+    params = {"wkts": wkts, "buffer_degs": buffer_degs, "buffer": BUFFER_METERS_AROUND_POINT}
+    return params, positions
+
+
+def get_affected_edge_ids_batch(input_geojsons: list) -> list:
+    """
+    Phiên bản theo lô của get_affected_edge_ids: gửi tất cả vùng trong một round trip.
+    Trả về danh sách cùng thứ tự với input, phần tử i là [(u, v, key), ...] của vùng thứ i.
+    """
+    grouped = [[] for _ in input_geojsons]
+    params, positions = _zones_params(input_geojsons)
+    if not positions:
+        return grouped
+
+    with engine.connect() as conn:
+        rows = conn.execute(_BATCH_IDS_SQL, params).fetchall()
+
+    return _group_edge_ids(rows, positions, grouped)
+
+
+def get_affected_edges_by_geometry_batch(input_geojsons: list) -> list:
+    """
+    Phiên bản theo lô của get_affected_edges_by_geometry.
+    Trả về danh sách cùng thứ tự với input, phần tử i là GeoJSON gộp các cạnh của vùng thứ i (hoặc None).
+    """
+    collected = [None for _ in input_geojsons]
+    params, positions = _zones_params(input_geojsons)
+    if not positions:
+        return collected
+
+    with engine.connect() as conn:
+        rows = conn.execute(_BATCH_COLLECTED_SQL, params).fetchall()
+
+    return _group_collected(rows, positions, collected)
+
+
+# ======================================================================
+# Vector tile (ST_AsMVT), dùng ở chế độ tiled khi đồ thị không nằm trong bộ nhớ
+# ======================================================================
+
+_VECTOR_TILE_SQL = text("""
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS merc
+    ),
+    tile_edges AS (
+        SELECT e.u, e.v, e.key, e.highway, e.name, e.oneway, e.geometry,
+               ST_AsMVTGeom(ST_Transform(e.geometry, 3857), bounds.merc, :extent, :buffer, true) AS mvt_geom
+        FROM edges e, bounds
+        WHERE e.geometry && ST_Transform(bounds.merc, 4326)
+          AND (:detail OR e.highway = ANY(CAST(:major AS text[])))
+    ),
+    zones AS (
+        SELECT z.kind, z.id, ST_GeomFromText(z.wkt, 4326) AS geom
+        FROM unnest(CAST(:kinds AS text[]), CAST(:ids AS int[]), CAST(:wkts AS text[])) AS z(kind, id, wkt)
+    ),
+    zone_edges AS (
+        SELECT DISTINCT ON (zones.kind, t.u, t.v, t.key) zones.kind, zones.id AS zone, t.mvt_geom
+        FROM tile_edges t JOIN zones ON ST_Intersects(t.geometry, zones.geom)
+        WHERE t.mvt_geom IS NOT NULL
+        ORDER BY zones.kind, t.u, t.v, t.key, zones.id
+    )
+    SELECT
+        COALESCE((SELECT ST_AsMVT(r, 'roads', :extent, 'mvt_geom')
+                  FROM (SELECT highway, name, oneway, mvt_geom FROM tile_edges WHERE mvt_geom IS NOT NULL) r), '')
+        || COALESCE((SELECT ST_AsMVT(f, 'flood', :extent, 'mvt_geom')
+                     FROM (SELECT zone, mvt_geom FROM zone_edges WHERE kind = 'flood') f), '')
+        || COALESCE((SELECT ST_AsMVT(b, 'ban', :extent, 'mvt_geom')
+                     FROM (SELECT zone, mvt_geom FROM zone_edges WHERE kind = 'ban') b), '')
+        AS tile;
+""")
+
+
+def get_vector_tile_from_db(z: int, x: int, y: int, zones: list, detail: bool, major: tuple,
+                            extent: int, buffer: int) -> bytes:
+    """
+    Vector tile z/x/y dựng bằng ST_AsMVT: lớp "roads" và các lớp "flood" / "ban" của zones
+    (các vùng của zone_state). detail=False chỉ lấy các loại đường trong major.
+    """
+    params = {
+        "z": z, "x": x, "y": y, "extent": extent, "buffer": buffer, "detail": detail, "major": list(major),
+        "kinds": [zone["kind"] for zone in zones],
+        "ids": [zone["id"] for zone in zones],
+        "wkts": [zone["shape"].wkt for zone in zones],
+    }
+    with engine.connect() as conn:
+        tile = conn.execute(_VECTOR_TILE_SQL, params).scalar_one_or_none()
+    return bytes(tile) if tile else b""
+
+
+# ======================================================================
+# Truy cập bất đồng bộ (asyncpg) cho các endpoint async,
+# không chiếm slot của threadpool trong lúc chờ database
+# ======================================================================
+
+async def get_affected_edges_by_geometry_async(input_geojson: dict) -> dict | None:
+    clause_tuple = _get_affected_edges_sql_clause(input_geojson)
+    if not clause_tuple:
+        return None
+
+    sql, params = _collected_geometry_query(*clause_tuple)
+    async with get_async_engine().connect() as conn:
+        result = (await conn.execute(sql, params)).scalar_one_or_none()
+
+    return json.loads(result) if result else None
+
+
+async def get_affected_edge_ids_async(input_geojson: dict) -> list:
+    clause_tuple = _get_affected_edges_sql_clause(input_geojson)
+    if not clause_tuple:
+        return []
+
+    sql, params = _edge_ids_query(*clause_tuple)
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(sql, params)).fetchall()
+
+    return [(row.u, row.v, row.key) for row in rows]
+
+
+async def get_affected_edge_ids_batch_async(input_geojsons: list) -> list:
+    grouped = [[] for _ in input_geojsons]
+    params, positions = _zones_params(input_geojsons)
+    if not positions:
+        return grouped
+
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(_BATCH_IDS_SQL, params)).fetchall()
+
+    return _group_edge_ids(rows, positions, grouped)
+
+
+async def get_affected_edges_by_geometry_batch_async(input_geojsons: list) -> list:
+    collected = [None for _ in input_geojsons]
+    params, positions = _zones_params(input_geojsons)
+    if not positions:
+        return collected
+
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(_BATCH_COLLECTED_SQL, params)).fetchall()
+
+    return _group_collected(rows, positions, collected)
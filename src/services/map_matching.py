@@ -0,0 +1,520 @@
+# src/services/map_matching.py
+"""
+Khớp vết GPS vào cạnh của đồ thị bằng mô hình Markov ẩn (HMM) và thuật toán Viterbi.
+
+- Trạng thái ẩn: vị trí trên một cạnh (cạnh, tỉ lệ từ đầu cạnh). Ứng viên của mỗi điểm GPS là các
+  cạnh trong bán kính MATCH_SEARCH_RADIUS_METERS, lấy từ STRtree của edge_index, giữ tối đa
+  MATCH_MAX_CANDIDATES cạnh gần nhất.
+- Xác suất quan sát: Gauss theo khoảng cách từ điểm GPS tới cạnh (độ lệch MATCH_GPS_SIGMA_METERS).
+- Xác suất chuyển: mũ theo |quãng đường trên đồ thị - khoảng cách đường chim bay| (Newson & Krumm).
+  Quãng đường trên đồ thị tính bằng các lượt tìm có giới hạn (paths_within) trên đồ thị rút gọn của
+  hồ sơ phương tiện, nên xe máy / ô tô vẫn tuân theo đường một chiều; kết quả được cache theo cặp node
+  vì các điểm liên tiếp thường lặp lại cùng cặp giao lộ.
+- Khi không có chuyển tiếp nào khả dĩ (mất tín hiệu, nhảy điểm), vết được tách thành nhiều đoạn.
+
+Chạy hàng loạt (đọc dạng luồng, nhiều tiến trình, kết quả JSONL theo đúng thứ tự đầu vào):
+
+    python -m src.services.map_matching traces.csv --out matched.jsonl --workers 8
+    python -m src.services.map_matching traces.jsonl --graphml src/app/models/graph/vinhtuy.graphml
+
+CSV cần các cột trace_id, lat, lon và tùy chọn timestamp (giây epoch hoặc ISO 8601), các dòng của
+cùng một vết nằm liền nhau. JSONL mỗi dòng một vết: {"id": ..., "points": [{"lat", "lon", "timestamp"}]}.
+"""
+import argparse
+import csv
+import json
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import numpy as np
+
+from src.app.core import metrics
+from src.app.core.config import MATCH_SEARCH_RADIUS_METERS, MATCH_MAX_CANDIDATES, MATCH_GPS_SIGMA_METERS, \
+    MATCH_BETA_METERS, MATCH_MAX_DETOUR_METERS, MATCH_MAX_SPEED_KPH, MATCH_TRANSITION_CACHE_SIZE
+from .compact_graph import CompactGraph, sampled_sizeof
+from .routing_engine import EdgeSpatialIndex
+from .routing_profiles import ProfileIndex
+
+_EARTH_RADIUS_M = 6371008.8
+_METERS_PER_DEGREE = 111320.0
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Khoảng cách (m), nhận số hoặc mảng NumPy."""
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * _EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+
+
+class TransitionCache:
+    """Cache LRU quãng đường (và đường đi) giữa hai node, khóa theo (node đầu, node cuối)."""
+
+    def __init__(self, max_entries: int = MATCH_TRANSITION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, a: int, b: int, limit: float):
+        """(quãng đường, đường đi) nếu đã biết với giới hạn này, ngược lại None."""
+        with self._lock:
+            entry = self._entries.get((a, b))
+            if entry is not None:
+                self._entries.move_to_end((a, b))
+        if entry is not None:
+            distance, path, searched = entry
+            # "không tới được" chỉ đúng với giới hạn không lớn hơn lần tìm trước
+            if distance != math.inf or searched >= limit:
+                metrics.inc("map_match_transition_cache_hits")
+                return (distance, path) if distance <= limit else (math.inf, None)
+        metrics.inc("map_match_transition_cache_misses")
+        return None
+
+    def put(self, a: int, b: int, distance: float, path, limit: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(a, b)] = (distance, path, limit)
+            self._entries.move_to_end((a, b))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def nbytes(self) -> int:
+        """Bộ nhớ ước lượng của các mục đang có (lấy mẫu, xem compact_graph.sampled_sizeof)."""
+        with self._lock:
+            entries = list(self._entries.items())
+        return sampled_sizeof(entries)
+
+
+class MapMatcher:
+    """Bộ khớp vết GPS cho một hồ sơ phương tiện trên một phiên bản đồ thị."""
+
+    def __init__(self, base: CompactGraph, edge_index: EdgeSpatialIndex, profile: ProfileIndex,
+                 radius: float = MATCH_SEARCH_RADIUS_METERS, max_candidates: int = MATCH_MAX_CANDIDATES,
+                 sigma: float = MATCH_GPS_SIGMA_METERS, beta: float = MATCH_BETA_METERS,
+                 max_detour: float = MATCH_MAX_DETOUR_METERS, max_speed_kph: float = MATCH_MAX_SPEED_KPH):
+        self.base = base
+        self.edge_index = edge_index
+        self.profile = profile
+        self.compact = profile.compact
+        self.router = profile.router
+        self.radius = radius
+        self.max_candidates = max_candidates
+        self.sigma = sigma
+        self.beta = beta
+        self.max_detour = max_detour
+        self.max_speed = max_speed_kph / 3.6
+        self.cache = TransitionCache()
+
+        compact = self.compact
+        self.allowed = np.isfinite(profile.weights)
+        self.length = compact.length.astype(np.float64)
+        # trọng số tìm kiếm là chiều dài (m), chỉ trên các cạnh hồ sơ được đi
+        self.distance_cost = np.where(self.allowed, self.length, np.inf)
+
+        # cạnh của đồ thị gốc (chỉ mục không gian) -> các cạnh của hồ sơ (hồ sơ đi bộ có thêm cạnh ngược)
+        if profile.edge_origin is None:
+            self.origin = np.arange(compact.num_edges)
+            self.reverse = np.zeros(compact.num_edges, dtype=bool)
+        else:
+            self.origin = profile.edge_origin
+            self.reverse = compact.edge_source != base.edge_source[self.origin]
+        self._by_origin = np.argsort(self.origin, kind="stable")
+        self._origin_ptr = np.searchsorted(self.origin[self._by_origin], np.arange(base.num_edges + 1))
+
+    # ------------------------------------------------------------------
+    # Ứng viên
+    # ------------------------------------------------------------------
+
+    def candidates(self, lats: np.ndarray, lons: np.ndarray) -> list:
+        """
+        Ứng viên của từng điểm: list các mảng (cạnh, tỉ lệ từ đầu cạnh, khoảng cách tới điểm GPS),
+        sắp theo khoảng cách tăng dần.
+        """
+        import shapely
+
+        n = len(lats)
+        points = shapely.points(lons, lats)
+        # bán kính theo độ, lấy theo chiều kinh độ (ngắn hơn) để không sót cạnh
+        radius_deg = self.radius / (_METERS_PER_DEGREE * max(0.1, math.cos(math.radians(float(np.abs(lats).max())))))
+        point_idx, base_edges = self.edge_index.tree.query(points, predicate="dwithin", distance=radius_deg)
+        geometries = self.edge_index.geometries[base_edges]
+        fraction = np.nan_to_num(shapely.line_locate_point(geometries, points[point_idx], normalized=True))
+        projected = shapely.get_coordinates(shapely.line_interpolate_point(geometries, fraction, normalized=True))
+        distance = _haversine(lats[point_idx], lons[point_idx], projected[:, 1], projected[:, 0])
+        near = distance <= self.radius
+        point_idx, base_edges, fraction, distance = point_idx[near], base_edges[near], fraction[near], distance[near]
+
+        # trải sang cạnh của hồ sơ (mỗi cạnh gốc có 1 hoặc 2 cạnh hồ sơ), bỏ cạnh hồ sơ không được đi
+        starts = self._origin_ptr[base_edges]
+        counts = self._origin_ptr[base_edges + 1] - starts
+        rows = np.repeat(np.arange(len(base_edges)), counts)
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        edges = self._by_origin[starts[rows] + within]
+        fraction = np.where(self.reverse[edges], 1 - fraction[rows], fraction[rows])
+        point_idx, distance = point_idx[rows], distance[rows]
+        ok = self.allowed[edges]
+        point_idx, edges, fraction, distance = point_idx[ok], edges[ok], fraction[ok], distance[ok]
+
+        # giữ max_candidates ứng viên gần nhất của mỗi điểm
+        order = np.lexsort((distance, point_idx))
+        sorted_points = point_idx[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_points, sorted_points, side="left")
+        order = order[rank < self.max_candidates]
+        bounds = np.searchsorted(point_idx[order], np.arange(n + 1))
+        return [
+            (edges[order[bounds[i]:bounds[i + 1]]], fraction[order[bounds[i]:bounds[i + 1]]],
+             distance[order[bounds[i]:bounds[i + 1]]])
+            for i in range(n)
+        ]
+
+    # ------------------------------------------------------------------
+    # Chuyển tiếp
+    # ------------------------------------------------------------------
+
+    def _node_distances(self, a: int, targets: list, limit: float, deadline=None) -> dict:
+        """Quãng đường (và đường đi) từ node a tới các node targets, qua cache rồi một lượt tìm có giới hạn."""
+        found, missing = {}, []
+        for b in targets:
+            entry = self.cache.get(a, b, limit)
+            if entry is None:
+                missing.append(b)
+            else:
+                found[b] = entry
+        if missing:
+            for b, entry in zip(missing, self.router.paths_within(a, missing, self.distance_cost, limit, deadline)):
+                self.cache.put(a, b, entry[0], entry[1], limit)
+                found[b] = entry
+        return found
+
+    def _transitions(self, prev: tuple, cur: tuple, gc: float, limit: float, deadline=None) -> np.ndarray:
+        """Ma trận log xác suất chuyển [ứng viên trước, ứng viên sau] (-inf nếu không khả dĩ)."""
+        c = self.compact
+        p_edges, p_fraction, _ = prev
+        c_edges, c_fraction, _ = cur
+        tail = (1 - p_fraction) * self.length[p_edges]     # phần còn lại của cạnh trước
+        head = c_fraction * self.length[c_edges]           # phần đã đi của cạnh sau
+        sources = c.edge_source[c_edges].tolist()
+        route = np.full((len(p_edges), len(c_edges)), np.inf)
+
+        starts = c.edge_target[p_edges].tolist()
+        for a in set(starts):
+            distances = self._node_distances(a, list(set(sources)), limit, deadline)
+            d = np.array([distances[b][0] for b in sources])
+            rows = [i for i, node in enumerate(starts) if node == a]
+            route[rows] = tail[rows, None] + d[None, :] + head[None, :]
+
+        # cùng một cạnh, đi tiếp về phía trước (cho phép lùi chút ít do nhiễu GPS)
+        same = p_edges[:, None] == c_edges[None, :]
+        forward = (c_fraction[None, :] - p_fraction[:, None]) * self.length[c_edges][None, :]
+        along = same & (forward >= -self.sigma)
+        route[along] = np.maximum(forward[along], 0.0)
+
+        route[route > limit] = np.inf
+        with np.errstate(invalid="ignore"):
+            return np.where(np.isfinite(route), -np.abs(route - gc) / self.beta, -np.inf)
+
+    def _route_between(self, prev: tuple, cur: tuple) -> list:
+        """Các cạnh đi qua từ ứng viên prev tới cur (không gồm cạnh của prev)."""
+        (pe, pf), (ce, cf) = prev, cur
+        c = self.compact
+        if pe == ce and (cf - pf) * self.length[ce] >= -self.sigma:
+            return []
+        a, b = int(c.edge_target[pe]), int(c.edge_source[ce])
+        entry = self.cache.get(a, b, math.inf)
+        if entry is None or entry[1] is None:
+            entry = self.router.paths_within(a, [b], self.distance_cost, math.inf)[0]
+        return list(entry[1] or []) + [ce]
+
+    # ------------------------------------------------------------------
+    # Viterbi
+    # ------------------------------------------------------------------
+
+    def match(self, lats, lons, times=None, deadline=None) -> dict:
+        """
+        Khớp một vết. times: giây epoch của từng điểm (hoặc None).
+        Trả về {"segments": [...], "unmatched": [chỉ số điểm không có ứng viên], "skipped": [...]}.
+        Mỗi đoạn gồm "points" (chỉ số điểm, cạnh, tỉ lệ, khoảng cách) và "edges" (dãy cạnh đã đi qua).
+        """
+        started = time.perf_counter()
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        segments, unmatched, skipped = [], [], []
+        if not len(lats):
+            return {"segments": segments, "unmatched": unmatched, "skipped": skipped}
+        candidates = self.candidates(lats, lons)
+
+        steps = []          # [(chỉ số điểm, ứng viên, điểm số, con trỏ ngược)]
+        last = None         # chỉ số điểm được dùng gần nhất của đoạn hiện tại
+        for i, cand in enumerate(candidates):
+            if deadline is not None:
+                deadline.check()
+            if not len(cand[0]):
+                unmatched.append(i)
+                continue
+            emission = -0.5 * (cand[2] / self.sigma) ** 2
+            if last is None:
+                steps.append((i, cand, emission, None))
+                last = i
+                continue
+
+            gc = float(_haversine(lats[last], lons[last], lats[i], lons[i]))
+            if gc < 2 * self.sigma:
+                skipped.append(i)   # điểm đứng yên / quá sát điểm trước: không thêm thông tin
+                continue
+            limit = gc + self.max_detour
+            if times is not None and times[i] is not None and times[last] is not None:
+                limit = min(limit, self.max_speed * max(0.0, times[i] - times[last]) + 2 * self.radius)
+            scores = steps[-1][2][:, None] + self._transitions(steps[-1][1], cand, gc, limit, deadline)
+            back = scores.argmax(axis=0)
+            best = scores[back, np.arange(len(back))]
+            if not np.isfinite(best).any():
+                # không chuyển tiếp được: đóng đoạn hiện tại, bắt đầu đoạn mới từ điểm này
+                segments.append(self._backtrack(steps))
+                metrics.inc("map_match_breaks")
+                steps = [(i, cand, emission, None)]
+            else:
+                steps.append((i, cand, best + emission, back))
+            last = i
+        if steps:
+            segments.append(self._backtrack(steps))
+
+        metrics.observe("map_match_seconds", time.perf_counter() - started)
+        metrics.inc("map_match_points", len(lats))
+        return {"segments": segments, "unmatched": unmatched, "skipped": skipped}
+
+    def _backtrack(self, steps: list) -> dict:
+        chosen = [int(np.argmax(steps[-1][2]))]
+        for _, _, _, back in reversed(steps[1:]):
+            chosen.append(int(back[chosen[-1]]))
+        chosen.reverse()
+
+        points, edges, prev = [], [], None
+        for (i, (cand_edges, fraction, distance), _, _), k in zip(steps, chosen):
+            state = (int(cand_edges[k]), float(fraction[k]))
+            edges.extend([state[0]] if prev is None else self._route_between(prev, state))
+            points.append({"index": i, "edge": state[0], "fraction": state[1], "distance": float(distance[k])})
+            prev = state
+        return {"points": points, "edges": edges}
+
+    # ------------------------------------------------------------------
+    # Kết quả
+    # ------------------------------------------------------------------
+
+    def edge_tuple(self, e: int) -> list:
+        """(u, v, key) của cạnh trên đồ thị gốc (cạnh ngược của hồ sơ đi bộ trả về cạnh gốc)."""
+        return list(self.base.edge_tuple(int(self.origin[e])))
+
+    def describe(self, result: dict) -> dict:
+        """Chuyển kết quả của match sang dạng JSON: cạnh (u, v, key), tọa độ điểm đã khớp, chiều dài."""
+        segments = []
+        for segment in result["segments"]:
+            points = []
+            for p in segment["points"]:
+                coords = self.compact.edge_coords(p["edge"])
+                lon, lat = _interpolate(coords, p["fraction"])
+                points.append({
+                    "index": p["index"], "lat": lat, "lon": lon, "edge": self.edge_tuple(p["edge"]),
+                    "offset": p["fraction"] * float(self.length[p["edge"]]), "distance": round(p["distance"], 2),
+                })
+            # độ dài đã đi: từ điểm khớp đầu tới điểm khớp cuối
+            first, last = segment["points"][0], segment["points"][-1]
+            length = float(self.length[segment["edges"]].sum()) - first["fraction"] * self.length[first["edge"]] \
+                - (1 - last["fraction"]) * self.length[last["edge"]]
+            segments.append({
+                "points": points,
+                "edges": [self.edge_tuple(e) for e in segment["edges"]],
+                "distance": max(0.0, float(length)),
+            })
+        return {"segments": segments, "unmatched": result["unmatched"], "skipped": result["skipped"]}
+
+
+def _interpolate(coords: np.ndarray, fraction: float) -> tuple:
+    """Điểm tại tỉ lệ fraction dọc theo đường gấp khúc (theo chiều dài xấp xỉ bằng độ)."""
+    steps = np.hypot(*np.diff(coords, axis=0).T)
+    total = steps.sum()
+    if total == 0:
+        return float(coords[0][0]), float(coords[0][1])
+    target = fraction * total
+    k = min(int(np.searchsorted(np.cumsum(steps), target)), len(steps) - 1)
+    before = steps[:k].sum()
+    t = (target - before) / steps[k] if steps[k] else 0.0
+    x, y = coords[k] + (coords[k + 1] - coords[k]) * t
+    return float(x), float(y)
+
+
+def build_matchers(base: CompactGraph, edge_index: EdgeSpatialIndex, profiles: dict) -> dict:
+    """Tên hồ sơ -> MapMatcher (dựng cùng phiên bản đồ thị; cache chuyển tiếp theo phiên bản)."""
+    return {name: MapMatcher(base, edge_index, profile) for name, profile in profiles.items()}
+
+
+# ----------------------------------------------------------------------
+# Chạy hàng loạt
+# ----------------------------------------------------------------------
+
+def _timestamp(value) -> float | None:
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        from .time_profiles import local_time
+
+        return local_time(datetime.fromisoformat(str(value))).timestamp()
+
+
+def read_traces(f, fmt: str):
+    """Đọc dạng luồng: sinh (id, lats, lons, times) cho từng vết, không giữ cả file trong bộ nhớ."""
+    if fmt == "jsonl":
+        for line in f:
+            if not line.strip():
+                continue
+            trace = json.loads(line)
+            points = trace["points"]
+            if points and isinstance(points[0], dict):
+                rows = [(p["lat"], p["lon"], p.get("timestamp")) for p in points]
+            else:
+                rows = [(p[0], p[1], p[2] if len(p) > 2 else None) for p in points]
+            yield trace.get("id"), [r[0] for r in rows], [r[1] for r in rows], [_timestamp(r[2]) for r in rows]
+        return
+
+    current, lats, lons, times = None, [], [], []
+    for row in csv.DictReader(f):
+        trace_id = row["trace_id"]
+        if trace_id != current and lats:
+            yield current, lats, lons, times
+            lats, lons, times = [], [], []
+        current = trace_id
+        lats.append(float(row["lat"]))
+        lons.append(float(row["lon"]))
+        times.append(_timestamp(row.get("timestamp")))
+    if lats:
+        yield current, lats, lons, times
+
+
+_worker_matcher = None
+
+
+def _load_matcher(graphml: str | None, profile_name: str) -> MapMatcher:
+    from .compact_graph import build_compact_graph
+    from .routing_profiles import PROFILES
+
+    if graphml:
+        import osmnx as ox
+
+        G = ox.project_graph(ox.load_graphml(graphml), to_crs="EPSG:4326")
+    else:
+        from src.app.core.config import GRAPH_SOURCE
+        from src.database.load_database import load_graph_from_db, load_graph_from_export
+
+        G = load_graph_from_export() if GRAPH_SOURCE == "arrow" else load_graph_from_db()
+    base = G if isinstance(G, CompactGraph) else build_compact_graph(G)
+    del G
+    return MapMatcher(base, EdgeSpatialIndex(base), ProfileIndex(base, PROFILES[profile_name]))
+
+
+def _init_worker(graphml: str | None, profile_name: str):
+    # với fork, tiến trình con đã có sẵn bộ khớp của tiến trình cha (chia sẻ copy-on-write)
+    global _worker_matcher
+    if _worker_matcher is None:
+        _worker_matcher = _load_matcher(graphml, profile_name)
+
+
+def _match_batch(batch: list) -> list:
+    lines = []
+    for trace_id, lats, lons, times in batch:
+        try:
+            result = _worker_matcher.describe(_worker_matcher.match(lats, lons, times))
+            result["id"] = trace_id
+        except Exception as e:
+            result = {"id": trace_id, "error": str(e)}
+        lines.append(json.dumps(result, ensure_ascii=False))
+    return lines
+
+
+def _batches(traces, size: int):
+    batch = []
+    for trace in traces:
+        batch.append(trace)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_batch(traces, out, graphml: str | None = None, profile_name: str = "car", workers: int = 1,
+              batch_size: int = 16) -> dict:
+    """
+    Khớp các vết từ iterator traces, ghi JSONL vào out theo đúng thứ tự đầu vào.
+    Số lô đang xử lý được giới hạn (workers * 4) nên bộ nhớ không phụ thuộc kích thước file.
+    """
+    import multiprocessing
+
+    global _worker_matcher
+    started = time.perf_counter()
+    _worker_matcher = _load_matcher(graphml, profile_name)
+    print(f"[map-matching] đã nạp đồ thị sau {time.perf_counter() - started:.1f}s, {workers} tiến trình",
+          file=sys.stderr)
+
+    count = 0
+    started = time.perf_counter()
+    if workers <= 1:
+        for batch in _batches(traces, batch_size):
+            for line in _match_batch(batch):
+                out.write(line + "\n")
+            count += len(batch)
+    else:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(graphml, profile_name)) as pool:
+            pending = deque()
+            for batch in _batches(traces, batch_size):
+                pending.append((len(batch), pool.apply_async(_match_batch, (batch,))))
+                while len(pending) >= workers * 4:
+                    size, job = pending.popleft()
+                    out.write("".join(line + "\n" for line in job.get()))
+                    count += size
+            while pending:
+                size, job = pending.popleft()
+                out.write("".join(line + "\n" for line in job.get()))
+                count += size
+
+    elapsed = time.perf_counter() - started
+    stats = {"traces": count, "seconds": round(elapsed, 2), "traces_per_second": round(count / elapsed, 1)
+             if elapsed else None}
+    print(f"[map-matching] {stats}", file=sys.stderr)
+    return stats
+
+
+def main(argv=None):
+    import os
+
+    parser = argparse.ArgumentParser(description="Khớp vết GPS vào đồ thị (HMM / Viterbi)")
+    parser.add_argument("input", help="file CSV hoặc JSONL các vết GPS ('-' = stdin, dạng CSV)")
+    parser.add_argument("--out", default="-", help="file JSONL kết quả ('-' = stdout)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="mặc định theo đuôi file")
+    parser.add_argument("--graphml", help="dùng file GraphML thay cho nguồn đồ thị đã cấu hình")
+    parser.add_argument("--profile", default="car", help="hồ sơ phương tiện (car, motorbike, foot)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=16, help="số vết mỗi lô gửi cho một tiến trình")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("jsonl" if args.input.endswith((".jsonl", ".json")) else "csv")
+    src = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8", newline="")
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        run_batch(read_traces(src, fmt), out, args.graphml, args.profile, args.workers, args.batch_size)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,237 @@
 # src/services/pathfinding_service.py
+import math
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+
 import networkx as nx
-import osmnx as ox
 from shapely.geometry import LineString, MultiLineString
 from shapely.ops import linemerge
 
-from . import map_data_service, weight_service
-from src.app.schemas.route_input_format import RouteRequest
+from . import map_data_service, weight_service, tile_service, compact_graph, routing_engine, routing_profiles, \
+    time_profiles, live_traffic, trip_service, map_matching, vector_tiles
+from src.app.core import lazy_imports, metrics
+from src.app.core.config import CORRIDOR_MARGIN_TILES, CORRIDOR_MAX_MARGIN_TILES, ROUTE_CACHE_SIZE, \
+    TRIP_MAX_STOPS, MATCH_MAX_POINTS, ROUTE_SESSION_MAX, ROUTE_SESSION_MAX_BYTES, SUBSCRIPTION_MAX, \
+    ROUTE_REPAIR_MAX_CHANGED_FRACTION
+from .routing_executor import DeadlineExceededError
+from .graph_store import graph_store, register_index_builder, previous_index
+from .region_registry import region_registry
+from src.app.schemas.route_input_format import RouteRequest, TripRequest, MatchRequest
+
+# Chỉ mục dẫn xuất được dựng lại cùng mỗi phiên bản đồ thị (xem graph_store).
+# G là None khi loader trả về thẳng CompactGraph: các chỉ mục dựng từ compact_graph.
+
+def _build_compact(G: nx.MultiDiGraph, indexes: dict) -> compact_graph.CompactGraph:
+    compact = compact_graph.build_compact_graph(G)
+    metrics.set_gauge("graph_compact_bytes", compact.nbytes())
+    return compact
+
+
+register_index_builder("compact_graph", _build_compact)
+register_index_builder(
+    "node_index", lambda G, indexes: map_data_service.build_node_index(G, indexes["compact_graph"])
+)
+register_index_builder(
+    "edge_index", lambda G, indexes: routing_engine.EdgeSpatialIndex(indexes["compact_graph"])
+)
+# mỗi hồ sơ phương tiện có trọng số, đồ thị rút gọn và chỉ mục liên thông riêng
+register_index_builder(
+    "profiles", lambda G, indexes: routing_profiles.build_profile_indexes(indexes["compact_graph"])
+)
+register_index_builder(
+    "time_profiles", lambda G, indexes: time_profiles.build_time_profiles(indexes["profiles"])
+)
+
+
+def _build_live_traffic(G: nx.MultiDiGraph, indexes: dict) -> live_traffic.LiveTraffic:
+    # chỉ mục được dựng trước khi phiên bản mới được đổi vào: quan sát của phiên bản cũ được chuyển sang
+    return live_traffic.build_live_traffic(indexes["compact_graph"], previous_index("live_traffic"))
+
+
+register_index_builder("live_traffic", _build_live_traffic)
+register_index_builder(
+    "tile_renderer",
+    lambda G, indexes: vector_tiles.build_tile_renderer(indexes["compact_graph"], indexes["edge_index"])
+)
+register_index_builder(
+    "map_matchers",
+    lambda G, indexes: map_matching.build_matchers(indexes["compact_graph"], indexes["edge_index"], indexes["profiles"])
+)
+
+
+class RouteCache:
+    """Cache LRU kết quả tìm đường, khóa theo (phiên bản đồ thị, weight version, request)."""
+
+    def __init__(self, max_entries: int = ROUTE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> dict | None:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+        metrics.inc("route_cache_hits" if result is not None else "route_cache_misses")
+        return result
+
+    def put(self, key, result: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+route_cache = RouteCache()
+
+
+class RouteSessions:
+    """
+    Trạng thái tìm kiếm tăng dần (routing_engine.RouteRepair) theo phiên / id tuyến, LRU theo số phiên
+    (ROUTE_SESSION_MAX + SUBSCRIPTION_MAX) và theo bộ nhớ (ROUTE_SESSION_MAX_BYTES, đo sau mỗi lần dùng).
+    Mỗi phiên giữ một cặp điểm trên một đồ thị tìm kiếm; đổi phiên bản đồ thị, hồ sơ phương tiện
+    hoặc điểm đầu / cuối thì phiên bắt đầu lại từ đầu.
+    """
+
+    def __init__(self, max_entries: int = ROUTE_SESSION_MAX + SUBSCRIPTION_MAX,
+                 max_bytes: int = ROUTE_SESSION_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # id phiên -> (RouteRepair, lock của phiên)
+        self._sizes = {}                # id phiên -> bộ nhớ ước lượng ở lần dùng gần nhất
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, session_id: str, router: routing_engine.ContractedGraph, s: int, t: int):
+        """RouteRepair của phiên (giữ lock của phiên trong khối with)."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0].router is not router or (entry[0].s, entry[0].t) != (s, t):
+                entry = self._entries[session_id] = (routing_engine.RouteRepair(router, s, t), threading.Lock())
+                metrics.inc("route_sessions_started")
+            self._entries.move_to_end(session_id)
+            self._evict()
+        with entry[1]:
+            try:
+                yield entry[0]
+            finally:
+                size = entry[0].nbytes()
+                with self._lock:
+                    if self._entries.get(session_id) is entry:
+                        self._bytes += size - self._sizes.get(session_id, 0)
+                        self._sizes[session_id] = size
+                        self._evict()
+
+    def _evict(self):
+        """Bỏ các phiên lâu không dùng nhất tới khi đủ giới hạn số phiên và bộ nhớ (giữ self._lock)."""
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            session_id, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(session_id, 0)
+            metrics.inc("route_sessions_evicted")
+        self._gauges()
+
+    def _gauges(self):
+        metrics.set_gauge("route_sessions", len(self._entries))
+        metrics.set_gauge("route_sessions_bytes", self._bytes)
+
+    def _remove(self, session_id: str):
+        self._entries.pop(session_id, None)
+        self._bytes -= self._sizes.pop(session_id, 0)
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._remove(session_id)
+            self._gauges()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+            self._gauges()
+
+    def retain(self, routers):
+        """Chỉ giữ các phiên có đồ thị tìm kiếm nằm trong routers."""
+        keep = {id(router) for router in routers}
+        with self._lock:
+            for session_id in [k for k, (repair, _) in self._entries.items() if id(repair.router) not in keep]:
+                self._remove(session_id)
+            self._gauges()
+
+
+route_sessions = RouteSessions()
+
+
+def _graph_stores() -> list:
+    return [graph_store] + [region.store for region in region_registry.regions()]
+
+
+def _prune_route_sessions(version=None):
+    """
+    Phiên giữ tham chiếu tới đồ thị tìm kiếm: khi một store (đồ thị mặc định hoặc một vùng) đổi phiên bản
+    hay bị đẩy ra, bỏ các phiên không còn thuộc phiên bản hiện tại nào để phiên bản cũ được giải phóng.
+    """
+    routers = []
+    for store in _graph_stores():
+        current = store.current
+        if current is not None:
+            routers.extend(profile.router for profile in current.indexes.get("profiles", {}).values())
+    route_sessions.retain(routers)
+
+
+def _watch_route_sessions(store):
+    store.subscribe(_prune_route_sessions)
+    store.subscribe_unload(_prune_route_sessions)
+
+
+for _store in _graph_stores():
+    _watch_route_sessions(_store)
+
+_NO_PATH_ERROR = "không tìm thấy đường đi giữa hai điểm đã chọn."
+# khoảng cách snap tối đa (như find_nearest_node)
+_MAX_SNAP_METERS = 4000
+
+
+def _snap_pair(request: RouteRequest, indexes: dict, conn=None) -> tuple:
+    """
+    Snap điểm đầu / cuối vào đồ thị. Nếu hai node gần nhất khác thành phần liên thông mạnh
+    (thường là một đoạn ngõ cụt / đường một chiều tách rời), snap lại điểm còn lại vào thành phần
+    của điểm nằm trong thành phần lớn nhất, hoặc cả hai vào thành phần lớn nhất.
+    """
+    node_index = indexes.get("node_index")
+    start, end = request.start_point, request.end_point
+    start_id = map_data_service.find_nearest_node(None, start.lat, start.lon, node_index)
+    end_id = map_data_service.find_nearest_node(None, end.lat, end.lon, node_index)
+    if conn is None or node_index is None:
+        return start_id, end_id
+
+    start_scc, end_scc = conn.scc_of_osmid(start_id), conn.scc_of_osmid(end_id)
+    if start_scc == end_scc:
+        return start_id, end_id
+
+    target_scc = start_scc if start_scc == conn.largest_scc else end_scc if end_scc == conn.largest_scc \
+        else conn.largest_scc
+    allowed = lambda osmid: conn.scc_of_osmid(osmid) == target_scc
+    try:
+        if start_scc != target_scc:
+            start_id = map_data_service.find_nearest_node(None, start.lat, start.lon, node_index, allowed)
+        if end_scc != target_scc:
+            end_id = map_data_service.find_nearest_node(None, end.lat, end.lon, node_index, allowed)
+    except ValueError:
+        # không có node phù hợp trong phạm vi cho phép: giữ cách snap ban đầu (sẽ báo không có đường)
+        pass
+    metrics.inc("routing_snap_component_adjusted")
+    return start_id, end_id
 
 
 def find_smart_route(G_modified: nx.MultiDiGraph, start_node_id: int, end_node_id: int) -> dict:
@@ -43,31 +269,54 @@ def _prepare_dynamic_subgraph(request: RouteRequest, G_base: nx.MultiDiGraph) ->
     return G_dynamic
 
 
-def find_standard_route(request: RouteRequest, G_base: nx.MultiDiGraph) -> dict:
+def _deadline_weight(deadline, check_every: int = 512):
+    """
+    Hàm trọng số cho nx.astar_path, kiểm tra deadline mỗi `check_every` lần gọi
+    để có thể dừng một lượt tìm kiếm quá lâu giữa chừng.
+    Giữ nguyên ngữ nghĩa của weight='weight' (mặc định 1, lấy min giữa các cạnh song song).
+    """
+    calls = 0
+
+    def weight(u, v, data):
+        nonlocal calls
+        calls += 1
+        if calls % check_every == 0:
+            deadline.check()
+        return min(attr.get('weight', 1) for attr in data.values())
+
+    return weight
+
+
+def find_standard_route(request: RouteRequest, G_base: nx.MultiDiGraph, deadline=None, node_index=None) -> dict:
     G_dynamic = _prepare_dynamic_subgraph(request, G_base)
     if G_dynamic is None:
         return {"error": "không thể chuẩn bị đồ thị cho việc tìm đường."}
+    if deadline is not None:
+        deadline.check()
 
     start_point = request.start_point
     end_point = request.end_point
 
     try:
-        start_node_id = map_data_service.find_nearest_node(G_dynamic, start_point.lat, start_point.lon)
-        end_node_id = map_data_service.find_nearest_node(G_dynamic, end_point.lat, end_point.lon)
+        start_node_id = map_data_service.find_nearest_node(G_dynamic, start_point.lat, start_point.lon, node_index)
+        end_node_id = map_data_service.find_nearest_node(G_dynamic, end_point.lat, end_point.lon, node_index)
     except ValueError as e:
         return {"error": str(e)}
 
     if start_node_id == end_node_id:
         return {"error": "hai điểm quá gần nhau, vui lòng chọn điểm xa hơn"}
 
+    weight = _deadline_weight(deadline) if deadline is not None else 'weight'
     try:
-        path_nodes = nx.astar_path(G_dynamic, source=start_node_id, target=end_node_id, weight='weight')
+        path_nodes = nx.astar_path(G_dynamic, source=start_node_id, target=end_node_id, weight=weight)
     except nx.NetworkXNoPath:
         return {"error": "không tìm thấy đường đi giữa hai điểm đã chọn."}
+    except DeadlineExceededError:
+        raise
     except Exception as e:
         return {"error": f"lỗi khi chạy a*: {e}"}
 
-    path_edges = ox.utils_graph.get_route_edge_attributes(G_dynamic, path_nodes)
+    path_edges = lazy_imports.load("osmnx").utils_graph.get_route_edge_attributes(G_dynamic, path_nodes)
     total_distance = sum(edge.get('length', 0) for edge in path_edges)
     # Use weight for duration calculation (weight represents travel time in seconds)
     total_duration_sec = sum(edge.get('weight', edge.get('travel_time', 0)) for edge in path_edges)
@@ -107,3 +356,309 @@ def find_standard_route(request: RouteRequest, G_base: nx.MultiDiGraph) -> dict:
         },
         "path": path_nodes
     }
+
+
+def _profile_overlay(request, indexes: dict, profile, live_factor=None, zones: list = None) -> tuple:
+    """
+    (hệ số, mặt nạ cấm) theo cạnh của hồ sơ: vùng ngập / vùng cấm của request và tốc độ trực tiếp.
+    Lớp phủ tính trên cạnh của đồ thị gốc rồi chuyển sang cạnh của hồ sơ (hồ sơ đi bộ có thêm cạnh ngược).
+    zones: kết quả weight_service.preprocess_zones của request nếu đã có (xem compute_edge_overlay).
+    """
+    base = indexes["compact_graph"]
+    multiplier, banned, _ = weight_service.compute_edge_overlay(
+        indexes["edge_index"], base.num_edges,
+        request.blocking_geometries, request.flood_areas, request.ban_areas, zones=zones
+    )
+    if live_factor is not None and profile.profile.congestion:
+        multiplier = live_factor if multiplier is None else multiplier * live_factor
+    return profile.map_overlay(multiplier), profile.map_overlay(banned)
+
+
+def _route_feature(compact: compact_graph.CompactGraph, path_edges: list) -> dict:
+    """GeoJSON Feature của một đường đi (danh sách cạnh gốc); geometry None nếu đường đi rỗng."""
+    geometries = [LineString(compact.edge_coords(e)) for e in path_edges]
+    if not geometries:
+        return {"type": "Feature", "properties": {}, "geometry": None}
+    try:
+        merged = linemerge(geometries)
+        path_geometry = merged if not merged.is_empty else MultiLineString(geometries)
+    except Exception:
+        path_geometry = MultiLineString(geometries)
+    return {"type": "Feature", "properties": {}, "geometry": path_geometry.__geo_interface__}
+
+
+def find_standard_route_compact(request: RouteRequest, indexes: dict, deadline=None, live_factor=None,
+                                session_id: str = None, zones: list = None) -> dict:
+    """
+    Như find_standard_route nhưng chạy trên đồ thị rút gọn của routing_engine:
+    không cần tới đồ thị NetworkX, vùng ngập / vùng cấm được áp thành mảng trên các cạnh gốc.
+    Trọng số tìm kiếm là thời gian di chuyển (giây) theo hồ sơ phương tiện của request,
+    vùng ngập nhân đôi, vùng cấm chặn hẳn. Nếu request có departure_time, chi phí là hàm theo giờ
+    (tắc đường, ngập theo mùa) và mỗi cạnh được tính tại thời điểm tới cạnh đó; nếu không,
+    live_factor (hệ số tốc độ trực tiếp theo cạnh, xem live_traffic) được áp cho xe cơ giới.
+    Có session_id (và không có departure_time) thì cây đường đi ngắn nhất của phiên được sửa tăng dần
+    theo các cạnh đổi chi phí kể từ lần tìm trước thay vì tìm lại từ đầu (xem RouteRepair).
+    """
+    profile = indexes["profiles"].get(request.profile)
+    if profile is None:
+        return {"error": f"hồ sơ phương tiện không hợp lệ: {request.profile} "
+                         f"(hỗ trợ: {', '.join(indexes['profiles'])})"}
+    router, compact, conn = profile.router, profile.compact, profile.connectivity
+
+    try:
+        start_node_id, end_node_id = _snap_pair(request, indexes, conn)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    if start_node_id == end_node_id:
+        return {"error": "hai điểm quá gần nhau, vui lòng chọn điểm xa hơn"}
+
+    s, t = compact.node_index(start_node_id), compact.node_index(end_node_id)
+    if not conn.same_scc(s, t):
+        metrics.inc("routing_no_path_fast", reason="scc")
+        return {"error": _NO_PATH_ERROR}
+
+    multiplier, banned = _profile_overlay(
+        request, indexes, profile, live_factor if request.departure_time is None else None, zones
+    )
+    if conn.cut_by_bans(s, t, banned):
+        metrics.inc("routing_no_path_fast", reason="bridge")
+        return {"error": _NO_PATH_ERROR}
+    edge_cost = router.edge_costs(multiplier, banned)
+    departure, depart = None, None
+    if request.departure_time is not None and "time_profiles" in indexes:
+        departure = time_profiles.local_time(request.departure_time)
+        edge_cost = indexes["time_profiles"].hourly_costs(request.profile, edge_cost, departure.month)
+        depart = time_profiles.seconds_of_day(departure)
+    if deadline is not None:
+        deadline.check()
+
+    incremental = None
+    try:
+        if session_id is not None and depart is None:
+            with route_sessions.checkout(session_id, router, s, t) as repair:
+                max_changed = int(ROUTE_REPAIR_MAX_CHANGED_FRACTION * router.num_search_edges)
+                try:
+                    total_cost, path_edges = repair.update(edge_cost, deadline=deadline, max_changed=max_changed)
+                finally:
+                    incremental = {"session_id": session_id, "changed_edges": repair.changed,
+                                   "expanded_nodes": repair.expanded}
+        else:
+            total_cost, path_edges = router.shortest_path(s, t, edge_cost, deadline=deadline, depart=depart)
+    except routing_engine.NoPathError:
+        return {"error": _NO_PATH_ERROR}
+
+    path_nodes = [start_node_id] + [compact.osmid(compact.edge_target[e]) for e in path_edges]
+    result = {
+        "message": "standard route found successfully",
+        "distance": float(compact.length[path_edges].sum()),
+        "duration": total_cost / 60,
+        "route": _route_feature(compact, path_edges),
+        "path": path_nodes,
+        "profile": request.profile,
+    }
+    if incremental is not None:
+        result["incremental"] = incremental
+    if departure is not None:
+        result["departure_time"] = departure.isoformat()
+        result["arrival_time"] = (departure + timedelta(seconds=total_cost)).isoformat()
+    return result
+
+
+def find_standard_route_current(request: RouteRequest, deadline=None, session_id: str = None,
+                                zones: list = None) -> dict:
+    """
+    Tìm đường trên phiên bản đồ thị hiện tại của vùng chứa điểm đầu và điểm cuối (xem region_registry).
+    Phiên bản được giữ trong suốt lượt tìm nên việc nạp lại đồ thị không ảnh hưởng request đang chạy.
+    Kết quả được cache theo phiên bản đồ thị và weight version của tốc độ trực tiếp; request có session_id
+    không qua cache mà sửa tăng dần tuyến trước đó của phiên.
+    zones: vùng của request đã tiền xử lý (weight_service.preprocess_zones), nếu có.
+    """
+    points = (request.start_point, request.end_point)
+    with region_registry.acquire([p.lat for p in points], [p.lon for p in points]) as version:
+        if "profiles" not in version.indexes:
+            result = find_standard_route(
+                request, version.graph, deadline=deadline, node_index=version.indexes.get("node_index")
+            )
+            result["graph_version"] = version.version
+            return result
+
+        live = version.indexes.get("live_traffic")
+        weight_version, live_factor = live.snapshot() if live is not None else (0, None)
+        key = (version.version, weight_version, request.model_dump_json())
+        result = route_cache.get(key) if session_id is None else None
+        if result is None:
+            result = find_standard_route_compact(
+                request, version.indexes, deadline=deadline, live_factor=live_factor,
+                session_id=session_id, zones=zones
+            )
+            result["graph_version"] = version.version
+            result["weight_version"] = weight_version
+            if session_id is None:
+                route_cache.put(key, result)
+        return dict(result)
+
+
+def _snap_stops(indexes: dict, conn, stops: list) -> list:
+    """
+    Snap tất cả các điểm trong một lượt truy vấn chỉ mục. Các điểm rơi vào thành phần liên thông
+    mạnh khác với đa số được snap lại vào thành phần đó (như _snap_pair).
+    """
+    node_index = indexes["node_index"]
+    node_ids, distances = node_index.nearest_many([p.lat for p in stops], [p.lon for p in stops])
+    for i, distance in enumerate(distances):
+        if distance > _MAX_SNAP_METERS:
+            raise ValueError(f"điểm {i} nằm ngoài phạm vi cho phép (cách {distance / 1000:.1f} km)")
+
+    labels = [conn.scc_of_osmid(node_id) for node_id in node_ids]
+    counts = Counter(labels)
+    target_scc = max(counts, key=lambda label: (counts[label], label == conn.largest_scc))
+    allowed = lambda osmid: conn.scc_of_osmid(osmid) == target_scc
+    for i, label in enumerate(labels):
+        if label != target_scc:
+            node_id = node_index.nearest(stops[i].lat, stops[i].lon, allowed)
+            if node_id is not None:
+                node_ids[i] = node_id
+                metrics.inc("routing_snap_component_adjusted")
+    return node_ids
+
+
+def find_trip_current(request: TripRequest, deadline=None, zones: list = None) -> dict:
+    """
+    Tối ưu thứ tự ghé nhiều điểm trên phiên bản đồ thị hiện tại:
+    snap tất cả các điểm một lượt, áp vùng ngập / vùng cấm một lần cho cả hành trình,
+    tính ma trận thời gian đi bằng các lượt tìm một-nhiều, sắp thứ tự (trip_service)
+    rồi trả về từng chặng kèm geometry.
+    """
+    if len(request.stops) > TRIP_MAX_STOPS:
+        return {"error": f"tối đa {TRIP_MAX_STOPS} điểm cho một hành trình"}
+
+    with region_registry.acquire([p.lat for p in request.stops], [p.lon for p in request.stops]) as version:
+        indexes = version.indexes
+        if "profiles" not in indexes:
+            return {"error": "chưa hỗ trợ tối ưu hành trình trên đồ thị này"}
+        profile = indexes["profiles"].get(request.profile)
+        if profile is None:
+            return {"error": f"hồ sơ phương tiện không hợp lệ: {request.profile} "
+                             f"(hỗ trợ: {', '.join(indexes['profiles'])})"}
+        router, compact, conn = profile.router, profile.compact, profile.connectivity
+
+        try:
+            stop_ids = _snap_stops(indexes, conn, request.stops)
+        except ValueError as e:
+            return {"error": str(e)}
+        nodes = [compact.node_index(node_id) for node_id in stop_ids]
+
+        live = indexes.get("live_traffic")
+        weight_version, live_factor = live.snapshot() if live is not None else (0, None)
+        edge_cost = router.edge_costs(*_profile_overlay(request, indexes, profile, live_factor, zones))
+
+        # mỗi lượt một-nhiều trả kèm đường đi, các chặng lấy lại từ đây thay vì tìm lại
+        routes = []
+        for s in nodes:
+            if deadline is not None:
+                deadline.check()
+            routes.append(router.paths_within(s, nodes, edge_cost, math.inf, deadline=deadline))
+        matrix = [[cost for cost, _ in row] for row in routes]
+
+        order = trip_service.solve_order(matrix, request.round_trip, request.keep_last)
+        visits = order + [order[0]] if request.round_trip else order
+        legs = []
+        for a, b in zip(visits, visits[1:]):
+            cost, path_edges = routes[a][b]
+            if path_edges is None:
+                return {"error": f"không tìm thấy đường đi từ điểm {a} tới điểm {b}", "order": order}
+            legs.append({
+                "from": a,
+                "to": b,
+                "distance": float(compact.length[path_edges].sum()),
+                "duration": cost / 60,
+                "route": _route_feature(compact, path_edges),
+            })
+
+        return {
+            "message": "trip optimized successfully",
+            "order": order,
+            "distance": sum(leg["distance"] for leg in legs),
+            "duration": sum(leg["duration"] for leg in legs),
+            "legs": legs,
+            "snapped_nodes": stop_ids,
+            "profile": request.profile,
+            "graph_version": version.version,
+            "weight_version": weight_version,
+        }
+
+
+def match_trace_current(request: MatchRequest, deadline=None) -> dict:
+    """Khớp một vết GPS vào các cạnh của phiên bản đồ thị hiện tại (xem map_matching)."""
+    if len(request.points) > MATCH_MAX_POINTS:
+        return {"error": f"tối đa {MATCH_MAX_POINTS} điểm cho một vết"}
+
+    with region_registry.acquire([p.lat for p in request.points], [p.lon for p in request.points]) as version:
+        matchers = version.indexes.get("map_matchers")
+        if matchers is None:
+            return {"error": "chưa hỗ trợ khớp vết GPS trên đồ thị này"}
+        matcher = matchers.get(request.profile)
+        if matcher is None:
+            return {"error": f"hồ sơ phương tiện không hợp lệ: {request.profile} "
+                             f"(hỗ trợ: {', '.join(matchers)})"}
+
+        times = [time_profiles.local_time(p.timestamp).timestamp() if p.timestamp is not None else None
+                 for p in request.points]
+        raw = matcher.match([p.lat for p in request.points], [p.lon for p in request.points],
+                            times if any(t is not None for t in times) else None, deadline=deadline)
+        result = matcher.describe(raw)
+        if request.include_geometry:
+            for segment, matched in zip(result["segments"], raw["segments"]):
+                segment["route"] = _route_feature(matcher.compact, matched["edges"])
+
+        result.update({
+            "message": "trace matched successfully",
+            "matched_points": sum(len(segment["points"]) for segment in result["segments"]),
+            "profile": request.profile,
+            "graph_version": version.version,
+        })
+        return result
+
+
+def find_standard_route_tiled(request: RouteRequest, deadline=None) -> dict:
+    """
+    Tìm đường ở chế độ tiled: chỉ nạp các ô trong hành lang quanh điểm đầu/cuối.
+    Nếu không tìm được đường, hoặc đường đi chạm vào rìa hành lang (có thể còn đường tốt hơn
+    ở ngoài), hành lang được nới rộng gấp đôi cho tới CORRIDOR_MAX_MARGIN_TILES.
+    """
+    start = (request.start_point.lat, request.start_point.lon)
+    end = (request.end_point.lat, request.end_point.lon)
+    margin = CORRIDOR_MARGIN_TILES
+    result = None
+
+    while True:
+        tiles = tile_service.corridor_tiles(start, end, margin)
+        generation = tile_service.tile_cache.generation
+        G_corridor = tile_service.build_corridor_graph(tiles)
+        if deadline is not None:
+            deadline.check()
+
+        result = find_standard_route(request, G_corridor, deadline=deadline)
+        result["corridor_margin_tiles"] = margin
+        result["graph_version"] = f"tiles-{generation}"
+
+        if margin >= CORRIDOR_MAX_MARGIN_TILES:
+            return result
+
+        if "error" in result:
+            # chỉ lỗi "không có đường" mới có thể khắc phục bằng cách nới hành lang,
+            # lỗi snap (ngoài phạm vi) hay đồ thị rỗng thì trả về luôn
+            if not result["error"].startswith("không tìm thấy đường đi"):
+                return result
+            margin = min(margin * 2, CORRIDOR_MAX_MARGIN_TILES)
+            continue
+
+        edge_tiles = tile_service.boundary_tiles(tiles)
+        touches_boundary = any(
+            tile_service.tile_of(G_corridor.nodes[n]['y'], G_corridor.nodes[n]['x']) in edge_tiles
+            for n in result["path"][1:-1]
+        )
+        if not touches_boundary:
+            return result
+        margin = min(margin * 2, CORRIDOR_MAX_MARGIN_TILES)
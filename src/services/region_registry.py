@@ -0,0 +1,319 @@
+# src/services/region_registry.py
+"""
+Nhiều vùng (quận / thành phố) trong một tiến trình.
+
+- Đồ thị mặc định (graph_store, nạp khi khởi động) phục vụ mọi điểm không thuộc vùng nào.
+- Mỗi vùng khai báo trong REGIONS_FILE có GraphStore riêng (đồ thị + chỉ mục) và ZoneState riêng;
+  vùng được nạp khi request đầu tiên rơi vào bbox của nó.
+- Request được chuyển tới vùng nhỏ nhất chứa mọi điểm của nó (điểm đầu / cuối, các điểm ghé, vết GPS).
+- Bộ nhớ của mỗi vùng được ước lượng sau khi nạp; khi tổng vượt REGION_MEMORY_BUDGET_BYTES,
+  vùng ít được dùng gần đây nhất (không có request đang chạy) bị đẩy ra. Request đang chạy trên vùng
+  bị đẩy vẫn hoàn tất trên phiên bản cũ (xem GraphStore.unload).
+"""
+import itertools
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.app.core import lazy_imports, metrics
+from src.app.core.config import REGIONS_FILE, REGION_MEMORY_BUDGET_BYTES
+from .compact_graph import deep_sizeof, networkx_sizeof, sampled_sizeof
+from .graph_store import GraphStore, GraphNotLoadedError, graph_store
+from .zone_state import ZoneState, zone_state
+
+
+class UnknownRegionError(KeyError):
+    """Không có vùng bản đồ với tên đã cho."""
+
+
+# số node (phần tử) lấy mẫu để ước lượng bộ nhớ của đồ thị networkx và các list / dict lớn
+_SIZE_SAMPLE_NODES = 500
+
+
+def _region_loader(region: "Region"):
+    source = region.source
+    if source == "postgis":
+        from . import map_data_service
+
+        return lambda: map_data_service.get_subgraph_from_bbox(tuple(region.bbox)) or None
+    if source.startswith("arrow:"):
+        from src.database.load_database import load_graph_from_export
+
+        return lambda: load_graph_from_export(source[len("arrow:"):])
+    if source.startswith("graphml:"):
+        return lambda: load_graphml(source[len("graphml:"):])
+    raise ValueError(f"nguồn dữ liệu không hợp lệ cho vùng {region.name}: {source}")
+
+
+def load_graphml(path: str):
+    """Đồ thị từ file graphml, đưa về WGS84 và bổ sung travel_time nếu thiếu."""
+    ox = lazy_imports.load("osmnx")
+    G = ox.load_graphml(path)
+    if str(G.graph.get("crs", "EPSG:4326")).upper() != "EPSG:4326":
+        G = ox.project_graph(G, to_crs="EPSG:4326")
+    if not all("travel_time" in data for _, _, data in itertools.islice(G.edges(data=True), 100)):
+        G = ox.add_edge_travel_times(ox.add_edge_speeds(G, fallback=30))
+    return G
+
+
+def _index_bytes(obj, seen: set, depth: int = 5) -> int:
+    """
+    Bộ nhớ của một chỉ mục (đi qua dict / list / thuộc tính, tối đa depth tầng):
+    - đối tượng có nbytes() (CompactGraph, cache chuyển tiếp của MapMatcher, ...): theo nbytes(),
+      tức là theo số mục đang có chứ không theo sức chứa;
+    - mảng numpy: nbytes (mảng object như geometry cạnh: cộng thêm phần tử lấy mẫu);
+    - list / dict Python lớn (danh sách kề của ContractedGraph, chain_of, ...): lấy mẫu (sampled_sizeof).
+    """
+    if id(obj) in seen or depth < 0:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        size = obj.nbytes
+        if obj.dtype == object and obj.size:
+            sample = obj.ravel()[:_SIZE_SAMPLE_NODES]
+            size += int(sum(deep_sizeof(item) for item in sample) * obj.size / len(sample))
+        return size
+    if callable(getattr(obj, "nbytes", None)):
+        return obj.nbytes()
+    if isinstance(obj, (dict, list, tuple, set)) and len(obj) > _SIZE_SAMPLE_NODES:
+        return sampled_sizeof(obj, _SIZE_SAMPLE_NODES)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_index_bytes(v, seen, depth - 1) for v in obj.values())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(_index_bytes(v, seen, depth - 1) for v in obj)
+    if hasattr(obj, "__dict__"):
+        return sum(_index_bytes(v, seen, depth - 1) for v in vars(obj).values())
+    return sys.getsizeof(obj)
+
+
+def estimate_bytes(version) -> int:
+    """
+    Ước lượng bộ nhớ hiện tại của một phiên bản đồ thị: đồ thị networkx (lấy mẫu _SIZE_SAMPLE_NODES node
+    rồi nhân lên) cộng các chỉ mục (xem _index_bytes). Cache trong chỉ mục lớn dần sau khi nạp, nên ước lượng
+    được làm lại mỗi lần xét ngân sách (xem RegionRegistry._evict).
+    """
+    # đồ thị NetworkX của phiên bản nạp từ CompactGraph chỉ được tính khi đã được dựng
+    G = version.graph if version.graph_built else None
+    total = 0
+    if G is not None and G.number_of_nodes():
+        total += networkx_sizeof(G, sample=_SIZE_SAMPLE_NODES)
+    return total + _index_bytes(version.indexes, set())
+
+
+class Region:
+    def __init__(self, name: str, bbox: list, source: str = "postgis"):
+        if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+            raise ValueError(f"bbox không hợp lệ cho vùng {name}: {bbox}")
+        self.name = name
+        self.bbox = [float(v) for v in bbox]
+        self.source = source
+        self.store = GraphStore(loader=_region_loader(self), name=name)
+        self.zones = ZoneState()
+        self.bytes = 0
+        self.active_requests = 0
+        self.last_used = None
+        self.loads = 0
+        self.evictions = 0
+        self._load_lock = threading.Lock()
+
+    @property
+    def area(self) -> float:
+        return (self.bbox[2] - self.bbox[0]) * (self.bbox[3] - self.bbox[1])
+
+    def contains(self, lats, lons) -> bool:
+        return (min(lons) >= self.bbox[0] and max(lons) <= self.bbox[2]
+                and min(lats) >= self.bbox[1] and max(lats) <= self.bbox[3])
+
+    @property
+    def loaded(self) -> bool:
+        return self.store.current is not None
+
+
+class RegionRegistry:
+    def __init__(self, regions: list = None, memory_budget: int = REGION_MEMORY_BUDGET_BYTES):
+        self.memory_budget = memory_budget
+        self._regions = OrderedDict()   # theo thứ tự dùng gần nhất (cuối = mới nhất)
+        self._lock = threading.Lock()
+        for region in regions or []:
+            if region.name in self._regions or region.name == graph_store.name:
+                raise ValueError(f"trùng tên vùng: {region.name}")
+            self._regions[region.name] = region
+
+    @classmethod
+    def from_file(cls, path: str) -> "RegionRegistry":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data.get("regions", []) if isinstance(data, dict) else data
+        regions = [Region(e["name"], e["bbox"], e.get("source", "postgis")) for e in entries]
+        print(f"[regions] {len(regions)} vùng từ {path}: {', '.join(r.name for r in regions)}")
+        return cls(regions)
+
+    # ------------------------------------------------------------------
+    # Tra cứu
+    # ------------------------------------------------------------------
+
+    def locate(self, lats, lons) -> Region | None:
+        """Vùng nhỏ nhất chứa mọi điểm; None = đồ thị mặc định."""
+        if not self._regions or not len(lats):
+            return None
+        matches = [r for r in self._regions.values() if r.contains(lats, lons)]
+        return min(matches, key=lambda r: r.area) if matches else None
+
+    def get(self, name: str) -> Region | None:
+        return self._regions.get(name)
+
+    def regions(self) -> list:
+        return list(self._regions.values())
+
+    def zones_for(self, name: str = None) -> ZoneState | None:
+        """ZoneState của vùng (None hoặc tên đồ thị mặc định -> zone_state chung)."""
+        if name is None or name == graph_store.name:
+            return zone_state
+        region = self._regions.get(name)
+        return region.zones if region is not None else None
+
+    def name_of(self, lats, lons) -> str:
+        """Tên store phục vụ các điểm: tên vùng, hoặc tên đồ thị mặc định."""
+        region = self.locate(lats, lons)
+        return region.name if region is not None else graph_store.name
+
+    def store_for(self, name: str = None) -> GraphStore | None:
+        """GraphStore của vùng (None hoặc tên đồ thị mặc định -> graph_store chung)."""
+        if name is None or name == graph_store.name:
+            return graph_store
+        region = self._regions.get(name)
+        return region.store if region is not None else None
+
+    @contextmanager
+    def acquire(self, lats, lons):
+        """Mượn phiên bản đồ thị của vùng chứa các điểm (nạp vùng nếu cần) trong suốt một request."""
+        with self._acquire(self.locate(lats, lons)) as version:
+            yield version
+
+    @contextmanager
+    def acquire_region(self, name: str = None):
+        """Như acquire nhưng chọn vùng theo tên (None hoặc tên đồ thị mặc định -> đồ thị mặc định)."""
+        region = None if name is None or name == graph_store.name else self._regions.get(name)
+        if region is None and self.store_for(name) is None:
+            raise UnknownRegionError(name)
+        with self._acquire(region) as version:
+            yield version
+
+    @contextmanager
+    def _acquire(self, region: Region | None):
+        if region is None:
+            with graph_store.acquire() as version:
+                yield version
+            return
+
+        with self._lock:
+            region.active_requests += 1
+            region.last_used = time.time()
+            self._regions.move_to_end(region.name)
+        try:
+            self._ensure_loaded(region)
+            with region.store.acquire() as version:
+                yield version
+        finally:
+            with self._lock:
+                region.active_requests -= 1
+
+    # ------------------------------------------------------------------
+    # Nạp / đẩy ra
+    # ------------------------------------------------------------------
+
+    def _ensure_loaded(self, region: Region):
+        if region.loaded:
+            return
+        with region._load_lock:
+            if region.loaded:
+                return
+            started = time.perf_counter()
+            version = region.store.reload()
+            if version is None:
+                metrics.inc("region_load_failures", region=region.name)
+                raise GraphNotLoadedError(
+                    f"không nạp được vùng {region.name}: {region.store.status['error']}"
+                )
+            elapsed = time.perf_counter() - started
+            region.bytes = estimate_bytes(version)
+            region.loads += 1
+            metrics.inc("region_loads", region=region.name)
+            metrics.observe("region_load_seconds", elapsed, region=region.name)
+            metrics.set_gauge("region_bytes", region.bytes, region=region.name)
+            metrics.set_gauge("region_loaded", 1, region=region.name)
+            print(f"[regions] đã nạp vùng {region.name} ({region.bytes / 1e6:.0f} MB, {elapsed:.1f}s)")
+        self._evict(keep=region)
+
+    def _evict(self, keep: Region):
+        """Đẩy các vùng ít dùng gần đây nhất ra cho tới khi tổng bộ nhớ không vượt ngân sách."""
+        # cache của các vùng đã nạp (vd. cache chuyển tiếp của map matching) lớn dần: ước lượng lại
+        for region in list(self._regions.values()):
+            version = region.store.current
+            if region is not keep and version is not None:
+                region.bytes = estimate_bytes(version)
+                metrics.set_gauge("region_bytes", region.bytes, region=region.name)
+        with self._lock:
+            loaded = [r for r in self._regions.values() if r.loaded]
+            total = sum(r.bytes for r in loaded)
+            victims = []
+            for region in loaded:   # từ cũ nhất tới mới nhất
+                if total <= self.memory_budget:
+                    break
+                if region is keep or region.active_requests > 0:
+                    continue
+                victims.append(region)
+                total -= region.bytes
+        for region in victims:
+            self._unload(region)
+        metrics.set_gauge("regions_memory_bytes", total)
+        if total > self.memory_budget:
+            metrics.inc("region_budget_exceeded")
+
+    def _unload(self, region: Region) -> bool:
+        if not region.store.unload():
+            return False
+        region.evictions += 1
+        metrics.inc("region_evictions", region=region.name)
+        metrics.set_gauge("region_loaded", 0, region=region.name)
+        metrics.set_gauge("region_bytes", 0, region=region.name)
+        print(f"[regions] đã đẩy vùng {region.name} ra khỏi bộ nhớ ({region.bytes / 1e6:.0f} MB)")
+        region.bytes = 0
+        return True
+
+    def evict(self, name: str) -> bool:
+        """Đẩy một vùng ra khỏi bộ nhớ ngay (nạp lại ở request sau)."""
+        region = self._regions.get(name)
+        return region is not None and self._unload(region)
+
+    def stats(self) -> dict:
+        with self._lock:
+            regions = [
+                {
+                    "name": r.name,
+                    "bbox": r.bbox,
+                    "source": r.source,
+                    "loaded": r.loaded,
+                    "version": r.store.current.version if r.loaded else None,
+                    "bytes": r.bytes,
+                    "active_requests": r.active_requests,
+                    "last_used": r.last_used,
+                    "loads": r.loads,
+                    "evictions": r.evictions,
+                    "zones": len(r.zones.zones()),
+                }
+                for r in self._regions.values()
+            ]
+        return {
+            "memory_budget_bytes": self.memory_budget,
+            "memory_bytes": sum(r["bytes"] for r in regions),
+            "regions": regions,
+        }
+
+
+region_registry = RegionRegistry.from_file(REGIONS_FILE) if REGIONS_FILE else RegionRegistry()
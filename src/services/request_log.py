@@ -0,0 +1,252 @@
+# src/services/request_log.py
+"""
+Nhật ký request dạng JSONL gọn, dùng để làm nóng cache và làm tải benchmark.
+
+Mỗi dòng: {"t": unix giây, "k": loại, "q": nội dung} với loại
+- "geocode": {"address": ...}          (địa chỉ -> tọa độ)
+- "reverse": {"lat": ..., "lon": ...}  (tọa độ -> địa chỉ)
+- "route":   RouteRequest (chỉ các trường khác mặc định)
+
+Ghi ở thread nền (request không chờ I/O); file quá REQUEST_LOG_MAX_BYTES được đổi thành <file>.1.
+Khi khởi động và sau mỗi lần nạp lại đồ thị, WARMUP_TOP_N request phổ biến nhất được chạy lại
+ở nền để điền cache geocoding, snap và tuyến đường (cache tuyến khóa theo phiên bản đồ thị).
+
+    python -m src.services.request_log --top 20                      # các request phổ biến nhất
+    python -m src.services.request_log --bench --graphml <file>      # chạy lại log làm benchmark
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from src.app.core import metrics
+from src.app.core.config import REQUEST_LOG_FILE, REQUEST_LOG_MAX_BYTES, WARMUP_TOP_N, \
+    WARMUP_GEOCODE_INTERVAL_SECONDS
+
+KINDS = ("geocode", "reverse", "route")
+# số dòng chờ ghi tối đa; đầy thì bỏ dòng mới (không làm chậm request)
+_MAX_PENDING = 10000
+
+
+class RequestLog:
+    def __init__(self, path: str = REQUEST_LOG_FILE, max_bytes: int = REQUEST_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._pending = queue.Queue(maxsize=_MAX_PENDING)
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, body: dict):
+        if not self.path:
+            return
+        line = json.dumps({"t": int(time.time()), "k": kind, "q": body}, ensure_ascii=False,
+                          separators=(",", ":"), default=str)
+        try:
+            self._pending.put_nowait(line)
+        except queue.Full:
+            metrics.inc("request_log_dropped")
+            return
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run, name="request-log", daemon=True)
+                    self._writer.start()
+
+    def record_route(self, request):
+        self.record("route", request.model_dump(mode="json", exclude_defaults=True))
+
+    def _run(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        while True:
+            lines = [self._pending.get()]
+            while len(lines) < 1000:
+                try:
+                    lines.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                metrics.inc("request_log_lines", float(len(lines)))
+            except OSError as e:
+                metrics.inc("request_log_errors")
+                print(f"[request-log] không ghi được {self.path}: {e}")
+                time.sleep(1)
+
+
+request_log = RequestLog()
+
+
+# ----------------------------------------------------------------------
+# Đọc / chọn request
+# ----------------------------------------------------------------------
+
+def read_log(path: str = REQUEST_LOG_FILE, kinds=KINDS):
+    """Sinh các dòng hợp lệ (file đã xoay .1 trước, rồi file hiện tại), theo thứ tự ghi."""
+    for name in (path + ".1", path):
+        if not os.path.exists(name):
+            continue
+        with open(name, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("k") in kinds and isinstance(entry.get("q"), dict):
+                    yield entry
+
+
+def top_requests(entries, n: int) -> list:
+    """[(số lần, loại, nội dung)] của n request phổ biến nhất."""
+    counts = Counter(json.dumps([e["k"], e["q"]], sort_keys=True, ensure_ascii=False) for e in entries)
+    return [(count, *json.loads(key)) for key, count in counts.most_common(n)]
+
+
+def replay(kind: str, body: dict, deadline=None):
+    """Chạy lại một request qua service (không qua API nên không bị ghi lại vào log)."""
+    from . import geocoding_service, pathfinding_service
+    from src.app.schemas.route_input_format import RouteRequest
+
+    if kind == "geocode":
+        return geocoding_service.get_coords_from_address(body["address"])
+    if kind == "reverse":
+        return geocoding_service.get_address_from_coords(body["lat"], body["lon"])
+    return pathfinding_service.find_standard_route_current(RouteRequest(**body), deadline=deadline)
+
+
+# ----------------------------------------------------------------------
+# Làm nóng cache
+# ----------------------------------------------------------------------
+
+def warm_caches(path: str = REQUEST_LOG_FILE, top_n: int = WARMUP_TOP_N, kinds=KINDS,
+                geocode_interval: float = WARMUP_GEOCODE_INTERVAL_SECONDS) -> dict:
+    """
+    Chạy lại top_n request phổ biến nhất. Geocoding đi trước và được giãn cách (Nominatim);
+    số tuyến đường không vượt quá kích thước cache tuyến để không tự đẩy nhau ra.
+    Tuyến đường chạy qua routing_executor như request thật (giới hạn worker, hàng đợi và deadline);
+    hàng đợi đầy thì dừng làm nóng để nhường chỗ cho request của người dùng.
+    """
+    from .pathfinding_service import route_cache
+    from .routing_executor import routing_executor, QueueFullError
+
+    started = time.perf_counter()
+    top = top_requests(read_log(path, kinds), top_n)
+    routes = [t for t in top if t[1] == "route"][:max(route_cache.max_entries, 0)]
+    geocodes = [t for t in top if t[1] != "route"]
+    done, failed = Counter(), 0
+    for _, kind, body in geocodes + routes:
+        try:
+            if kind == "route":
+                routing_executor.call(replay, kind, body)
+            else:
+                replay(kind, body)
+            done[kind] += 1
+        except QueueFullError:
+            metrics.inc("warmup_failures", kind=kind)
+            print("[warmup] hàng đợi tìm đường đầy, dừng làm nóng")
+            break
+        except Exception as e:
+            failed += 1
+            metrics.inc("warmup_failures", kind=kind)
+            if failed <= 3:
+                print(f"[warmup] {kind} lỗi: {e}")
+        if kind != "route" and geocode_interval > 0:
+            time.sleep(geocode_interval)
+    elapsed = time.perf_counter() - started
+    metrics.observe("warmup_seconds", elapsed)
+    summary = {**done, "failed": failed, "seconds": round(elapsed, 2)}
+    print(f"[warmup] đã chạy lại các request phổ biến: {summary}")
+    return summary
+
+
+def start_warmup(store, path: str = REQUEST_LOG_FILE, top_n: int = WARMUP_TOP_N):
+    """
+    Làm nóng cache ở nền ngay bây giờ và sau mỗi lần graph_store đổi phiên bản
+    (lúc đó chỉ tuyến đường cần chạy lại, cache geocoding vẫn còn).
+    Hook luôn được đăng ký: log có thể chưa có lúc khởi động mà được ghi dần trước lần nạp lại sau.
+    """
+    if not path or top_n <= 0:
+        return
+
+    def run(kinds):
+        if not (os.path.exists(path) or os.path.exists(path + ".1")):
+            return
+        threading.Thread(target=warm_caches, args=(path, top_n, kinds), name="cache-warmup", daemon=True).start()
+
+    run(KINDS)
+    store.subscribe(lambda version: run(("route",)))
+
+
+# ======================================================================
+# Lệnh độc lập
+# ======================================================================
+
+def _percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] if values else float("nan")
+
+
+def _bench(entries: list, concurrency: int, label: str):
+    latencies, errors = [], 0
+
+    def run(entry):
+        started = time.perf_counter()
+        result = replay(entry["k"], entry["q"])
+        return time.perf_counter() - started, "error" in result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, error in pool.map(run, entries):
+            latencies.append(elapsed)
+            errors += error
+    total = time.perf_counter() - started
+    print(f"{label}: {len(entries)} request trong {total:.2f}s ({len(entries) / total:,.1f}/s), "
+          f"p50 {_percentile(latencies, 0.5) * 1000:.1f}ms, p95 {_percentile(latencies, 0.95) * 1000:.1f}ms, "
+          f"p99 {_percentile(latencies, 0.99) * 1000:.1f}ms, lỗi {errors}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xem / chạy lại nhật ký request")
+    parser.add_argument("--log", default=REQUEST_LOG_FILE)
+    parser.add_argument("--top", type=int, metavar="N", help="in N request phổ biến nhất")
+    parser.add_argument("--bench", action="store_true",
+                        help="chạy lại các request tìm đường của log theo thứ tự ghi (lạnh rồi nóng)")
+    parser.add_argument("--graphml", help="đồ thị cho --bench (mặc định nạp theo GRAPH_SOURCE)")
+    parser.add_argument("--limit", type=int, help="chỉ dùng N request đầu tiên")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--no-cache", action="store_true", help="tắt cache tuyến đường khi benchmark")
+    args = parser.parse_args(argv)
+
+    if args.top:
+        for count, kind, body in top_requests(read_log(args.log), args.top):
+            print(f"{count:6d}  {kind:8s} {json.dumps(body, ensure_ascii=False)}")
+
+    if args.bench:
+        from . import pathfinding_service
+        from .graph_store import graph_store
+
+        entries = list(read_log(args.log, kinds=("route",)))[:args.limit]
+        if not entries:
+            print(f"không có request tìm đường nào trong {args.log}")
+            return
+        if args.no_cache:
+            pathfinding_service.route_cache.max_entries = 0
+        if args.graphml:
+            from .region_registry import load_graphml
+
+            graph_store.publish(load_graphml(args.graphml))
+        elif graph_store.reload() is None:
+            print(f"không nạp được đồ thị: {graph_store.status['error']}")
+            return
+        _bench(entries, args.concurrency, "lạnh")
+        _bench(entries, args.concurrency, "nóng")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+# src/services/route_subscriptions.py
+"""
+Theo dõi tuyến đường: client đăng ký một tuyến, server tự tính lại và đẩy tuyến mới (qua SSE)
+khi vùng ngập / vùng cấm phía server (zone_state) hoặc tốc độ trực tiếp thay đổi trên chính tuyến đó.
+
+- Tuyến được tính như /find-standard-route với vùng của request cộng các vùng đang có hiệu lực
+  của zone_state.
+- Chỉ mục cạnh -> đăng ký (và mảng đếm số đăng ký theo cạnh) nên mỗi cập nhật chỉ tốn
+  O(số cạnh bị ảnh hưởng), không phụ thuộc số đăng ký.
+- Xóa một vùng chỉ tính lại các đăng ký đã bị vùng đó ảnh hưởng (tuyến đi vòng có thể quay lại).
+  Cạnh ngoài tuyến nhanh lên không làm tính lại.
+- Việc tính lại chạy ở một thread riêng, gộp nhiều cập nhật liên tiếp của cùng một đăng ký;
+  kết quả được đưa vào hàng đợi asyncio của kết nối SSE bằng loop.call_soon_threadsafe.
+- Phiên bản đồ thị mới: mọi đăng ký được tính lại.
+- Đăng ký thuộc store phục vụ điểm đầu / điểm cuối của nó (đồ thị mặc định hoặc một vùng của
+  region_registry): chỉ mục cạnh, vùng ngập / vùng cấm và sự kiện đổi phiên bản đều theo store đó.
+- Mỗi đăng ký có token ngẫu nhiên (trả về khi đăng ký); gắn SSE và hủy đăng ký phải kèm token.
+- Việc tính lại nền đi qua routing_executor như request tìm đường nên vẫn chịu giới hạn đồng thời;
+  hàng đợi đầy thì đăng ký được giữ lại và thử lại ở vòng sau.
+"""
+import asyncio
+import functools
+import itertools
+import secrets
+import threading
+import time
+
+import numpy as np
+
+from src.app.core import metrics
+from src.app.core.config import ROUTING_TIMEOUT_SECONDS, SUBSCRIPTION_MAX, SUBSCRIPTION_IDLE_SECONDS, \
+    SUBSCRIPTION_MIN_DURATION_CHANGE_SECONDS
+from src.app.schemas.route_input_format import RouteRequest
+from . import pathfinding_service
+from .graph_store import graph_store
+from .region_registry import region_registry
+from .routing_executor import Deadline, DeadlineExceededError, QueueFullError, routing_executor
+
+
+class TooManySubscriptionsError(Exception):
+    """Đã đạt SUBSCRIPTION_MAX đăng ký."""
+
+
+class Subscription:
+    def __init__(self, sub_id: int, request: RouteRequest, store: str = graph_store.name):
+        self.id = sub_id
+        self.token = secrets.token_urlsafe(24)
+        self.request = request
+        self.store = store                          # tên store (đồ thị mặc định / vùng) phục vụ tuyến
+        self.result = None
+        self.graph_version = None
+        self.edges = np.empty(0, dtype=np.int64)    # cạnh gốc của tuyến hiện tại (cả hai chiều)
+        self.bounds = None                          # khung bao điểm đầu, điểm cuối và tuyến
+        self.zones = set()                          # id các vùng (của store) đã ảnh hưởng tới tuyến
+        self.loop = None
+        self.queue = None
+        self.detached_at = time.monotonic()
+
+
+def _offer(queue: asyncio.Queue, event: dict):
+    """Chạy trong event loop: chỉ giữ sự kiện mới nhất nếu client đọc chậm."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+def _push(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, event):
+    """Đưa sự kiện từ thread khác vào event loop của kết nối SSE (bỏ qua nếu loop đã đóng)."""
+    try:
+        loop.call_soon_threadsafe(_offer, queue, event)
+    except RuntimeError:
+        pass
+
+
+def _route_edges(compact, path: list) -> np.ndarray:
+    """Cạnh gốc nối các node liên tiếp của tuyến, lấy cả hai chiều (hồ sơ đi bộ đi ngược cạnh một chiều)."""
+    if not path or len(path) < 2:
+        return np.empty(0, dtype=np.int64)
+    nodes = compact.node_indices(path)
+    edges = []
+    for a, b in zip(nodes[:-1], nodes[1:]):
+        for u, v in ((a, b), (b, a)):
+            if u < 0:
+                continue
+            edges += [e for e in compact.out_edges(u) if compact.edge_target[e] == v]
+    return np.unique(np.asarray(edges, dtype=np.int64))
+
+
+def _session(sub_id: int) -> str:
+    """Phiên tìm kiếm tăng dần của đăng ký: khi vùng / tốc độ đổi, tuyến được sửa thay vì tìm lại từ đầu."""
+    return f"subscription:{sub_id}"
+
+
+def _zones(store: str) -> list:
+    state = region_registry.zones_for(store)
+    return state.zones() if state is not None else []
+
+
+def _with_active_zones(request: RouteRequest, store: str = graph_store.name) -> RouteRequest:
+    zones = _zones(store)
+    if not zones:
+        return request
+    return request.model_copy(update={
+        "flood_areas": request.flood_areas + [z["geometry"] for z in zones if z["kind"] == "flood"],
+        "ban_areas": request.ban_areas + [z["geometry"] for z in zones if z["kind"] == "ban"],
+    })
+
+
+def _changed(old: dict | None, new: dict) -> bool:
+    if old is None:
+        return True
+    if old.get("error") != new.get("error") or old.get("path") != new.get("path"):
+        return True
+    if "duration" in old and "duration" in new:
+        return abs(new["duration"] - old["duration"]) * 60 >= SUBSCRIPTION_MIN_DURATION_CHANGE_SECONDS
+    return False
+
+
+class _EdgeIndex:
+    """Chỉ mục cạnh -> đăng ký trên phiên bản hiện tại của một store (cạnh được đánh số theo phiên bản)."""
+
+    def __init__(self, graph_version: str = None, num_edges: int = None):
+        self.graph_version = graph_version
+        self.by_edge = {}           # cạnh gốc -> set(id đăng ký)
+        # int32 [E]: số đăng ký trên mỗi cạnh, để lọc nhanh bằng numpy
+        self.edge_refs = np.zeros(num_edges, dtype=np.int32) if num_edges is not None else None
+
+
+class SubscriptionRegistry:
+    def __init__(self, max_subscriptions: int = SUBSCRIPTION_MAX):
+        self.max_subscriptions = max_subscriptions
+        self._subs = {}
+        self._ids = itertools.count(1)
+        self._graphs = {}           # tên store -> _EdgeIndex
+        self._by_zone = {}          # (tên store, id vùng) -> set(id đăng ký)
+        self._dirty = {}            # id đăng ký -> lý do cần tính lại
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._worker = None
+
+    # ------------------------------------------------------------------
+    # Đăng ký
+    # ------------------------------------------------------------------
+
+    def subscribe(self, request: RouteRequest, deadline=None) -> Subscription:
+        """Tạo đăng ký và tính tuyến ban đầu (chạy trong worker tìm đường)."""
+        with self._lock:
+            if len(self._subs) >= self.max_subscriptions:
+                raise TooManySubscriptionsError(f"đã có {len(self._subs)} đăng ký theo dõi tuyến đường")
+            points = (request.start_point, request.end_point)
+            store = region_registry.name_of([p.lat for p in points], [p.lon for p in points])
+            sub = Subscription(next(self._ids), request, store)
+            self._subs[sub.id] = sub
+            self._ensure_worker()
+        metrics.set_gauge("route_subscriptions", len(self._subs))
+        try:
+            self._recompute(sub, "initial", deadline)
+        except Exception:
+            self.unsubscribe(sub.id)
+            raise
+        return sub
+
+    def get(self, sub_id: int) -> Subscription | None:
+        return self._subs.get(sub_id)
+
+    def authorize(self, sub_id: int, token: str) -> Subscription | None:
+        """Đăng ký nếu token khớp, ngược lại None (không phân biệt với đăng ký không tồn tại)."""
+        sub = self._subs.get(sub_id)
+        if sub is None or not token or not secrets.compare_digest(sub.token, token):
+            return None
+        return sub
+
+    def unsubscribe(self, sub_id: int) -> bool:
+        with self._lock:
+            sub = self._subs.pop(sub_id, None)
+            if sub is None:
+                return False
+            self._index(sub, np.empty(0, dtype=np.int64))
+            for zone_id in sub.zones:
+                self._by_zone.get((sub.store, zone_id), set()).discard(sub_id)
+            self._dirty.pop(sub_id, None)
+            loop, queue = sub.loop, sub.queue
+            sub.loop = sub.queue = None
+        pathfinding_service.route_sessions.drop(_session(sub_id))
+        if loop is not None:
+            _push(loop, queue, None)
+        metrics.set_gauge("route_subscriptions", len(self._subs))
+        return True
+
+    def attach(self, sub_id: int, token: str, loop: asyncio.AbstractEventLoop) -> asyncio.Queue | None:
+        """
+        Gắn kết nối SSE (gọi trong event loop); trả về hàng đợi sự kiện, đã có sẵn tuyến hiện tại.
+        None nếu không có đăng ký hoặc token sai. Kết nối cũ của cùng đăng ký (nếu có) nhận None và kết thúc.
+        """
+        queue = asyncio.Queue(maxsize=1)
+        with self._lock:
+            sub = self.authorize(sub_id, token)
+            if sub is None:
+                return None
+            old_loop, old_queue = sub.loop, sub.queue
+            sub.loop, sub.queue = loop, queue
+            if sub.result is not None:
+                queue.put_nowait(self._event(sub, "current"))
+        if old_loop is not None:
+            _push(old_loop, old_queue, None)
+        return queue
+
+    def detach(self, sub_id: int, queue: asyncio.Queue):
+        with self._lock:
+            sub = self._subs.get(sub_id)
+            if sub is not None and sub.queue is queue:
+                sub.loop = sub.queue = None
+                sub.detached_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscriptions": len(self._subs),
+                "connected": sum(1 for s in self._subs.values() if s.queue is not None),
+                "indexed_edges": sum(len(g.by_edge) for g in self._graphs.values()),
+                "pending": len(self._dirty),
+            }
+
+    # ------------------------------------------------------------------
+    # Chỉ mục cạnh -> đăng ký (gọi khi đang giữ khóa)
+    # ------------------------------------------------------------------
+
+    def _graph(self, store: str) -> _EdgeIndex:
+        graph = self._graphs.get(store)
+        if graph is None:
+            graph = self._graphs[store] = _EdgeIndex()
+        return graph
+
+    def _index(self, sub: Subscription, edges: np.ndarray):
+        graph = self._graph(sub.store)
+        for e in sub.edges.tolist():
+            ids = graph.by_edge.get(e)
+            if ids is not None:
+                ids.discard(sub.id)
+                if not ids:
+                    del graph.by_edge[e]
+        if graph.edge_refs is not None and len(sub.edges):
+            graph.edge_refs[sub.edges] -= 1
+        sub.edges = edges
+        for e in edges.tolist():
+            graph.by_edge.setdefault(e, set()).add(sub.id)
+        if graph.edge_refs is not None and len(edges):
+            graph.edge_refs[edges] += 1
+
+    def _subscribers(self, store: str, edges: np.ndarray) -> set:
+        graph = self._graphs.get(store)
+        if graph is None or graph.edge_refs is None or not len(edges):
+            return set()
+        hit = edges[graph.edge_refs[edges] > 0]
+        ids = set()
+        for e in hit.tolist():
+            ids |= graph.by_edge.get(e, set())
+        return ids
+
+    def _reset_graph(self, store: str, version=None):
+        """Bỏ chỉ mục cạnh của store (gọi khi đang giữ khóa); version None = store không còn đồ thị."""
+        compact = version.indexes.get("compact_graph") if version is not None else None
+        self._graphs[store] = _EdgeIndex(
+            version.version if version is not None else None,
+            compact.num_edges if compact is not None else None,
+        )
+        for sub in self._subs.values():
+            if sub.store == store:
+                sub.edges = np.empty(0, dtype=np.int64)
+
+    def _mark(self, ids, reason: str):
+        for sub_id in ids:
+            self._dirty.setdefault(sub_id, reason)
+        if ids:
+            self._wake.notify()
+
+    # ------------------------------------------------------------------
+    # Sự kiện
+    # ------------------------------------------------------------------
+
+    def on_graph_published(self, version, store: str = graph_store.name):
+        """Cạnh được đánh số lại theo phiên bản mới: xóa chỉ mục của store và tính lại các đăng ký của nó."""
+        traffic = version.indexes.get("live_traffic")
+        if traffic is not None:
+            traffic.subscribe(lambda edges, v=version.version: self.on_weights_changed(v, edges, store))
+        with self._lock:
+            self._reset_graph(store, version)
+            self._mark([s.id for s in self._subs.values() if s.store == store], "graph")
+
+    def on_graph_unloaded(self, version, store: str):
+        """Vùng bị đẩy khỏi bộ nhớ: bỏ chỉ mục; các đăng ký được tính lại khi vùng được nạp lại."""
+        with self._lock:
+            if self._graph(store).graph_version == version.version:
+                self._reset_graph(store)
+
+    def on_weights_changed(self, graph_version: str, edges: np.ndarray, store: str = graph_store.name):
+        with self._lock:
+            if graph_version != self._graph(store).graph_version:
+                return
+            ids = self._subscribers(store, edges)
+            self._mark(ids, "traffic")
+        metrics.inc("route_subscription_updates", reason="traffic")
+
+    def on_zone_changed(self, zone: dict, removed: bool, store: str = graph_store.name):
+        if removed:
+            with self._lock:
+                ids = self._by_zone.pop((store, zone["id"]), set())
+                self._mark(ids, "zone")
+            return
+
+        graph = region_registry.store_for(store)
+        version = graph.current if graph is not None else None
+        if version is None or "edge_index" not in version.indexes:
+            return
+        edges = np.unique(version.indexes["edge_index"].query(zone["shape"])).astype(np.int64)
+        with self._lock:
+            if version.version != self._graph(store).graph_version:
+                return
+            ids = self._subscribers(store, edges)
+            for sub_id in ids:
+                self._subs[sub_id].zones.add(zone["id"])
+            if ids:
+                self._by_zone.setdefault((store, zone["id"]), set()).update(ids)
+            self._mark(ids, "zone")
+        metrics.inc("route_subscription_updates", reason="zone")
+
+    def watch(self, store: str):
+        """Nghe sự kiện đổi phiên bản, đẩy ra và thay đổi vùng ngập / vùng cấm của một store."""
+        graph = region_registry.store_for(store)
+        graph.subscribe(functools.partial(self.on_graph_published, store=store))
+        graph.subscribe_unload(functools.partial(self.on_graph_unloaded, store=store))
+        region_registry.zones_for(store).subscribe(functools.partial(self.on_zone_changed, store=store))
+        if graph.current is not None:
+            self.on_graph_published(graph.current, store)
+
+    # ------------------------------------------------------------------
+    # Tính lại
+    # ------------------------------------------------------------------
+
+    def _event(self, sub: Subscription, reason: str) -> dict:
+        return {"subscription_id": sub.id, "reason": reason, "route": sub.result}
+
+    def _recompute(self, sub: Subscription, reason: str, deadline=None):
+        started = time.perf_counter()
+        request = _with_active_zones(sub.request, sub.store)
+        result = pathfinding_service.find_standard_route_current(
+            request, deadline=deadline or Deadline.after(ROUTING_TIMEOUT_SECONDS), session_id=_session(sub.id)
+        )
+        metrics.observe("route_subscription_recompute_seconds", time.perf_counter() - started, reason=reason)
+
+        store = region_registry.store_for(sub.store)
+        version = store.current if store is not None else None
+        compact = version.indexes.get("compact_graph") if version is not None else None
+        edges = _route_edges(compact, result.get("path")) if compact is not None else np.empty(0, dtype=np.int64)
+        points = [(sub.request.start_point.lon, sub.request.start_point.lat),
+                  (sub.request.end_point.lon, sub.request.end_point.lat)]
+        if len(edges):
+            points += [(compact.node_x[i], compact.node_y[i])
+                       for i in np.unique(np.concatenate([compact.edge_source[edges], compact.edge_target[edges]]))]
+        xs, ys = [p[0] for p in points], [p[1] for p in points]
+        bounds = (min(xs), min(ys), max(xs), max(ys))
+
+        with self._lock:
+            if self._subs.get(sub.id) is not sub:
+                return
+            if compact is not None and result.get("graph_version") == self._graph(sub.store).graph_version \
+                    and version.version == result.get("graph_version"):
+                self._index(sub, edges)
+            sub.graph_version = result.get("graph_version")
+            sub.bounds = bounds
+            # vùng nằm trên vùng tuyến có thể đã đẩy tuyến đi vòng: xóa vùng thì tính lại
+            for zone in _zones(sub.store):
+                zb = zone["bounds"]
+                if zb[0] <= bounds[2] and zb[2] >= bounds[0] and zb[1] <= bounds[3] and zb[3] >= bounds[1]:
+                    sub.zones.add(zone["id"])
+                    self._by_zone.setdefault((sub.store, zone["id"]), set()).add(sub.id)
+            if not _changed(sub.result, result):
+                sub.result = result
+                return
+            sub.result = result
+            loop, queue = sub.loop, sub.queue
+            event = self._event(sub, reason)
+        if loop is not None:
+            _push(loop, queue, event)
+            metrics.inc("route_subscription_pushes", reason=reason)
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="route-subscriptions", daemon=True)
+            self._worker.start()
+
+    def _idle(self) -> list:
+        """Các đăng ký không có kết nối SSE quá SUBSCRIPTION_IDLE_SECONDS (gọi khi đang giữ khóa)."""
+        now = time.monotonic()
+        return [s.id for s in self._subs.values()
+                if s.queue is None and now - s.detached_at > SUBSCRIPTION_IDLE_SECONDS]
+
+    def _run(self):
+        backoff = False
+        while True:
+            with self._lock:
+                if not self._dirty or backoff:
+                    self._wake.wait(timeout=1.0 if backoff else max(SUBSCRIPTION_IDLE_SECONDS / 4, 1.0))
+                work, self._dirty = self._dirty, {}
+                idle = self._idle()
+            backoff = False
+            for sub_id in idle:
+                self.unsubscribe(sub_id)
+            for sub_id, reason in work.items():
+                sub = self._subs.get(sub_id)
+                if sub is None:
+                    continue
+                try:
+                    routing_executor.call(self._recompute, sub, reason)
+                except QueueFullError:
+                    # request của người dùng được ưu tiên: giữ lại để tính ở vòng sau
+                    metrics.inc("route_subscription_deferred")
+                    with self._lock:
+                        self._dirty.setdefault(sub_id, reason)
+                    backoff = True
+                except DeadlineExceededError as e:
+                    print(f"[subscriptions] đăng ký {sub_id}: {e}")
+                except Exception as e:
+                    print(f"[subscriptions] lỗi khi tính lại đăng ký {sub_id}: {e}")
+
+
+subscription_registry = SubscriptionRegistry()
+for _store in [graph_store.name] + [region.name for region in region_registry.regions()]:
+    subscription_registry.watch(_store)
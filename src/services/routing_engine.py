@@ -0,0 +1,638 @@
+# src/services/routing_engine.py
+"""
+Tìm đường trên CompactGraph với các chuỗi node bậc 2 đã được rút gọn.
+
+- Node "bậc 2" (chỉ nối tiếp hai đoạn của cùng một con đường, một chiều hoặc hai chiều)
+  không cần được duyệt riêng: mỗi chuỗi như vậy giữa hai node giữ lại trở thành một
+  cạnh tìm kiếm, nhớ danh sách cạnh gốc cùng tổng chiều dài / thời gian.
+- Vùng ngập / vùng cấm vẫn áp lên từng cạnh gốc (hệ số trọng số, mặt nạ cấm); chi phí
+  cạnh tìm kiếm được cộng lại từ các cạnh gốc cho mỗi request.
+- Điểm đầu / cuối nằm giữa một chuỗi được xử lý bằng cách gieo phần còn lại của chuỗi,
+  và đường đi cuối cùng được trải lại thành các cạnh gốc cùng geometry.
+"""
+import heapq
+import math
+
+import numpy as np
+
+from src.app.core import metrics
+from .compact_graph import CompactGraph, sampled_sizeof
+
+_EARTH_RADIUS_M = 6371008.8
+HOURS = 24
+
+
+def _at(value, seconds: float) -> float:
+    """Giá trị tại thời điểm `seconds` (giây trong ngày), nội suy giữa hai mốc giờ; value(h) -> giá trị tại mốc h."""
+    x = (seconds / 3600.0) % HOURS
+    h = int(x)
+    a = value(h)
+    if a == math.inf:
+        return math.inf
+    f = x - h
+    return a * (1 - f) + value((h + 1) % HOURS) * f
+
+
+class HourlyCosts:
+    """
+    Chi phí theo giờ của từng cạnh gốc: chi phí tĩnh nhân hệ số [lớp cạnh, giờ].
+    Cột của một mốc giờ chỉ được tính khi lượt tìm chạm tới mốc đó, nên không cần mảng [E, 24].
+    """
+
+    def __init__(self, edge_cost: np.ndarray, edge_class: np.ndarray, factors: np.ndarray):
+        self.edge_cost = edge_cost      # float64 [E], đã áp vùng ngập / vùng cấm
+        self.edge_class = edge_class    # int [E], chỉ số hàng trong factors
+        self.factors = factors          # [lớp, 24]
+        self._columns = {}
+
+    def column(self, h: int) -> np.ndarray:
+        """Chi phí [E] của mọi cạnh tại mốc giờ h."""
+        values = self._columns.get(h)
+        if values is None:
+            values = self._columns[h] = self.edge_cost * self.factors[self.edge_class, h]
+        return values
+
+
+class NoPathError(Exception):
+    """Không có đường đi giữa hai node."""
+
+
+class ContractedGraph:
+    def __init__(self, compact: CompactGraph, base_cost: np.ndarray | None = None):
+        """base_cost: chi phí (giây) của từng cạnh gốc, inf = không được đi; mặc định là travel_time."""
+        self.compact = compact
+        if base_cost is None:
+            travel_time = compact.travel_time.astype(np.float64)
+            fallback = compact.length / (30 / 3.6)
+            base_cost = np.where(np.isfinite(travel_time), travel_time, fallback)
+        self.base_cost = base_cost
+        n = compact.num_nodes
+        source = compact.edge_source
+        target = compact.edge_target
+        indptr = compact.indptr
+
+        out_deg = np.diff(indptr)
+        in_deg = np.bincount(target, minlength=n)
+        self_loop = np.zeros(n, dtype=bool)
+        self_loop[source[source == target]] = True
+
+        # in-edge của mỗi node (sắp theo node cuối)
+        in_order = np.argsort(target, kind="stable")
+        in_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(in_deg, out=in_ptr[1:])
+
+        interior = np.zeros(n, dtype=bool)
+        candidates = np.flatnonzero(
+            ~self_loop & (((out_deg == 1) & (in_deg == 1)) | ((out_deg == 2) & (in_deg == 2)))
+        )
+        for v in candidates.tolist():
+            outs = set(target[indptr[v]:indptr[v + 1]].tolist())
+            ins = set(source[in_order[in_ptr[v]:in_ptr[v + 1]]].tolist())
+            if out_deg[v] == 1:
+                interior[v] = outs != ins
+            else:
+                interior[v] = len(outs) == 2 and outs == ins
+
+        self.interior = interior
+        self._build_chains()
+        metrics.set_gauge("routing_search_edges", self.num_search_edges)
+        metrics.set_gauge("routing_contracted_nodes", int(self.interior.sum()))
+
+    # ------------------------------------------------------------------
+    # Dựng các cạnh tìm kiếm
+    # ------------------------------------------------------------------
+
+    def _walk(self, e: int, chains: list, chain_of: dict):
+        """Đi theo chuỗi bắt đầu bằng cạnh gốc e cho tới node giữ lại kế tiếp."""
+        c = self.compact
+        edges = [e]
+        prev, cur = int(c.edge_source[e]), int(c.edge_target[e])
+        while self.interior[cur]:
+            nxt = None
+            for f in c.out_edges(cur):
+                if c.edge_target[f] != prev or c.indptr[cur + 1] - c.indptr[cur] == 1:
+                    nxt = f
+                    break
+            chain_of.setdefault(cur, []).append((len(chains), len(edges)))
+            edges.append(nxt)
+            prev, cur = cur, int(c.edge_target[nxt])
+        chains.append(edges)
+
+    def _build_chains(self):
+        c = self.compact
+        chains, chain_of = [], {}
+        for k in np.flatnonzero(~self.interior).tolist():
+            for e in c.out_edges(k):
+                self._walk(e, chains, chain_of)
+        # vòng khép kín chỉ gồm node bậc 2 không chạm node giữ lại nào: giữ lại một node của vòng
+        for v in np.flatnonzero(self.interior).tolist():
+            if v not in chain_of:
+                self.interior[v] = False
+                for e in c.out_edges(v):
+                    self._walk(e, chains, chain_of)
+
+        self.num_search_edges = len(chains)
+        se_source = np.array([c.edge_source[ch[0]] for ch in chains], dtype=np.int32)
+        order = np.argsort(se_source, kind="stable")
+        chains = [chains[i] for i in order]
+        remap = np.empty(len(order), dtype=np.int64)
+        remap[order] = np.arange(len(order))
+
+        self.se_source = se_source[order]
+        self.se_target = np.array([c.edge_target[ch[-1]] for ch in chains], dtype=np.int32)
+        self.se_indptr = np.zeros(c.num_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(self.se_source, minlength=c.num_nodes), out=self.se_indptr[1:])
+        self.se_offsets = np.zeros(len(chains) + 1, dtype=np.int64)
+        np.cumsum([len(ch) for ch in chains], out=self.se_offsets[1:])
+        self.se_edges = np.fromiter((e for ch in chains for e in ch), dtype=np.int32, count=self.se_offsets[-1])
+        self.se_length = np.add.reduceat(c.length.astype(np.float64)[self.se_edges], self.se_offsets[:-1]) \
+            if len(chains) else np.empty(0)
+
+        # node giữa chuỗi -> [(cạnh tìm kiếm, vị trí cạnh gốc rời khỏi node trong chuỗi)]
+        self.chain_of = {v: [(int(remap[s]), pos) for s, pos in refs] for v, refs in chain_of.items()}
+
+        # danh sách Python cho vòng lặp tìm kiếm (truy cập phần tử NumPy từng cái rất chậm)
+        self._se_indptr = self.se_indptr.tolist()
+        self._se_target = self.se_target.tolist()
+        self._se_source = self.se_source.tolist()
+        # cạnh tìm kiếm đi vào mỗi node (cho RouteRepair)
+        self._se_in = np.argsort(self.se_target, kind="stable").tolist()
+        se_in_ptr = np.zeros(c.num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.se_target, minlength=c.num_nodes), out=se_in_ptr[1:])
+        self._se_in_ptr = se_in_ptr.tolist()
+        self._lat = np.radians(c.node_y).tolist()
+        self._lon = np.radians(c.node_x).tolist()
+        # tốc độ lớn nhất (m/s) theo chi phí cơ sở, để heuristic của A* không đánh giá quá
+        usable = np.isfinite(self.base_cost) & (self.base_cost > 0)
+        speeds = c.length[usable] / self.base_cost[usable]
+        self._max_speed_ms = float(speeds.max()) if len(speeds) else 130.0 / 3.6
+        # chi phí nhỏ nhất được phép của từng cạnh (để hệ số < 1, vd. tốc độ trực tiếp, không phá heuristic)
+        self._min_cost = c.length.astype(np.float64) / self._max_speed_ms
+        # độ dài cạnh đã làm tròn có thể ngắn hơn đường chim bay một chút: A* chấp nhận sai số đó,
+        # RouteRepair thì cần heuristic nhất quán tuyệt đối nên nhân thêm hệ số này
+        lat, lon = np.radians(c.node_y), np.radians(c.node_x)
+        u, v = c.edge_source, c.edge_target
+        h = np.sin((lat[v] - lat[u]) / 2) ** 2 + np.cos(lat[u]) * np.cos(lat[v]) * np.sin((lon[v] - lon[u]) / 2) ** 2
+        straight = 2 * _EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+        apart = straight > 0
+        ratio = c.length[apart].astype(np.float64) / straight[apart]
+        self._consistent_scale = min(1.0, float(ratio.min())) * (1 - 1e-9) if len(ratio) else 1.0
+
+    # ------------------------------------------------------------------
+    # Tìm kiếm
+    # ------------------------------------------------------------------
+
+    def edge_costs(self, multiplier: np.ndarray | None = None, banned: np.ndarray | None = None) -> np.ndarray:
+        """Chi phí (giây) của từng cạnh gốc sau khi áp hệ số và mặt nạ cấm."""
+        cost = self.base_cost.copy()
+        if multiplier is not None:
+            cost *= multiplier
+            np.maximum(cost, self._min_cost, out=cost)
+        if banned is not None:
+            cost[banned] = np.inf
+        return cost
+
+    def _heuristic(self, a: int, t: int) -> float:
+        lat1, lat2 = self._lat[a], self._lat[t]
+        dlat = lat2 - lat1
+        dlon = self._lon[t] - self._lon[a]
+        h = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+        return 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h))) / self._max_speed_ms
+
+    def _partial(self, chain_cost, se: int, start: int, end: int, at: float = None) -> float:
+        """
+        Chi phí đoạn [start, end) của chuỗi se. chain_cost là chi phí tĩnh theo thứ tự se_edges,
+        hoặc HourlyCosts (khi có at): chỉ cộng hai mốc giờ quanh at.
+        """
+        off = self.se_offsets[se]
+        if at is None:
+            return float(chain_cost[off + start: off + end].sum())
+        edges = self.se_edges[off + start: off + end]
+        return _at(lambda h: float(chain_cost.column(h)[edges].sum()), at)
+
+    def _search_edge_costs(self, chain_cost, timed: bool) -> tuple:
+        """
+        (list chi phí tĩnh của các cạnh tìm kiếm, None) hoặc, với chi phí theo giờ,
+        (None, hàm (cạnh tìm kiếm, thời điểm) -> chi phí).
+        """
+        if not timed:
+            se_cost = np.add.reduceat(chain_cost, self.se_offsets[:-1]) if len(chain_cost) else chain_cost
+            return se_cost.tolist(), None
+
+        # chi phí cạnh tìm kiếm chỉ được cộng cho các mốc giờ thực sự chạm tới
+        # (một lượt tìm thường chỉ trải qua một, hai mốc giờ)
+        se_columns = {}
+
+        def column(h):
+            values = se_columns.get(h)
+            if values is None:
+                values = chain_cost.column(h)[self.se_edges]
+                values = se_columns[h] = (
+                    np.add.reduceat(values, self.se_offsets[:-1]) if len(values) else values
+                ).tolist()
+            return values
+
+        return None, lambda se, at: _at(lambda h: column(h)[se], at)
+
+    def _search(self, s: int, goals: list, edge_cost: np.ndarray, deadline=None, check_every: int = 512,
+                depart: float = None, heuristic_to: int = None, limit: float = math.inf) -> tuple:
+        """
+        Tìm kiếm từ s cho tới khi mọi đích trong goals được chốt (A* hướng về heuristic_to nếu có,
+        ngược lại Dijkstra) hoặc mọi node còn lại có chi phí vượt limit.
+        Đích nằm giữa chuỗi được biểu diễn bằng nút ảo -1 - i.
+        Trả về (dist, parent, khóa của từng đích trong dist); đích chưa được chốt không có trong dist.
+        """
+        timed = isinstance(edge_cost, HourlyCosts)
+        chain_cost = edge_cost if timed else edge_cost[self.se_edges]
+        se_cost, cost_at = self._search_edge_costs(chain_cost, timed)
+        depart = depart or 0.0
+        se_indptr, se_target = self._se_indptr, self._se_target
+        goal_keys = [t if t not in self.chain_of else -1 - i for i, t in enumerate(goals)]
+        remaining = set(goal_keys)
+
+        dist, parent, heap = {}, {}, []
+        # đích trùng điểm đầu nằm giữa chuỗi: nút ảo không bao giờ được đẩy vào hàng đợi, chốt ngay
+        for t, key in zip(goals, goal_keys):
+            if t == s and key < 0:
+                dist[key], parent[key] = 0.0, None
+                remaining.discard(key)
+
+        def push(node, g, link):
+            if g < dist.get(node, math.inf):
+                dist[node] = g
+                parent[node] = link
+                h = self._heuristic(node, heuristic_to) if heuristic_to is not None and node >= 0 else 0.0
+                heapq.heappush(heap, (g + h, g, node))
+
+        # đích nằm giữa chuỗi: tới được từ node đầu của chuỗi (hoặc từ điểm đầu nếu cùng chuỗi)
+        target_refs, target_chains = {}, {}
+        for i, t in enumerate(goals):
+            for se, pos in self.chain_of.get(t, ()):
+                target_refs.setdefault(int(self.se_source[se]), []).append((se, pos, -1 - i))
+                target_chains.setdefault(se, []).append((pos, -1 - i))
+
+        # gieo điểm đầu: node giữ lại, hoặc phần còn lại của các chuỗi đi qua nó
+        if s in self.chain_of:
+            at = depart if timed else None
+            for se, pos in self.chain_of[s]:
+                end = self.se_offsets[se + 1] - self.se_offsets[se]
+                push(self._se_target[se], self._partial(chain_cost, se, pos, end, at), (se, pos, end))
+                for pos_t, key in target_chains.get(se, ()):
+                    if pos_t > pos:
+                        push(key, self._partial(chain_cost, se, pos, pos_t, at), (se, pos, pos_t))
+        else:
+            push(s, 0.0, None)
+
+        settled = set()
+        pops = 0
+        while heap and remaining:
+            f, g, node = heapq.heappop(heap)
+            if f > limit:
+                # chi phí tạm của các đích chưa chốt chưa chắc là nhỏ nhất
+                for key in remaining:
+                    dist.pop(key, None)
+                break
+            if node in settled or g > dist.get(node, math.inf):
+                continue
+            settled.add(node)
+            remaining.discard(node)
+            if not remaining:
+                break
+            if node < 0:
+                continue  # nút ảo không có cạnh ra
+            pops += 1
+            if deadline is not None and pops % check_every == 0:
+                deadline.check()
+            for se in range(se_indptr[node], se_indptr[node + 1]):
+                cost = cost_at(se, depart + g) if timed else se_cost[se]
+                if cost != math.inf:
+                    push(se_target[se], g + cost, (se, 0, None))
+            for se, pos, key in target_refs.get(node, ()):
+                push(key, g + self._partial(chain_cost, se, 0, pos, depart + g if timed else None), (se, 0, pos))
+        metrics.observe("routing_settled_nodes", pops)
+        return dist, parent, goal_keys
+
+    def _path(self, parent: dict, goal) -> list:
+        """Trải đường đi tới goal (khóa trong parent) thành các cạnh gốc theo thứ tự."""
+        segments, node = [], goal
+        while parent[node] is not None:
+            se, start, end = parent[node]
+            off = self.se_offsets[se]
+            if end is None:
+                end = self.se_offsets[se + 1] - off
+            segments.append(self.se_edges[off + start: off + end])
+            if start > 0:
+                break  # đoạn gieo từ giữa chuỗi: đã tới điểm đầu
+            node = int(self.se_source[se])
+        return np.concatenate(segments[::-1]).tolist() if segments else []
+
+    def shortest_path(self, s: int, t: int, edge_cost: np.ndarray, deadline=None, check_every: int = 512,
+                      depart: float = None) -> tuple:
+        """
+        A* từ node s tới node t (chỉ số CompactGraph).
+        edge_cost là chi phí tĩnh [E], hoặc chi phí theo giờ (HourlyCosts) kèm depart (giây trong ngày):
+        khi đó mỗi cạnh tìm kiếm được tính tại thời điểm tới đầu cạnh.
+        Trả về (tổng chi phí, [cạnh gốc theo thứ tự]); NoPathError nếu không có đường.
+        """
+        dist, parent, (goal,) = self._search(s, [t], edge_cost, deadline, check_every, depart, heuristic_to=t)
+        if goal not in dist:
+            raise NoPathError(f"no path found between {s} and {t}")
+        return dist[goal], self._path(parent, goal)
+
+    def one_to_many(self, s: int, targets: list, edge_cost: np.ndarray, deadline=None) -> list:
+        """Chi phí từ s tới từng node trong targets bằng một lượt Dijkstra (inf nếu không tới được)."""
+        dist, _, keys = self._search(s, targets, edge_cost, deadline)
+        return [0.0 if t == s else dist.get(key, math.inf) for t, key in zip(targets, keys)]
+
+    def paths_within(self, s: int, targets: list, edge_cost: np.ndarray, limit: float, deadline=None) -> list:
+        """
+        Như one_to_many nhưng dừng khi chi phí vượt limit, và trả kèm đường đi:
+        [(chi phí, [cạnh gốc])] theo targets, (inf, None) nếu không tới được trong limit.
+        """
+        dist, parent, keys = self._search(s, targets, edge_cost, deadline, limit=limit)
+        return [
+            (0.0, []) if t == s else (dist[key], self._path(parent, key)) if key in dist else (math.inf, None)
+            for t, key in zip(targets, keys)
+        ]
+
+
+_START, _GOAL = -1, -2   # nút ảo khi điểm đầu / điểm cuối nằm giữa một chuỗi
+
+
+class RouteRepair:
+    """
+    Tìm kiếm tăng dần kiểu LPA* (Koenig & Likhachev) giữa hai node cố định của một ContractedGraph.
+
+    g / rhs và liên kết cha của các node đã duyệt được giữ giữa các lần gọi update(). Khi chi phí cạnh
+    đổi, chỉ node cuối của các cạnh bị đổi được đưa lại vào hàng đợi và cây được sửa từ đó, nên thời gian
+    sửa tỉ lệ với phần đồ thị bị ảnh hưởng chứ không với cả đồ thị:
+    - không cạnh nào đổi, hoặc chỉ có cạnh tăng chi phí nằm ngoài tuyến hiện tại: trả ngay tuyến cũ;
+    - cạnh giảm chi phí không thể làm tuyến ngắn hơn: khóa của node cuối cạnh không nhỏ hơn khóa của đích,
+      vòng lặp dừng ngay.
+    Liên kết là (cạnh tìm kiếm, vị trí đầu, vị trí cuối) như trong _search (vị trí cuối None = cả chuỗi).
+    Chỉ dùng cho chi phí tĩnh (mảng [E]); không an toàn luồng, người gọi tự giữ lock.
+    """
+
+    def __init__(self, router: ContractedGraph, s: int, t: int):
+        self.router = router
+        self.s, self.t = s, t
+        self.start = _START if s in router.chain_of else s
+        self.goal = _GOAL if t in router.chain_of else t
+        self.se_cost = None
+        self.virtual_cost = {}
+        self.g, self.rhs, self.parent = {}, {}, {}
+        self._heap, self._open = [], {}
+        self._h = {}
+        self._route = None    # (chi phí, [cạnh gốc]) của tuyến hiện tại, None nếu cần tính lại
+        self._route_links = set()
+        self.changed = 0      # số cạnh tìm kiếm / liên kết ảo đổi chi phí ở lần update() gần nhất
+        self.expanded = 0     # số node được mở rộng ở lần update() gần nhất
+
+        # liên kết ảo: phần còn lại của các chuỗi đi qua điểm đầu, phần đầu của các chuỗi tới điểm cuối
+        self._virtual = {}    # liên kết -> (node đầu, node cuối)
+        self._virtual_out, self._virtual_in = {}, {}
+        for se, pos in router.chain_of.get(s, ()):
+            end = int(router.se_offsets[se + 1] - router.se_offsets[se])
+            self._add_virtual((se, pos, end), _START, router._se_target[se])
+        for se, pos in router.chain_of.get(t, ()):
+            self._add_virtual((se, 0, pos), router._se_source[se], _GOAL)
+            for se_s, pos_s in router.chain_of.get(s, ()):
+                if se_s == se and pos_s < pos:
+                    self._add_virtual((se, pos_s, pos), _START, _GOAL)
+
+    def _add_virtual(self, link: tuple, u: int, v: int):
+        self._virtual[link] = (u, v)
+        self._virtual_out.setdefault(u, []).append((v, link))
+        self._virtual_in.setdefault(v, []).append((u, link))
+
+    # ------------------------------------------------------------------
+    # Đồ thị
+    # ------------------------------------------------------------------
+
+    def _cost(self, link: tuple) -> float:
+        se, _, end = link
+        return self.se_cost.item(se) if end is None else self.virtual_cost[link]
+
+    def _ends(self, link: tuple) -> tuple:
+        se, _, end = link
+        if end is None:
+            return self.router._se_source[se], self.router._se_target[se]
+        return self._virtual[link]
+
+    def _successors(self, u: int):
+        r = self.router
+        if u >= 0:
+            for se in range(r._se_indptr[u], r._se_indptr[u + 1]):
+                yield r._se_target[se], (se, 0, None)
+        yield from self._virtual_out.get(u, ())
+
+    def _predecessors(self, v: int):
+        r = self.router
+        if v >= 0:
+            for i in range(r._se_in_ptr[v], r._se_in_ptr[v + 1]):
+                se = r._se_in[i]
+                yield r._se_source[se], (se, 0, None)
+        yield from self._virtual_in.get(v, ())
+
+    # ------------------------------------------------------------------
+    # LPA*
+    # ------------------------------------------------------------------
+
+    def _key(self, node: int) -> tuple:
+        k = min(self.g.get(node, math.inf), self.rhs.get(node, math.inf))
+        if node == self.goal:
+            return k, k
+        h = self._h.get(node)
+        if h is None:
+            h = self._h[node] = self.router._consistent_scale * self.router._heuristic(
+                self.s if node == _START else node, self.t
+            )
+        return k + h, k
+
+    def _queue(self, v: int):
+        """Đưa v vào hàng đợi nếu không nhất quán (g != rhs), bỏ khỏi hàng đợi nếu ngược lại."""
+        self._open.pop(v, None)
+        if self.g.get(v, math.inf) != self.rhs.get(v, math.inf):
+            key = self._key(v)
+            self._open[v] = key
+            heapq.heappush(self._heap, (key, v))
+
+    def _update_vertex(self, v: int):
+        if v != self.start:
+            best, best_link = math.inf, None
+            for u, link in self._predecessors(v):
+                g = self.g.get(u, math.inf)
+                if g != math.inf:
+                    cost = g + self._cost(link)
+                    if cost < best:
+                        best, best_link = cost, link
+            if best == math.inf:
+                self.rhs.pop(v, None)
+                self.parent.pop(v, None)
+            else:
+                self.rhs[v] = best
+                self.parent[v] = best_link
+        self._queue(v)
+
+    def _relax(self, v: int, cost: float, link: tuple):
+        if cost < self.rhs.get(v, math.inf):
+            self.rhs[v] = cost
+            self.parent[v] = link
+            self._queue(v)
+
+    def _top_key(self) -> tuple:
+        heap = self._heap
+        while heap and self._open.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else (math.inf, math.inf)
+
+    def _compute(self, deadline=None, check_every: int = 512):
+        goal = self.goal
+        self._route = None
+        while self._heap:
+            top = self._top_key()
+            if not self._heap:
+                break
+            g_goal, rhs_goal = self.g.get(goal, math.inf), self.rhs.get(goal, math.inf)
+            if g_goal == rhs_goal and top >= (g_goal, g_goal):
+                break
+            self.expanded += 1
+            if deadline is not None and self.expanded % check_every == 0:
+                deadline.check()   # trước khi lấy node ra: trạng thái vẫn hợp lệ cho lần sau
+            _, u = heapq.heappop(self._heap)
+            del self._open[u]
+            g, rhs = self.g.get(u, math.inf), self.rhs.get(u, math.inf)
+            if g > rhs:
+                self.g[u] = rhs
+                for v, link in self._successors(u):
+                    cost = rhs + self._cost(link)
+                    if cost < self.rhs.get(v, math.inf):
+                        self.rhs[v] = cost
+                        self.parent[v] = link
+                        self._queue(v)
+            else:
+                self.g.pop(u, None)
+                self._update_vertex(u)
+                for v, link in self._successors(u):
+                    if self.parent.get(v) == link:
+                        self._update_vertex(v)
+
+    def _reset(self):
+        self.g, self.rhs, self.parent = {}, {}, {}
+        self._heap, self._open = [], {}
+        self.rhs[self.start] = 0.0
+        self.parent[self.start] = None
+        self._queue(self.start)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def update(self, edge_cost: np.ndarray, deadline=None, max_changed: int = None,
+               check_every: int = 512) -> tuple:
+        """
+        Áp chi phí mới của các cạnh gốc và sửa cây đường đi ngắn nhất.
+        Đổi nhiều hơn max_changed cạnh tìm kiếm thì tìm lại từ đầu (sửa lúc đó không còn rẻ hơn).
+        Lần tìm trước bị deadline cắt ngang thì lần này tìm tiếp từ hàng đợi còn lại, kể cả khi không cạnh nào đổi.
+        Trả về (tổng chi phí, [cạnh gốc theo thứ tự]) như shortest_path; NoPathError nếu không có đường.
+        """
+        r = self.router
+        chain_cost = edge_cost[r.se_edges]
+        se_cost = np.add.reduceat(chain_cost, r.se_offsets[:-1]) if len(chain_cost) else chain_cost
+        virtual_cost = {link: r._partial(chain_cost, *link) for link in self._virtual}
+        self.expanded = 0
+
+        changed = np.flatnonzero(se_cost != self.se_cost) if self.se_cost is not None else None
+        if changed is None or (max_changed is not None and len(changed) > max_changed):
+            self.se_cost, self.virtual_cost = se_cost, virtual_cost
+            self.changed = len(se_cost) if changed is None else len(changed)
+            self._reset()
+            self._compute(deadline, check_every)
+            return self._result()
+
+        updates = [((se, 0, None), old, new) for se, old, new in
+                   zip(changed.tolist(), self.se_cost[changed].tolist(), se_cost[changed].tolist())]
+        updates += [(link, self.virtual_cost[link], cost) for link, cost in virtual_cost.items()
+                    if cost != self.virtual_cost[link]]
+        self.se_cost, self.virtual_cost = se_cost, virtual_cost
+        self.changed = len(updates)
+
+        # cạnh tăng chi phí ngoài tuyến không làm tuyến hiện tại mất tối ưu: chỉ ghi nhận node bị ảnh hưởng
+        # vào hàng đợi (để lần sau sửa nếu cần) rồi trả ngay
+        needs_search = False
+        for link, old, new in updates:
+            u, v = self._ends(link)
+            if new < old:
+                needs_search = True
+                self._relax(v, self.g.get(u, math.inf) + new, link)
+            else:
+                needs_search = needs_search or link in self._route_links
+                if self.parent.get(v) == link:
+                    self._update_vertex(v)
+        # _route là None khi lần _compute trước chưa chạy xong (deadline): g của đích chưa đáng tin
+        if needs_search or self._route is None:
+            self._compute(deadline, check_every)
+        return self._result()
+
+    def nbytes(self) -> int:
+        """Bộ nhớ ước lượng của trạng thái giữ giữa các lần update() (dict lấy mẫu, xem sampled_sizeof)."""
+        size = self.se_cost.nbytes if self.se_cost is not None else 0
+        for container in (self.g, self.rhs, self.parent, self._h, self._open, self._heap, self.virtual_cost):
+            size += sampled_sizeof(container, 64)
+        return size
+
+    def _result(self) -> tuple:
+        metrics.observe("routing_repair_expanded", self.expanded)
+        if self._route is not None:
+            return self._route[0], list(self._route[1])
+        goal = self.goal
+        total = self.g.get(goal, math.inf)
+        if total == math.inf:
+            self._route_links = set()
+            raise NoPathError(f"no path found between {self.s} and {self.t}")
+
+        # lần ngược từ đích theo g: mỗi bước chọn node trước có g + chi phí cạnh nhỏ nhất
+        links, node, seen = [], goal, {goal}
+        while node != self.start:
+            best, best_link, prev = math.inf, None, None
+            for u, link in self._predecessors(node):
+                if u in seen:
+                    continue
+                cost = self.g.get(u, math.inf) + self._cost(link)
+                if cost < best:
+                    best, best_link, prev = cost, link, u
+            if best_link is None:
+                raise NoPathError(f"no path found between {self.s} and {self.t}")
+            links.append(best_link)
+            seen.add(prev)
+            node = prev
+        links.reverse()
+        self._route_links = set(links)
+
+        r = self.router
+        segments = []
+        for se, start, end in links:
+            off = r.se_offsets[se]
+            if end is None:
+                end = r.se_offsets[se + 1] - off
+            segments.append(r.se_edges[off + start: off + end])
+        self._route = (total, np.concatenate(segments).tolist() if segments else [])
+        return total, list(self._route[1])
+
+
+def build_contracted_graph(compact: CompactGraph) -> ContractedGraph:
+    return ContractedGraph(compact)
+
+
+class EdgeSpatialIndex:
+    """STRtree trên geometry của các cạnh gốc, để tìm cạnh giao với vùng ngập / vùng cấm."""
+
+    def __init__(self, compact: CompactGraph):
+        from shapely import STRtree
+
+        self.geometries = compact.edge_geometries()
+        self.tree = STRtree(self.geometries)
+
+    def query(self, geom) -> np.ndarray:
+        """Chỉ số các cạnh gốc giao với geom (cùng ngữ nghĩa GeoSeries.intersects)."""
+        return self.tree.query(geom, predicate="intersects")
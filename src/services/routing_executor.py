@@ -0,0 +1,146 @@
+# src/services/routing_executor.py
+"""
+Pool worker riêng cho các tác vụ tìm đường (CPU-bound).
+
+- Hàng đợi có giới hạn: khi đầy thì từ chối ngay (503) thay vì để latency tăng vô hạn.
+- Mỗi request có deadline; hết hạn thì hủy job đang chờ, job đang chạy
+  sẽ tự dừng ở lần kiểm tra deadline kế tiếp (xem Deadline.check).
+- Độ sâu hàng đợi và thời gian chờ được xuất qua src.app.core.metrics.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from src.app.core import metrics
+from src.app.core.config import ROUTING_WORKERS, ROUTING_QUEUE_SIZE, ROUTING_TIMEOUT_SECONDS
+
+
+class QueueFullError(Exception):
+    """Hàng đợi tìm đường đã đầy, request bị từ chối."""
+
+
+class DeadlineExceededError(Exception):
+    """Tác vụ tìm đường vượt quá deadline."""
+
+
+class Deadline:
+    """Deadline của một request, được truyền xuống service để kiểm tra định kỳ."""
+
+    def __init__(self, expires_at: float, cancel_event: threading.Event | None = None):
+        self.expires_at = expires_at
+        self._cancel_event = cancel_event or threading.Event()
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def expired(self) -> bool:
+        return self._cancel_event.is_set() or time.monotonic() >= self.expires_at
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceededError("tìm đường vượt quá thời gian cho phép")
+
+
+class RoutingExecutor:
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="routing")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    def _publish_gauges(self):
+        metrics.set_gauge("routing_queue_depth", self._queued)
+        metrics.set_gauge("routing_active_workers", self._running)
+
+    def _admit(self):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                metrics.inc("routing_rejected")
+                raise QueueFullError("hệ thống tìm đường đang quá tải, vui lòng thử lại sau")
+            self._queued += 1
+            self._publish_gauges()
+
+    def submit(self, fn, *args, timeout: float = ROUTING_TIMEOUT_SECONDS, **kwargs) -> tuple:
+        """
+        Đưa fn(*args, deadline=..., **kwargs) vào pool worker; trả về (future, deadline).
+        Ném QueueFullError nếu hàng đợi đầy.
+        """
+        self._admit()
+        enqueued_at = time.monotonic()
+        deadline = Deadline(enqueued_at + timeout)
+        started = threading.Event()
+
+        def job():
+            with self._lock:
+                started.set()
+                self._queued -= 1
+                self._running += 1
+                self._publish_gauges()
+            metrics.observe("routing_queue_wait_seconds", time.monotonic() - enqueued_at)
+            try:
+                deadline.check()
+                result = fn(*args, deadline=deadline, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._publish_gauges()
+            metrics.observe("routing_total_seconds", time.monotonic() - enqueued_at)
+            return result
+
+        def on_done(f):
+            # Job bị hủy khi còn trong hàng đợi thì không bao giờ chạy -> tự trả slot
+            if f.cancelled() and not started.is_set():
+                with self._lock:
+                    self._queued -= 1
+                    self._publish_gauges()
+
+        future = self._pool.submit(job)
+        future.add_done_callback(on_done)
+        return future, deadline
+
+    def _expire(self, future, deadline: Deadline):
+        deadline.cancel()
+        future.cancel()
+        metrics.inc("routing_deadline_exceeded")
+        raise DeadlineExceededError("tìm đường vượt quá thời gian cho phép")
+
+    async def run(self, fn, *args, timeout: float = ROUTING_TIMEOUT_SECONDS, **kwargs):
+        """
+        Chạy fn(*args, deadline=..., **kwargs) trên pool worker.
+        Ném QueueFullError nếu hàng đợi đầy, DeadlineExceededError nếu hết hạn.
+        """
+        future, deadline = self.submit(fn, *args, timeout=timeout, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._expire(future, deadline)
+        except DeadlineExceededError:
+            metrics.inc("routing_deadline_exceeded")
+            raise
+
+    def call(self, fn, *args, timeout: float = ROUTING_TIMEOUT_SECONDS, **kwargs):
+        """Như run nhưng chờ đồng bộ, cho các thread nền (tính lại đăng ký, làm nóng cache) ngoài event loop."""
+        future, deadline = self.submit(fn, *args, timeout=timeout, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._expire(future, deadline)
+        except DeadlineExceededError:
+            metrics.inc("routing_deadline_exceeded")
+            raise
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+routing_executor = RoutingExecutor(ROUTING_WORKERS, ROUTING_QUEUE_SIZE)
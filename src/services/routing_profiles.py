@@ -0,0 +1,171 @@
+# src/services/routing_profiles.py
+"""
+Hồ sơ phương tiện (car, motorbike, foot) cho việc tìm đường.
+
+Mỗi hồ sơ gồm luật được đi (loại đường, tag access, có tuân theo đường một chiều không)
+và tốc độ theo loại đường. Khi nạp đồ thị, trọng số của từng hồ sơ được tính sẵn thành mảng
+cùng các chỉ mục dẫn xuất riêng (đồ thị rút gọn, chỉ mục liên thông), nên đổi hồ sơ
+không tốn thêm chi phí cho mỗi request.
+"""
+import ast
+
+import numpy as np
+
+from .compact_graph import CompactGraph
+from .connectivity import ConnectivityIndex
+from .routing_engine import ContractedGraph
+
+DEFAULT_PROFILE = "car"
+
+
+class Profile:
+    def __init__(self, name: str, speeds: dict, default_speed: float, denied_highways: set = (),
+                 denied_access: set = (), oneway: bool = True, use_edge_speed: bool = False,
+                 congestion: bool = True):
+        self.name = name
+        self.speeds = speeds                    # loại đường -> km/h
+        self.default_speed = default_speed      # km/h cho loại đường không có trong bảng
+        self.denied_highways = set(denied_highways)
+        self.denied_access = set(denied_access)
+        self.oneway = oneway                    # False: được đi ngược chiều đường một chiều
+        self.use_edge_speed = use_edge_speed    # cạnh có maxspeed dùng speed_kph của dữ liệu
+        self.congestion = congestion            # chịu hệ số tắc đường theo giờ (xem time_profiles)
+
+
+_NO_MOTOR = {"footway", "path", "pedestrian", "steps", "cycleway", "corridor", "bridleway"}
+
+PROFILES = {
+    "car": Profile(
+        "car",
+        speeds={"motorway": 80, "trunk": 60, "primary": 45, "secondary": 40, "tertiary": 35,
+                "unclassified": 30, "residential": 25, "service": 15, "living_street": 10},
+        default_speed=25,
+        denied_highways=_NO_MOTOR | {"track"},
+        denied_access={"no", "private"},
+        use_edge_speed=True,
+    ),
+    "motorbike": Profile(
+        "motorbike",
+        speeds={"trunk": 50, "primary": 40, "secondary": 35, "tertiary": 30, "unclassified": 30,
+                "residential": 25, "service": 20, "living_street": 15, "track": 15},
+        default_speed=25,
+        # xe máy không được đi đường cao tốc
+        denied_highways=_NO_MOTOR | {"motorway", "motorway_link"},
+        denied_access={"no", "private"},
+    ),
+    "foot": Profile(
+        "foot",
+        speeds={"steps": 2.5},
+        default_speed=5,
+        denied_highways={"motorway", "motorway_link", "trunk", "trunk_link"},
+        denied_access={"no", "private"},
+        oneway=False,
+        congestion=False,
+    ),
+}
+
+
+def highway_classes(value) -> list:
+    """highway có thể là chuỗi, tuple (sau simplify) hoặc chuỗi dạng list (từ PostGIS)."""
+    if value is None:
+        return []
+    if isinstance(value, str) and value.startswith("["):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return [value]
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def per_code(compact: CompactGraph, name: str, fn) -> np.ndarray:
+    """Tính fn(giá trị) một lần cho mỗi giá trị trong bảng từ điển rồi trải ra theo cạnh."""
+    codes, table = compact.strings[name]
+    values = [fn(value) for value in table]
+    lookup = np.array(values + [fn(None)])  # mã -1 -> phần tử cuối
+    return lookup[np.where(codes >= 0, codes, len(values))]
+
+
+def profile_weights(compact: CompactGraph, profile: Profile) -> np.ndarray:
+    """Thời gian đi (giây) của từng cạnh theo hồ sơ; cạnh không được phép đi có giá trị inf."""
+    def allowed(highway):
+        classes = highway_classes(highway)
+        # cạnh gộp nhiều loại đường (sau simplify) được đi nếu một loại được phép
+        return not classes or any(c not in profile.denied_highways for c in classes)
+
+    def speed(highway):
+        classes = [c for c in highway_classes(highway) if c not in profile.denied_highways]
+        return max((profile.speeds.get(c, profile.default_speed) for c in classes), default=profile.default_speed)
+
+    ok = per_code(compact, "highway", allowed).astype(bool)
+    if "access" in compact.strings:
+        ok &= ~per_code(compact, "access", lambda a: a in profile.denied_access).astype(bool)
+
+    speed_kph = per_code(compact, "highway", speed).astype(np.float64)
+    if profile.use_edge_speed and "maxspeed" in compact.strings:
+        # speed_kph luôn được osmnx điền (trung bình theo loại đường khi thiếu maxspeed),
+        # nên chỉ tin nó ở cạnh có maxspeed thật; các cạnh khác dùng bảng tốc độ của hồ sơ
+        posted = compact.strings["maxspeed"][0] >= 0
+        posted &= np.isfinite(compact.speed_kph)
+        speed_kph = np.where(posted, compact.speed_kph, speed_kph)
+    weights = compact.length.astype(np.float64) / (speed_kph / 3.6)
+    weights[~ok] = np.inf
+    return weights
+
+
+def _with_reverse_edges(compact: CompactGraph) -> tuple:
+    """
+    Thêm cạnh ngược cho các cạnh một chiều (hồ sơ đi bộ).
+    Trả về (CompactGraph mới, mảng chỉ số cạnh gốc của từng cạnh).
+    """
+    base = np.arange(compact.num_edges)
+    reverse = np.flatnonzero(compact.oneway)
+    origin = np.concatenate([base, reverse])
+    source = np.concatenate([compact.edge_source, compact.edge_target[reverse]])
+    target = np.concatenate([compact.edge_target, compact.edge_source[reverse]])
+    key = np.concatenate([compact.edge_key, compact.edge_key[reverse] + 1_000_000])
+    order = np.argsort(source, kind="stable")
+    origin, source, target, key = origin[order], source[order], target[order], key[order]
+    is_reverse = order >= compact.num_edges
+
+    indptr = np.zeros(compact.num_nodes + 1, dtype=np.int32)
+    np.cumsum(np.bincount(source, minlength=compact.num_nodes), out=indptr[1:])
+    parts = [compact.edge_coords(o)[::-1] if r else compact.edge_coords(o)
+             for o, r in zip(origin.tolist(), is_reverse.tolist())]
+    geom_offsets = np.zeros(len(origin) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in parts], out=geom_offsets[1:])
+
+    graph = CompactGraph(
+        compact.node_osmid, compact.node_x, compact.node_y, indptr,
+        source.astype(np.int32), target.astype(np.int32), key.astype(np.int32),
+        length=compact.length[origin], travel_time=compact.travel_time[origin],
+        speed_kph=compact.speed_kph[origin], oneway=np.zeros(len(origin), dtype=bool),
+        strings={name: (codes[origin], table) for name, (codes, table) in compact.strings.items()},
+        geom_offsets=geom_offsets,
+        geom_coords=np.concatenate(parts) if parts else np.empty((0, 2)),
+        crs=compact.crs,
+    )
+    return graph, origin
+
+
+class ProfileIndex:
+    """Đồ thị, trọng số và chỉ mục dẫn xuất của một hồ sơ."""
+
+    def __init__(self, compact: CompactGraph, profile: Profile):
+        self.profile = profile
+        if profile.oneway:
+            self.compact, self.edge_origin = compact, None
+        else:
+            self.compact, self.edge_origin = _with_reverse_edges(compact)
+        self.weights = profile_weights(self.compact, profile)
+        self.router = ContractedGraph(self.compact, self.weights)
+        self.connectivity = ConnectivityIndex(self.compact, allowed=np.isfinite(self.weights))
+
+    def map_overlay(self, values: np.ndarray | None) -> np.ndarray | None:
+        """Chuyển mảng theo cạnh của đồ thị gốc (hệ số, mặt nạ cấm) sang cạnh của hồ sơ."""
+        if values is None or self.edge_origin is None:
+            return values
+        return values[self.edge_origin]
+
+
+def build_profile_indexes(compact: CompactGraph) -> dict:
+    return {name: ProfileIndex(compact, profile) for name, profile in PROFILES.items()}
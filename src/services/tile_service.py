@@ -0,0 +1,166 @@
+# src/services/tile_service.py
+"""
+Định tuyến theo ô lưới (tiled routing) cho khu vực lớn.
+
+Đồ thị được chia thành các ô vuông TILE_SIZE_DEG x TILE_SIZE_DEG (WGS84) trong PostGIS.
+Khi tìm đường chỉ nạp các ô nằm trong hành lang quanh đoạn thẳng nối điểm đầu và điểm cuối,
+giữ chúng trong cache LRU có giới hạn theo số cạnh.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+import pandas as pd
+
+from src.app.core import metrics
+from src.app.core.config import TILE_SIZE_DEG, TILE_CACHE_MAX_EDGES
+from . import map_data_service
+
+
+def tile_of(lat: float, lon: float) -> tuple:
+    """Trả về khóa ô (tile_x, tile_y) chứa tọa độ (lat, lon)."""
+    return math.floor(lon / TILE_SIZE_DEG), math.floor(lat / TILE_SIZE_DEG)
+
+
+def corridor_tiles(start: tuple, end: tuple, margin: int) -> set:
+    """
+    Tập các ô nằm trong hành lang rộng `margin` ô quanh đoạn thẳng start -> end.
+    start, end: (lat, lon)
+    """
+    sx, sy = tile_of(*start)
+    ex, ey = tile_of(*end)
+    dx, dy = ex - sx, ey - sy
+    seg_len_sq = dx * dx + dy * dy
+    # nửa đường chéo của một ô, để ô bị đoạn thẳng cắt qua góc vẫn được giữ
+    limit = margin + math.sqrt(2) / 2
+
+    tiles = set()
+    for tx in range(min(sx, ex) - margin, max(sx, ex) + margin + 1):
+        for ty in range(min(sy, ey) - margin, max(sy, ey) + margin + 1):
+            if seg_len_sq == 0:
+                t = 0.0
+            else:
+                t = max(0.0, min(1.0, ((tx - sx) * dx + (ty - sy) * dy) / seg_len_sq))
+            px, py = sx + t * dx, sy + t * dy
+            if math.hypot(tx - px, ty - py) <= limit:
+                tiles.add((tx, ty))
+    return tiles
+
+
+def boundary_tiles(tiles: set) -> set:
+    """Các ô ở rìa hành lang (có ít nhất một ô kề không thuộc hành lang)."""
+    return {
+        (tx, ty) for tx, ty in tiles
+        if any((tx + ox_, ty + oy_) not in tiles for ox_, oy_ in ((1, 0), (-1, 0), (0, 1), (0, -1)))
+    }
+
+
+class _Tile:
+    __slots__ = ("nodes", "edges")
+
+    def __init__(self, nodes: list, edges: list):
+        self.nodes = nodes  # [(osmid, attrs), ...]
+        self.edges = edges  # [(u, v, key, attrs), ...]
+
+
+def _row_attrs(columns, values) -> dict:
+    # Bỏ giá trị rỗng giống ox.graph_from_gdfs
+    return {k: v for k, v in zip(columns, values) if isinstance(v, list) or pd.notnull(v)}
+
+
+def _split_by_tile(nodes_gdf, edges_gdf) -> dict:
+    tiles = {}
+    if not nodes_gdf.empty:
+        nodes_gdf = nodes_gdf.copy()
+        nodes_gdf['x'] = nodes_gdf.geometry.x
+        nodes_gdf['y'] = nodes_gdf.geometry.y
+        node_cols = [c for c in nodes_gdf.columns if c not in ('osmid', 'tile_x', 'tile_y', 'geometry')]
+        for (tx, ty), group in nodes_gdf.groupby(['tile_x', 'tile_y']):
+            tile = tiles.setdefault((int(tx), int(ty)), _Tile([], []))
+            for osmid, values in zip(group['osmid'], group[node_cols].itertuples(index=False, name=None)):
+                tile.nodes.append((osmid, _row_attrs(node_cols, values)))
+    if not edges_gdf.empty:
+        edge_cols = [c for c in edges_gdf.columns if c not in ('u', 'v', 'key', 'tile_x', 'tile_y')]
+        for (tx, ty), group in edges_gdf.groupby(['tile_x', 'tile_y']):
+            tile = tiles.setdefault((int(tx), int(ty)), _Tile([], []))
+            for u, v, k, values in zip(
+                group['u'], group['v'], group['key'], group[edge_cols].itertuples(index=False, name=None)
+            ):
+                tile.edges.append((u, v, k, _row_attrs(edge_cols, values)))
+    return tiles
+
+
+class TileCache:
+    """Cache LRU các ô đồ thị, giới hạn theo tổng số cạnh."""
+
+    def __init__(self, max_edges: int = TILE_CACHE_MAX_EDGES):
+        self.max_edges = max_edges
+        self._tiles = OrderedDict()
+        self._edge_count = 0
+        self._lock = threading.Lock()
+        # tăng mỗi khi dữ liệu bản đồ được nạp lại; dùng làm phiên bản đồ thị ở chế độ tiled
+        self.generation = 0
+
+    def _evict(self):
+        while self._edge_count > self.max_edges and len(self._tiles) > 1:
+            _, tile = self._tiles.popitem(last=False)
+            self._edge_count -= len(tile.edges)
+            metrics.inc("tile_cache_evictions")
+
+    def get_many(self, tile_keys: set) -> dict:
+        """Lấy các ô, nạp từ PostGIS những ô còn thiếu trong một lượt truy vấn."""
+        found = {}
+        with self._lock:
+            for key in tile_keys:
+                tile = self._tiles.get(key)
+                if tile is not None:
+                    self._tiles.move_to_end(key)
+                    found[key] = tile
+        missing = [key for key in tile_keys if key not in found]
+        metrics.inc("tile_cache_hits", len(found))
+        metrics.inc("tile_cache_misses", len(missing))
+
+        if missing:
+            generation = self.generation
+            nodes_gdf, edges_gdf = map_data_service.get_tiles_from_db(missing)
+            loaded = _split_by_tile(nodes_gdf, edges_gdf)
+            with self._lock:
+                if generation != self.generation:
+                    # dữ liệu đã được nạp lại trong lúc truy vấn: chỉ dùng cho request này
+                    for key in missing:
+                        found[key] = loaded.get(key) or _Tile([], [])
+                    return found
+                for key in missing:
+                    # ô không có dữ liệu vẫn được cache để tránh truy vấn lại
+                    tile = loaded.get(key) or _Tile([], [])
+                    previous = self._tiles.get(key)
+                    if previous is not None:
+                        self._edge_count -= len(previous.edges)
+                    self._edge_count += len(tile.edges)
+                    self._tiles[key] = tile
+                    found[key] = tile
+                self._evict()
+                metrics.set_gauge("tile_cache_edges", self._edge_count)
+                metrics.set_gauge("tile_cache_tiles", len(self._tiles))
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._edge_count = 0
+            self.generation += 1
+
+
+tile_cache = TileCache()
+
+
+def build_corridor_graph(tile_keys: set) -> nx.MultiDiGraph:
+    """Ghép các ô thành một MultiDiGraph; cạnh có node cuối nằm ngoài hành lang bị bỏ qua."""
+    tiles = tile_cache.get_many(tile_keys)
+    G = nx.MultiDiGraph(crs="EPSG:4326")
+    for tile in tiles.values():
+        G.add_nodes_from(tile.nodes)
+    for tile in tiles.values():
+        G.add_edges_from((u, v, k, attrs) for u, v, k, attrs in tile.edges if v in G)
+    return G
@@ -0,0 +1,165 @@
+# src/services/time_profiles.py
+"""
+Trọng số phụ thuộc thời gian: hệ số theo giờ cho tắc đường và ngập.
+
+- Tắc đường: mỗi cạnh thuộc một lớp (theo loại đường), mỗi lớp có 24 hệ số theo giờ trong ngày.
+- Ngập: xác suất ngập theo (tháng, giờ) do model dự đoán ngập tính trên khí hậu trung bình
+  của Hà Nội, dùng cùng đặc trưng month / hour / is_rainy_season với weather_service.
+  Khi ngập thời gian đi gấp đôi, nên hệ số kỳ vọng là 1 + p.
+
+Bảng được tính trước (offline) và lưu thành file .npz nhỏ; khi nạp đồ thị chỉ cần gán lớp cho
+từng cạnh. Giá trị giữa hai mốc giờ được nội suy tuyến tính nên thời gian đi là hàm tuyến tính
+từng khúc của thời điểm xuất phát. Mọi hệ số >= 1, heuristic của A* (theo tốc độ tự do) vẫn đúng.
+
+    python -m src.services.time_profiles                  # tính bảng bằng MODEL_PATH -> TIME_PROFILES_FILE
+    python -m src.services.time_profiles --out /data/time_profiles.npz --no-flood
+"""
+import argparse
+import math
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from src.app.core.config import MODEL_PATH, TIME_PROFILES_FILE
+from .compact_graph import CompactGraph
+from .routing_engine import HourlyCosts
+from .routing_profiles import highway_classes, per_code
+
+HOURS = 24
+LOCAL_TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+
+# Lớp tắc đường và mức tăng thời gian đi lúc cao điểm nhất của từng lớp (0.8 = chậm hơn 80%)
+CONGESTION_CLASSES = ("none", "arterial", "collector", "local", "service")
+_CONGESTION_PEAK = {"none": 0.0, "arterial": 0.8, "collector": 0.6, "local": 0.3, "service": 0.1}
+_HIGHWAY_CLASS = {
+    "motorway": "arterial", "motorway_link": "arterial", "trunk": "arterial", "trunk_link": "arterial",
+    "primary": "arterial", "primary_link": "arterial",
+    "secondary": "collector", "secondary_link": "collector", "tertiary": "collector", "tertiary_link": "collector",
+    "residential": "local", "unclassified": "local", "living_street": "local",
+}
+# Mức tắc tương đối theo giờ (0 = đường thông thoáng, 1 = cao điểm): sáng 7-9h, chiều 17-19h
+_CONGESTION_SHAPE = np.array([
+    0.0, 0.0, 0.0, 0.0, 0.0, 0.1, 0.4, 0.9, 1.0, 0.6, 0.4, 0.5,
+    0.5, 0.4, 0.4, 0.5, 0.7, 1.0, 1.0, 0.7, 0.4, 0.3, 0.1, 0.0,
+], dtype=np.float32)
+
+# Khí hậu trung bình theo tháng của Hà Nội: nhiệt độ (°C), độ ẩm (%), gió (m/s)
+_CLIMATE_TEMP = (16.4, 17.2, 20.0, 23.9, 27.4, 28.9, 29.2, 28.6, 27.5, 24.9, 21.5, 18.2)
+_CLIMATE_HUMIDITY = (78, 82, 85, 86, 81, 80, 81, 84, 81, 78, 76, 75)
+_CLIMATE_WIND = (2.0, 2.0, 2.1, 2.2, 2.2, 2.0, 2.0, 1.8, 1.8, 1.9, 2.0, 2.0)
+
+
+def congestion_table() -> np.ndarray:
+    """Hệ số tắc đường [lớp, giờ]."""
+    peak = np.array([_CONGESTION_PEAK[c] for c in CONGESTION_CLASSES], dtype=np.float32)
+    return 1 + peak[:, None] * _CONGESTION_SHAPE[None, :]
+
+
+def flood_probabilities(flood_model) -> np.ndarray:
+    """Xác suất ngập [tháng, giờ] theo khí hậu trung bình, dao động nhiệt / ẩm trong ngày."""
+    import pandas as pd
+    from .weather_service import FEATURE_COLUMNS, flood_features
+
+    rows = []
+    for month in range(1, 13):
+        for hour in range(HOURS):
+            # nóng nhất khoảng 14h, độ ẩm ngược lại
+            wave = math.cos(2 * math.pi * (hour - 14) / HOURS)
+            rows.append(flood_features(
+                _CLIMATE_TEMP[month - 1] + 3.5 * wave, _CLIMATE_HUMIDITY[month - 1] - 10 * wave,
+                _CLIMATE_WIND[month - 1], month, hour,
+            ))
+    frame = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+    if hasattr(flood_model, "predict_proba"):
+        probabilities = flood_model.predict_proba(frame)[:, 1]
+    else:
+        probabilities = flood_model.predict(frame)
+    return np.asarray(probabilities, dtype=np.float32).reshape(12, HOURS)
+
+
+class TimeProfiles:
+    def __init__(self, congestion: np.ndarray, flood: np.ndarray):
+        self.congestion = congestion    # float32 [lớp, 24], hệ số >= 1
+        self.flood = flood              # float32 [12, 24], xác suất ngập
+        self.edge_class = {}            # tên hồ sơ phương tiện -> int8 [E]
+        self._factors = {}              # tháng -> [lớp, 24]
+
+    @classmethod
+    def load(cls, path=TIME_PROFILES_FILE) -> "TimeProfiles":
+        """Nạp bảng đã tính trước; không có file thì dùng bảng tắc đường mặc định, không tính ngập."""
+        if path and Path(path).exists():
+            data = np.load(path)
+            print(f"[time-profiles] nạp {path}")
+            return cls(data["congestion"], data["flood"])
+        print("[time-profiles] chưa có file bảng tính trước, dùng bảng tắc đường mặc định (không tính ngập)")
+        return cls(congestion_table(), np.zeros((12, HOURS), dtype=np.float32))
+
+    def save(self, path=TIME_PROFILES_FILE):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, congestion=self.congestion, flood=self.flood, classes=np.array(CONGESTION_CLASSES))
+        print(f"[time-profiles] đã ghi {path}")
+
+    def assign_classes(self, name: str, compact: CompactGraph, congestion: bool = True):
+        """Gán lớp tắc đường cho từng cạnh của đồ thị một hồ sơ (lớp "none" nếu hồ sơ không bị tắc)."""
+        def klass(highway):
+            if not congestion:
+                return 0
+            classes = [_HIGHWAY_CLASS.get(c, "service") for c in highway_classes(highway)]
+            # cạnh gộp nhiều loại đường lấy lớp lớn nhất
+            return min((CONGESTION_CLASSES.index(c) for c in classes), default=CONGESTION_CLASSES.index("local"))
+        self.edge_class[name] = per_code(compact, "highway", klass).astype(np.int8)
+
+    def factors(self, month: int) -> np.ndarray:
+        """Hệ số [lớp, 24] của một tháng: tắc đường nhân hệ số ngập kỳ vọng."""
+        table = self._factors.get(month)
+        if table is None:
+            table = self._factors[month] = self.congestion * (1 + self.flood[month - 1])[None, :]
+        return table
+
+    def hourly_costs(self, name: str, edge_cost: np.ndarray, month: int) -> HourlyCosts:
+        """
+        Chi phí theo giờ của từng cạnh, từ chi phí tĩnh đã áp vùng ngập / vùng cấm.
+        Không dựng mảng [E, 24]: mỗi mốc giờ được tính khi lượt tìm cần tới (xem HourlyCosts).
+        """
+        return HourlyCosts(edge_cost, self.edge_class[name], self.factors(month))
+
+
+def local_time(when: datetime) -> datetime:
+    """Quy về giờ Hà Nội; thời điểm không có múi giờ được hiểu là giờ Hà Nội."""
+    return when.replace(tzinfo=LOCAL_TZ) if when.tzinfo is None else when.astimezone(LOCAL_TZ)
+
+
+def seconds_of_day(when: datetime) -> float:
+    return when.hour * 3600 + when.minute * 60 + when.second + when.microsecond / 1e6
+
+
+def build_time_profiles(profiles: dict) -> TimeProfiles:
+    """profiles: chỉ mục "profiles" (tên -> ProfileIndex)."""
+    time_profiles = TimeProfiles.load()
+    for name, profile_index in profiles.items():
+        time_profiles.assign_classes(name, profile_index.compact, profile_index.profile.congestion)
+    return time_profiles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tính trước bảng hệ số theo giờ (tắc đường, ngập)")
+    parser.add_argument("--out", default=TIME_PROFILES_FILE, help="file .npz đích")
+    parser.add_argument("--model", default=MODEL_PATH, help="model dự đoán ngập (joblib)")
+    parser.add_argument("--no-flood", action="store_true", help="không tính xác suất ngập")
+    args = parser.parse_args(argv)
+
+    flood = np.zeros((12, HOURS), dtype=np.float32)
+    if not args.no_flood:
+        import joblib
+
+        flood = flood_probabilities(joblib.load(args.model))
+        print(f"[time-profiles] xác suất ngập: thấp nhất {flood.min():.2f}, cao nhất {flood.max():.2f}")
+    TimeProfiles(congestion_table(), flood).save(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# src/services/trip_service.py
+"""
+Sắp thứ tự ghé nhiều điểm trên ma trận thời gian đi (bất đối xứng).
+
+- Lời giải ban đầu bằng chèn gần nhất (nearest insertion): lần lượt lấy điểm gần hành trình nhất
+  và chèn vào vị trí làm tăng chi phí ít nhất.
+- Cải thiện bằng 2-opt (đảo một đoạn) và Or-opt (dời đoạn 1-3 điểm sang vị trí khác)
+  cho tới khi không còn bước nào tốt hơn.
+- Còn ngân sách thời gian thì xáo trộn lời giải tốt nhất (double-bridge) rồi cải thiện lại,
+  dừng sau _MAX_FAILED_KICKS lần liên tiếp không tốt hơn hoặc khi hết ngân sách.
+
+Điểm 0 luôn là điểm xuất phát; round_trip quay về điểm 0, keep_last giữ điểm cuối cùng của
+danh sách làm điểm kết thúc.
+"""
+import math
+import random
+import time
+
+from src.app.core import metrics
+from src.app.core.config import TRIP_TIME_BUDGET_SECONDS
+
+# chi phí thay cho cặp không có đường, để heuristic vẫn so sánh được các thứ tự
+_UNREACHABLE = 1e9
+_EPS = 1e-9
+_MAX_FAILED_KICKS = 20
+
+
+def tour_cost(matrix: list, tour: list, round_trip: bool = False) -> float:
+    cost = sum(matrix[a][b] for a, b in zip(tour, tour[1:]))
+    if round_trip and len(tour) > 1:
+        cost += matrix[tour[-1]][tour[0]]
+    return cost
+
+
+def _nearest_insertion(d: list, round_trip: bool, keep_last: bool) -> list:
+    n = len(d)
+    tour = [0, n - 1] if keep_last and n > 1 else [0]
+    todo = [i for i in range(n) if i not in tour]
+
+    while todo:
+        # điểm gần hành trình nhất (theo cả hai chiều)
+        k = min(todo, key=lambda c: min(min(d[a][c], d[c][a]) for a in tour))
+        best, best_pos = math.inf, len(tour)
+        last = len(tour) if not keep_last else len(tour) - 1
+        for pos in range(1, last + 1):
+            a = tour[pos - 1]
+            if pos < len(tour):
+                b = tour[pos]
+                delta = d[a][k] + d[k][b] - d[a][b]
+            else:
+                # nối vào cuối hành trình mở, hoặc trước khi quay về điểm 0
+                delta = d[a][k] + (d[k][0] - d[a][0] if round_trip else 0.0)
+            if delta < best:
+                best, best_pos = delta, pos
+        tour.insert(best_pos, k)
+        todo.remove(k)
+    return tour
+
+
+def _two_opt(d: list, tour: list, round_trip: bool, movable_end: int, deadline: float) -> bool:
+    current = tour_cost(d, tour, round_trip)
+    for i in range(1, movable_end - 1):
+        for j in range(i + 1, movable_end):
+            candidate = tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:]
+            cost = tour_cost(d, candidate, round_trip)
+            if cost < current - _EPS:
+                tour[:] = candidate
+                return True
+        if time.perf_counter() > deadline:
+            return False
+    return False
+
+
+def _or_opt(d: list, tour: list, round_trip: bool, movable_end: int, deadline: float) -> bool:
+    current = tour_cost(d, tour, round_trip)
+    for length in (1, 2, 3):
+        for i in range(1, movable_end - length + 1):
+            segment = tour[i:i + length]
+            rest = tour[:i] + tour[i + length:]
+            rest_end = movable_end - length
+            for pos in range(1, rest_end + 1):
+                if pos == i:
+                    continue
+                candidate = rest[:pos] + segment + rest[pos:]
+                cost = tour_cost(d, candidate, round_trip)
+                if cost < current - _EPS:
+                    tour[:] = candidate
+                    return True
+            if time.perf_counter() > deadline:
+                return False
+    return False
+
+
+def _local_search(d: list, tour: list, round_trip: bool, movable_end: int, deadline: float) -> int:
+    steps = 0
+    while time.perf_counter() < deadline:
+        if not (_two_opt(d, tour, round_trip, movable_end, deadline)
+                or _or_opt(d, tour, round_trip, movable_end, deadline)):
+            break
+        steps += 1
+    return steps
+
+
+def _double_bridge(tour: list, movable_end: int, rng: random.Random) -> list:
+    """Cắt phần có thể thay đổi thành 4 đoạn A B C D rồi ghép lại A C B D."""
+    a, b, c = sorted(rng.sample(range(2, movable_end), 3))
+    return tour[:a] + tour[b:c] + tour[a:b] + tour[c:]
+
+
+def solve_order(matrix: list, round_trip: bool = False, keep_last: bool = False,
+                time_budget: float = TRIP_TIME_BUDGET_SECONDS) -> list:
+    """Thứ tự ghé (danh sách chỉ số điểm, bắt đầu bằng 0) cho ma trận chi phí n x n."""
+    started = time.perf_counter()
+    deadline = started + time_budget
+    d = [[_UNREACHABLE if math.isinf(c) else c for c in row] for row in matrix]
+    n = len(d)
+    if n <= 2:
+        return list(range(n))
+
+    tour = _nearest_insertion(d, round_trip, keep_last)
+    initial = tour_cost(d, tour, round_trip)
+    # các vị trí [1, movable_end) được phép thay đổi
+    movable_end = n - 1 if keep_last else n
+    steps = _local_search(d, tour, round_trip, movable_end, deadline)
+
+    best, best_cost = tour, tour_cost(d, tour, round_trip)
+    rng = random.Random(0)  # cố định để cùng request cho cùng kết quả
+    failed = 0
+    while movable_end >= 5 and failed < _MAX_FAILED_KICKS and time.perf_counter() < deadline:
+        candidate = _double_bridge(best, movable_end, rng)
+        steps += _local_search(d, candidate, round_trip, movable_end, deadline)
+        cost = tour_cost(d, candidate, round_trip)
+        if cost < best_cost - _EPS:
+            best, best_cost, failed = candidate, cost, 0
+        else:
+            failed += 1
+    tour, final = best, best_cost
+
+    metrics.observe("trip_solve_seconds", time.perf_counter() - started)
+    metrics.observe("trip_improvement_ratio", 1 - final / initial if initial else 0.0)
+    metrics.observe("trip_improvement_steps", steps)
+    return tour
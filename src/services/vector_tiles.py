@@ -0,0 +1,461 @@
+# src/services/vector_tiles.py
+"""
+Vector tile (Mapbox Vector Tile) cho mạng đường và các vùng ngập / vùng cấm đang có hiệu lực.
+
+Mỗi ô z/x/y (Web Mercator) gồm ba lớp:
+- "roads": các cạnh của đồ thị (highway, name, oneway); dưới VECTOR_TILE_DETAIL_ZOOM chỉ có đường chính.
+- "flood", "ban": các cạnh bị vùng ngập / vùng cấm của zone_state ảnh hưởng (thuộc tính zone = id vùng).
+
+Ô của một vùng (region_registry, tham số region) được dựng từ đồ thị và vùng ngập / vùng cấm của vùng đó,
+với cache riêng; cache của vùng được bỏ khi vùng bị đẩy khỏi bộ nhớ.
+
+Ô được dựng trong tiến trình từ edge_index của phiên bản đồ thị hiện tại (STRtree, mã hóa protobuf
+tại chỗ), hoặc bằng ST_AsMVT của PostGIS ở chế độ tiled. Kết quả được giữ trong cache LRU giới hạn
+theo số byte, khóa theo phiên bản đồ thị: đổi phiên bản thì cache cũ bị bỏ, thêm / xóa một vùng chỉ xóa
+các ô nằm quanh các cạnh của vùng đó.
+"""
+import functools
+import hashlib
+import json
+import math
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.app.core import metrics
+from src.app.core.config import ROUTING_MODE, VECTOR_TILE_MIN_ZOOM, VECTOR_TILE_DETAIL_ZOOM, \
+    VECTOR_TILE_MAX_ZOOM, VECTOR_TILE_CACHE_MAX_BYTES
+from .compact_graph import CompactGraph
+from .graph_store import graph_store
+from .region_registry import UnknownRegionError, region_registry
+from .routing_engine import EdgeSpatialIndex
+from .routing_profiles import highway_classes, per_code
+from .zone_state import ZONE_KINDS, zone_state
+
+EXTENT = 4096
+BUFFER = 64     # đơn vị ô (1/EXTENT cạnh ô), để nét vẽ liền qua ranh giới giữa các ô
+
+# loại đường hiển thị cả ở mức zoom thấp
+MAJOR_HIGHWAYS = (
+    "motorway", "motorway_link", "trunk", "trunk_link", "primary", "primary_link",
+    "secondary", "secondary_link", "tertiary", "tertiary_link",
+)
+
+
+# ----------------------------------------------------------------------
+# Tọa độ ô
+# ----------------------------------------------------------------------
+
+def check_tile(z: int, x: int, y: int):
+    if not 0 <= z <= VECTOR_TILE_MAX_ZOOM:
+        raise ValueError(f"zoom phải trong khoảng 0..{VECTOR_TILE_MAX_ZOOM}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"ô {z}/{x}/{y} nằm ngoài lưới")
+
+
+def tile_bounds(z: int, x: float, y: float, x2: float = None, y2: float = None) -> tuple:
+    """(min_lon, min_lat, max_lon, max_lat) của ô z/x/y (hoặc khoảng ô [x, x2] x [y, y2] không nguyên)."""
+    n = 2 ** z
+    x2 = x + 1 if x2 is None else x2
+    y2 = y + 1 if y2 is None else y2
+    lon = lambda tx: tx / n * 360.0 - 180.0
+    lat = lambda ty: math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+    return lon(x), lat(y2), lon(x2), lat(y)
+
+
+def _to_tile_pixels(coords: np.ndarray, z: int, x: int, y: int) -> np.ndarray:
+    """lon/lat -> tọa độ trong ô [0, EXTENT] (trục y hướng xuống)."""
+    n = 2 ** z
+    lat = np.radians(np.clip(coords[:, 1], -85.0511, 85.0511))
+    px = ((coords[:, 0] + 180.0) / 360.0 * n - x) * EXTENT
+    py = ((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * n - y) * EXTENT
+    return np.column_stack([px, py])
+
+
+# ----------------------------------------------------------------------
+# Mã hóa protobuf (vector_tile.proto v2), chỉ cần kiểu LineString
+# ----------------------------------------------------------------------
+
+def _varint(value: int, out: bytearray):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _tag(number: int, wire: int, out: bytearray):
+    _varint((number << 3) | wire, out)
+
+
+def _message(number: int, payload: bytes, out: bytearray):
+    _tag(number, 2, out)
+    _varint(len(payload), out)
+    out += payload
+
+
+def _packed(number: int, values: list, out: bytearray):
+    body = bytearray()
+    for v in values:
+        _varint(v, body)
+    _message(number, body, out)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _encode_value(value) -> bytes:
+    out = bytearray()
+    if isinstance(value, bool):
+        _tag(7, 0, out)
+        _varint(int(value), out)
+    elif isinstance(value, int):
+        if value >= 0:
+            _tag(5, 0, out)
+            _varint(value, out)
+        else:
+            _tag(6, 0, out)
+            _varint(_zigzag(value), out)
+    elif isinstance(value, float):
+        _tag(3, 1, out)
+        out += struct.pack("<d", value)
+    else:
+        _message(1, str(value).encode("utf-8"), out)
+    return bytes(out)
+
+
+def _line_commands(parts: list) -> list:
+    """Lệnh geometry của một (Multi)LineString: MoveTo + LineTo theo độ lệch, tọa độ nguyên."""
+    commands, cx, cy = [], 0, 0
+    for part in parts:
+        x, y = part[0]
+        commands += [(1 << 3) | 1, _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        commands.append(((len(part) - 1) << 3) | 2)
+        for x, y in part[1:]:
+            commands += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+    return commands
+
+
+def encode_layer(name: str, features: list, extent: int = EXTENT) -> bytes:
+    """features: [(các đoạn [[(x, y), ...], ...], thuộc tính dict)]."""
+    keys, values = {}, {}
+    out = bytearray()
+    _tag(15, 0, out)
+    _varint(2, out)
+    _message(1, name.encode("utf-8"), out)
+    for parts, properties in features:
+        tags = []
+        for k, v in properties.items():
+            if v is None:
+                continue
+            tags += [keys.setdefault(k, len(keys)), values.setdefault((type(v), v), len(values))]
+        feature = bytearray()
+        _packed(2, tags, feature)
+        _tag(3, 0, feature)
+        _varint(2, feature)  # LINESTRING
+        _packed(4, _line_commands(parts), feature)
+        _message(2, feature, out)
+    for k in keys:
+        _message(3, k.encode("utf-8"), out)
+    for _, v in values:
+        _message(4, _encode_value(v), out)
+    _tag(5, 0, out)
+    _varint(extent, out)
+    return bytes(out)
+
+
+def encode_tile(layers: dict) -> bytes:
+    """layers: tên lớp -> features; lớp rỗng bị bỏ qua."""
+    out = bytearray()
+    for name, features in layers.items():
+        if features:
+            _message(3, encode_layer(name, features), out)
+    return bytes(out)
+
+
+# ----------------------------------------------------------------------
+# Dựng ô trong tiến trình
+# ----------------------------------------------------------------------
+
+class TileRenderer:
+    """Dựng vector tile từ CompactGraph và edge_index của một phiên bản đồ thị."""
+
+    def __init__(self, compact: CompactGraph, edge_index: EdgeSpatialIndex):
+        self.compact = compact
+        self.edge_index = edge_index
+        # zoom nhỏ nhất hiển thị từng cạnh
+        self.min_zoom = per_code(
+            compact, "highway",
+            lambda h: 0 if any(c in MAJOR_HIGHWAYS for c in highway_classes(h)) else VECTOR_TILE_DETAIL_ZOOM,
+        ).astype(np.int8)
+        self._zone_edges = {}   # id vùng -> chỉ số các cạnh bị ảnh hưởng
+        self._base_map = None
+        self._lock = threading.Lock()
+
+    def zone_edges(self, zone: dict) -> np.ndarray:
+        edges = self._zone_edges.get(zone["id"])
+        if edges is None:
+            edges = self._zone_edges[zone["id"]] = np.unique(self.edge_index.query(zone["shape"]))
+        return edges
+
+    def forget_zone(self, zone_id: int):
+        self._zone_edges.pop(zone_id, None)
+
+    def zone_bounds(self, zone: dict) -> tuple:
+        """Khung bao của vùng và của các cạnh nó ảnh hưởng (cạnh có thể dài ra ngoài vùng)."""
+        import shapely
+
+        bounds = list(zone["bounds"])
+        edges = self.zone_edges(zone)
+        if len(edges):
+            eb = shapely.total_bounds(self.edge_index.geometries[edges])
+            bounds = [min(bounds[0], eb[0]), min(bounds[1], eb[1]), max(bounds[2], eb[2]), max(bounds[3], eb[3])]
+        return tuple(bounds)
+
+    def base_map(self, graph_version: str) -> bytes:
+        """
+        JSON khung bao và GeoJSON toàn bộ mạng đường (tọa độ làm tròn 6 chữ số), dựng và serialize
+        một lần cho mỗi phiên bản đồ thị. Dùng cho bản đồ nền của frontend; khu vực lớn nên dùng vector tile.
+        """
+        with self._lock:
+            if self._base_map is None:
+                import shapely
+
+                geometries = self.edge_index.geometries
+                min_lon, min_lat, max_lon, max_lat = (float(v) for v in shapely.total_bounds(geometries))
+                features = []
+                for e, geom in enumerate(geometries):
+                    coords = np.round(shapely.get_coordinates(geom), 6).tolist()
+                    features.append({
+                        "type": "Feature",
+                        "properties": self._properties(e),
+                        "geometry": {"type": "LineString", "coordinates": coords},
+                    })
+                self._base_map = json.dumps({
+                    "graph_version": graph_version,
+                    "bounds": [min_lon, min_lat, max_lon, max_lat],
+                    "center": [(min_lat + max_lat) / 2, (min_lon + max_lon) / 2],
+                    "network": {"type": "FeatureCollection", "features": features},
+                }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            return self._base_map
+
+    def _properties(self, e: int) -> dict:
+        c = self.compact
+        highway = c.string_attr("highway", e)
+        name = c.string_attr("name", e)
+        return {
+            "highway": highway if highway is None or isinstance(highway, str) else str(highway),
+            "name": name if name is None or isinstance(name, str) else str(name),
+            "oneway": bool(c.oneway[e]),
+        }
+
+    def _clipped_parts(self, edges: np.ndarray, z: int, x: int, y: int) -> dict:
+        """Cạnh -> các đoạn (tọa độ nguyên trong ô) sau khi cắt theo ô mở rộng BUFFER."""
+        import shapely
+
+        if not len(edges):
+            return {}
+        coords, owner = shapely.get_coordinates(self.edge_index.geometries[edges], return_index=True)
+        lines = shapely.linestrings(_to_tile_pixels(coords, z, x, y), indices=owner)
+        clipped = shapely.clip_by_rect(lines, -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+        parts, part_owner = shapely.get_parts(clipped, return_index=True)
+        points, point_part = shapely.get_coordinates(parts, return_index=True)
+        points = np.rint(points).astype(np.int64)
+        # bỏ các điểm trùng liên tiếp sau khi làm tròn
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = (point_part[1:] != point_part[:-1]) | (points[1:] != points[:-1]).any(axis=1)
+        points, point_part = points[keep], point_part[keep]
+
+        result = {}
+        bounds = np.searchsorted(point_part, np.arange(len(parts) + 1))
+        for p in range(len(parts)):
+            part = points[bounds[p]:bounds[p + 1]]
+            if len(part) >= 2:
+                result.setdefault(int(edges[part_owner[p]]), []).append(part.tolist())
+        return result
+
+    def render(self, z: int, x: int, y: int, zones: list) -> bytes:
+        import shapely
+
+        margin = BUFFER / EXTENT
+        box = shapely.box(*tile_bounds(z, x - margin, y - margin, x + 1 + margin, y + 1 + margin))
+        edges = self.edge_index.tree.query(box)
+        edges = np.sort(edges[self.min_zoom[edges] <= z])
+        parts = self._clipped_parts(edges, z, x, y)
+
+        layers = {"roads": [(parts[e], self._properties(e)) for e in parts]}
+        for kind in ZONE_KINDS:
+            seen, features = set(), []
+            for zone in zones:
+                if zone["kind"] != kind:
+                    continue
+                for e in self.zone_edges(zone).tolist():
+                    if e in parts and e not in seen:
+                        seen.add(e)
+                        features.append((parts[e], {"zone": zone["id"]}))
+            layers[kind] = features
+        return encode_tile(layers)
+
+
+def build_tile_renderer(compact: CompactGraph, edge_index: EdgeSpatialIndex) -> TileRenderer:
+    return TileRenderer(compact, edge_index)
+
+
+# ----------------------------------------------------------------------
+# Cache
+# ----------------------------------------------------------------------
+
+class VectorTileCache:
+    """Cache LRU các ô đã mã hóa, giới hạn theo tổng số byte, chỉ giữ ô của một phiên bản đồ thị."""
+
+    def __init__(self, max_bytes: int = VECTOR_TILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._tiles = OrderedDict()     # (z, x, y) -> (dữ liệu, etag)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.graph_version = None
+        # tăng mỗi lần xóa; ô dựng xong sau một lần xóa không được cache (có thể đã cũ)
+        self.generation = 0
+
+    def get(self, graph_version: str, key: tuple):
+        with self._lock:
+            if graph_version != self.graph_version:
+                self._reset(graph_version)
+            entry = self._tiles.get(key)
+            if entry is not None:
+                self._tiles.move_to_end(key)
+            generation = self.generation
+        metrics.inc("vector_tile_cache_hits" if entry is not None else "vector_tile_cache_misses")
+        return entry, generation
+
+    def put(self, graph_version: str, key: tuple, entry: tuple, generation: int):
+        with self._lock:
+            if graph_version != self.graph_version or generation != self.generation:
+                return
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._tiles[key] = entry
+            self._bytes += len(entry[0])
+            while self._bytes > self.max_bytes and self._tiles:
+                _, (data, _) = self._tiles.popitem(last=False)
+                self._bytes -= len(data)
+                metrics.inc("vector_tile_cache_evictions")
+            metrics.set_gauge("vector_tile_cache_bytes", self._bytes)
+            metrics.set_gauge("vector_tile_cache_tiles", len(self._tiles))
+
+    def _reset(self, graph_version=None):
+        self._tiles.clear()
+        self._bytes = 0
+        self.generation += 1
+        self.graph_version = graph_version
+
+    def clear(self):
+        with self._lock:
+            self._reset(self.graph_version)
+
+    def invalidate(self, bounds: tuple) -> int:
+        """Xóa các ô (kể cả phần BUFFER) giao với khung (min_lon, min_lat, max_lon, max_lat)."""
+        margin = BUFFER / EXTENT
+        with self._lock:
+            stale = []
+            for z, x, y in self._tiles:
+                w, s, e, n = tile_bounds(z, x - margin, y - margin, x + 1 + margin, y + 1 + margin)
+                if w <= bounds[2] and bounds[0] <= e and s <= bounds[3] and bounds[1] <= n:
+                    stale.append((z, x, y))
+            for key in stale:
+                self._bytes -= len(self._tiles.pop(key)[0])
+            self.generation += 1
+        metrics.inc("vector_tile_cache_invalidated", len(stale))
+        return len(stale)
+
+
+vector_tile_cache = VectorTileCache()
+_tile_caches = {graph_store.name: vector_tile_cache}     # tên store -> cache ô của store đó
+_tile_caches_lock = threading.Lock()
+
+
+def tile_cache(name: str) -> VectorTileCache:
+    with _tile_caches_lock:
+        cache = _tile_caches.get(name)
+        if cache is None:
+            cache = _tile_caches[name] = VectorTileCache()
+        return cache
+
+
+def _etag(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()[:16]
+
+
+def get_tile(z: int, x: int, y: int, region: str = None) -> tuple:
+    """
+    (dữ liệu MVT, etag) của ô z/x/y trên đồ thị mặc định hoặc trên vùng region;
+    ValueError nếu ô không hợp lệ, UnknownRegionError nếu không có vùng region.
+    """
+    check_tile(z, x, y)
+    zones = region_registry.zones_for(region)
+    if zones is None:
+        raise UnknownRegionError(region)
+    if z < VECTOR_TILE_MIN_ZOOM:
+        return b"", _etag(b"")
+
+    if ROUTING_MODE == "tiled":
+        from . import map_data_service, tile_service
+
+        if region is not None:
+            raise ValueError("chế độ tiled không có vùng bản đồ riêng")
+        graph_version = f"tiles-{tile_service.tile_cache.generation}"
+        entry, generation = vector_tile_cache.get(graph_version, (z, x, y))
+        if entry is None:
+            data = map_data_service.get_vector_tile_from_db(
+                z, x, y, zone_state.zones(), z >= VECTOR_TILE_DETAIL_ZOOM, MAJOR_HIGHWAYS, EXTENT, BUFFER
+            )
+            entry = (data, _etag(data))
+            vector_tile_cache.put(graph_version, (z, x, y), entry, generation)
+        return entry
+
+    with region_registry.acquire_region(region) as version:
+        renderer = version.indexes["tile_renderer"]
+        cache = tile_cache(region or graph_store.name)
+        entry, generation = cache.get(version.version, (z, x, y))
+        if entry is None:
+            data = renderer.render(z, x, y, zones.zones())
+            entry = (data, _etag(data))
+            cache.put(version.version, (z, x, y), entry, generation)
+            metrics.observe("vector_tile_bytes", len(data))
+        return entry
+
+
+def base_map() -> bytes:
+    """Bản đồ nền (khung bao, GeoJSON mạng đường) của phiên bản đồ thị hiện tại, đã serialize sẵn."""
+    with graph_store.acquire() as version:
+        return version.indexes["tile_renderer"].base_map(version.version)
+
+
+def _on_zone_changed(zone: dict, removed: bool, name: str = graph_store.name):
+    store = region_registry.store_for(name)
+    version = store.current if store is not None else None
+    renderer = version.indexes.get("tile_renderer") if version is not None else None
+    cache = tile_cache(name)
+    if renderer is None:
+        # không có đồ thị trong bộ nhớ (chế độ tiled, vùng chưa nạp): không biết cạnh của vùng trải tới đâu
+        cache.clear()
+        return
+    cache.invalidate(renderer.zone_bounds(zone))
+    if removed:
+        renderer.forget_zone(zone["id"])
+
+
+def _drop_tile_cache(version, name: str):
+    with _tile_caches_lock:
+        _tile_caches.pop(name, None)
+
+
+zone_state.subscribe(_on_zone_changed)
+for _region in region_registry.regions():
+    _region.zones.subscribe(functools.partial(_on_zone_changed, name=_region.name))
+    _region.store.subscribe_unload(functools.partial(_drop_tile_cache, name=_region.name))
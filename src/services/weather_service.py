@@ -3,6 +3,14 @@ import pandas as pd
 from datetime import datetime
 from src.app.core.config import WEATHER_API_KEY, LATITUDE, LONGITUDE
 
+FEATURE_COLUMNS = ['temp', 'humidity', 'wind_speed', 'month', 'hour', 'is_rainy_season']
+
+
+def flood_features(temp, humidity, wind_speed, month, hour) -> list:
+    """Một dòng đặc trưng đầu vào của model dự đoán ngập (theo thứ tự FEATURE_COLUMNS)"""
+    is_rainy = 1 if month in [6, 7, 8] else 0
+    return [temp, humidity, wind_speed, month, hour, is_rainy]
+
 
 def predict_flood(flood_model):
     """Get weather data and predict flood"""
@@ -14,13 +22,10 @@ def predict_flood(flood_model):
     current_humidity = weather_data['main']['humidity']
     current_wind_speed = weather_data['wind']['speed']
     now = datetime.now()
-    current_month = now.month
-    current_hour = now.hour
-    is_rainy = 1 if current_month in [6, 7, 8] else 0
 
     input_df = pd.DataFrame(
-        [[current_temp, current_humidity, current_wind_speed, current_month, current_hour, is_rainy]],
-        columns=['temp', 'humidity', 'wind_speed', 'month', 'hour', 'is_rainy_season']
+        [flood_features(current_temp, current_humidity, current_wind_speed, now.month, now.hour)],
+        columns=FEATURE_COLUMNS
     )
 
     is_flooded_prediction = flood_model.predict(input_df)[0]
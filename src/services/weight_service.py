@@ -1,16 +1,28 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
 import networkx as nx
+import numpy as np
+import shapely
 from typing import List, Dict, Any
 from shapely.geometry import shape
-import osmnx as ox
+from src.app.core import lazy_imports, metrics
+from src.app.core.config import ZONE_MAX_VERTICES, ZONE_SIMPLIFY_MIN_VERTICES, ZONE_SIMPLIFY_RATIO, ZONE_CACHE_SIZE
 from .weather_service import predict_flood
 
+# lưới làm tròn tọa độ khi chuẩn hóa vùng (độ, ~1 cm)
+_GRID_SIZE = 1e-7
+
 
 def apply_dynamic_weights(
     G_base: nx.MultiDiGraph,
     blocking_geometries: List[Dict[str, Any]] = None,
     flood_model=None,
     flood_areas: List[Dict[str, Any]] = None,
-    ban_areas: List[Dict[str, Any]] = None
+    ban_areas: List[Dict[str, Any]] = None,
+    zones: list = None
 ) -> tuple:
     G_modified = G_base.copy()
     metadata = {
@@ -56,7 +68,7 @@ def _apply_blocking_in_memory(G: nx.MultiDiGraph, blocking_geometries: List[Dict
     if not blocking_geometries:
         return 0
 
-    edges_gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    edges_gdf = lazy_imports.load("osmnx").graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
     if edges_gdf.empty:
         return 0
 
@@ -95,7 +107,7 @@ def _apply_flood_areas(G: nx.MultiDiGraph, flood_areas: List[Dict]) -> int:
     if not flood_areas:
         return 0
 
-    edges_gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    edges_gdf = lazy_imports.load("osmnx").graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
     if edges_gdf.empty:
         return 0
 
@@ -132,7 +144,7 @@ def _apply_ban_areas(G: nx.MultiDiGraph, ban_areas: List[Dict]) -> int:
     if not ban_areas:
         return 0
 
-    edges_gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    edges_gdf = lazy_imports.load("osmnx").graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
     if edges_gdf.empty:
         return 0
 
@@ -159,3 +171,239 @@ def _apply_ban_areas(G: nx.MultiDiGraph, ban_areas: List[Dict]) -> int:
             continue
 
     return total_affected
+
+
+class ZoneLimitError(ValueError):
+    """Vùng vượt giới hạn ZONE_MAX_VERTICES: từ chối cả request thay vì bỏ qua vùng."""
+
+
+class PreparedZone:
+    """Vùng đã kiểm tra và chuẩn hóa: geometry 2D hợp lệ, tọa độ làm tròn, thứ tự đỉnh chuẩn, đã prepare."""
+
+    __slots__ = ("digest", "shape", "vertices")
+
+    def __init__(self, digest: str, shape, vertices: int):
+        self.digest = digest        # hash WKB của geometry chuẩn hóa: cùng vùng -> cùng digest
+        self.shape = shape
+        self.vertices = vertices
+
+
+def _zone_geometry(geom: Dict) -> Dict:
+    # Handle both GeoJSON Feature and Geometry object formats
+    return geom["geometry"] if "geometry" in geom else geom
+
+
+def _zone_key(geom_data: Dict) -> tuple:
+    """
+    (hash, số đỉnh) của GeoJSON gốc, tính thẳng trên mảng tọa độ (nhanh hơn nhiều so với parse
+    hay json.dumps vùng vẽ tay hàng nghìn đỉnh); lỗi nếu cấu trúc không phải GeoJSON geometry.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    vertices = 0
+
+    def walk(coords):
+        nonlocal vertices
+        if isinstance(coords[0], (int, float)):
+            coords = [coords]   # Point
+        if isinstance(coords[0][0], (int, float)):
+            array = np.asarray(coords, dtype=np.float64)
+            digest.update(array.tobytes())
+            vertices += len(array)
+        else:
+            for part in coords:
+                walk(part)
+        digest.update(b"/")
+
+    def visit(data):
+        digest.update(str(data["type"]).encode())
+        if data["type"] == "GeometryCollection":
+            for part in data["geometries"]:
+                visit(part)
+        elif data["coordinates"]:
+            walk(data["coordinates"])
+
+    visit(geom_data)
+    return digest.hexdigest(), vertices
+
+
+def _canonicalize(geom_data: Dict) -> PreparedZone:
+    geom = shapely.force_2d(shape(geom_data))
+    if not geom.is_valid:
+        # đa giác vẽ tay tự cắt (hình nơ...) -> MultiPolygon hợp lệ
+        geom = shapely.make_valid(geom)
+    geom = shapely.normalize(shapely.set_precision(geom, _GRID_SIZE))
+    if geom.is_empty:
+        raise ValueError("geometry rỗng")
+    shapely.prepare(geom)
+    digest = hashlib.blake2b(shapely.to_wkb(geom), digest_size=16).hexdigest()
+    return PreparedZone(digest, geom, shapely.get_num_coordinates(geom))
+
+
+class ZoneCache:
+    """
+    Cache tiền xử lý vùng theo hash, dùng chung cho mọi request:
+    - hash tọa độ GeoJSON gốc -> PreparedZone, nên vùng gửi lại không phải parse / chuẩn hóa lại;
+    - theo chỉ mục cạnh (mỗi phiên bản đồ thị có một), (digest, conservative) -> chỉ số các cạnh gốc giao vùng.
+      Vùng nhiều đỉnh được đơn giản hóa theo khoảng cách đường trước khi truy vấn; vùng cấm (conservative)
+      được nới ra đúng bằng dung sai trước khi đơn giản hóa nên vẫn phủ kín vùng gốc (chỉ có thể cấm thêm
+      cạnh sát biên, không bao giờ để lọt cạnh trong vùng). Cache của một chỉ mục tự mất khi phiên bản đồ thị
+      được giải phóng.
+    """
+
+    def __init__(self, max_entries: int = ZONE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._zones = OrderedDict()
+        self._edges = weakref.WeakKeyDictionary()   # edge_index -> (dung sai đơn giản hóa, OrderedDict)
+        self._lock = threading.Lock()
+
+    def _remember(self, entries: OrderedDict, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def _lookup(self, entries: OrderedDict, key, kind: str):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+        metrics.inc("zone_cache_hits" if value is not None else "zone_cache_misses", kind=kind)
+        return value
+
+    def zone(self, geom: Dict, key: tuple = None) -> PreparedZone:
+        """Vùng đã chuẩn hóa; ValueError nếu geometry không hợp lệ, ZoneLimitError nếu quá nhiều đỉnh."""
+        geom_data = _zone_geometry(geom)
+        raw_digest, vertices = key or _zone_key(geom_data)
+        if vertices > ZONE_MAX_VERTICES:
+            raise ZoneLimitError(f"vùng có {vertices} đỉnh, vượt giới hạn {ZONE_MAX_VERTICES}")
+        zone = self._lookup(self._zones, raw_digest, "geometry")
+        if zone is None:
+            zone = _canonicalize(geom_data)
+            self._remember(self._zones, raw_digest, zone)
+        return zone
+
+    def _index_entry(self, edge_index) -> tuple:
+        with self._lock:
+            entry = self._edges.get(edge_index)
+        if entry is None:
+            # khoảng cách đường điển hình = trung vị độ dài cạnh (độ)
+            lengths = shapely.length(edge_index.geometries)
+            tolerance = ZONE_SIMPLIFY_RATIO * float(np.median(lengths)) if len(lengths) else 0.0
+            with self._lock:
+                entry = self._edges.setdefault(edge_index, (tolerance, OrderedDict()))
+        return entry
+
+    def edges(self, edge_index, zone: PreparedZone, conservative: bool = False) -> np.ndarray:
+        """
+        Chỉ số (đã sắp xếp, không trùng) các cạnh gốc giao vùng.
+        conservative: kết quả phải chứa mọi cạnh giao vùng gốc (vùng cấm).
+        """
+        tolerance, entries = self._index_entry(edge_index)
+        key = (zone.digest, conservative)
+        edges = self._lookup(entries, key, "edges")
+        if edges is None:
+            geom = zone.shape
+            if zone.vertices > ZONE_SIMPLIFY_MIN_VERTICES and tolerance > 0:
+                if conservative:
+                    # Douglas-Peucker lệch khỏi đường gốc tối đa tolerance: nới trước đúng chừng đó
+                    geom = shapely.buffer(geom, tolerance, quad_segs=2, join_style="mitre")
+                geom = shapely.simplify(geom, tolerance, preserve_topology=True)
+                shapely.prepare(geom)
+            edges = np.unique(edge_index.query(geom))
+            edges.flags.writeable = False
+            self._remember(entries, key, edges)
+        return edges
+
+    def clear(self):
+        with self._lock:
+            self._zones.clear()
+            self._edges.clear()
+
+
+zone_cache = ZoneCache()
+
+
+def parse_zone(geom: Dict) -> PreparedZone:
+    """Một vùng (GeoJSON Feature hoặc Geometry) đã chuẩn hóa, qua zone_cache."""
+    return zone_cache.zone(geom)
+
+
+def preprocess_zones(*zone_lists: List[Dict[str, Any]]) -> list:
+    """
+    [[PreparedZone] theo từng danh sách vùng] của một request. Vùng không hợp lệ bị bỏ qua (kèm cảnh báo)
+    như trước; ZoneLimitError nếu tổng số đỉnh của mọi vùng vượt ZONE_MAX_VERTICES.
+    """
+    keyed, total = [], 0
+    for zones in zone_lists:
+        found = []
+        for geom in zones or []:
+            try:
+                key = _zone_key(_zone_geometry(geom))
+            except Exception as e:
+                print(f"Warning: Cannot process zone geometry {geom}: {e}")
+                continue
+            total += key[1]
+            found.append((geom, key))
+        keyed.append(found)
+    if total > ZONE_MAX_VERTICES:
+        raise ZoneLimitError(f"các vùng có tổng {total} đỉnh, vượt giới hạn {ZONE_MAX_VERTICES}")
+
+    prepared = []
+    for zones in keyed:
+        found = []
+        for geom, key in zones:
+            try:
+                found.append(zone_cache.zone(geom, key))
+            except Exception as e:
+                print(f"Warning: Cannot process zone geometry {geom}: {e}")
+        prepared.append(found)
+    return prepared
+
+
+def _zone_edges(edge_index, zones: List[PreparedZone], conservative: bool = False) -> np.ndarray:
+    """Chỉ số các cạnh gốc giao với ít nhất một vùng trong zones (xem ZoneCache.edges)."""
+    found = [zone_cache.edges(edge_index, zone, conservative) for zone in zones]
+    return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+
+def compute_edge_overlay(
+    edge_index,
+    num_edges: int,
+    blocking_geometries: List[Dict[str, Any]] = None,
+    flood_areas: List[Dict[str, Any]] = None,
+    ban_areas: List[Dict[str, Any]] = None,
+    zones: list = None
+) -> tuple:
+    """
+    Phiên bản theo mảng của apply_dynamic_weights cho routing_engine: không sao chép đồ thị,
+    trả về (hệ số trọng số theo cạnh gốc hoặc None, mặt nạ cạnh bị cấm hoặc None, metadata).
+    Vùng ngập nhân đôi trọng số, vùng cấm và blocking_geometries (legacy) chặn hoàn toàn.
+    Vùng được tiền xử lý và tra cạnh qua zone_cache; ZoneLimitError nếu vượt giới hạn kích thước.
+    zones: kết quả preprocess_zones(flood_areas, ban_areas, blocking_geometries) nếu người gọi đã có
+    (vd. API đã kiểm tra giới hạn), để không xử lý lại.
+    """
+    metadata = {"blocked_edges_count": 0, "flood_affected_edges": 0, "ban_affected_edges": 0}
+    multiplier, banned = None, None
+    if zones is None:
+        zones = preprocess_zones(flood_areas, ban_areas, blocking_geometries)
+    flood_zones, ban_zones, blocking_zones = zones
+
+    flooded = _zone_edges(edge_index, flood_zones)
+    if len(flooded):
+        multiplier = np.ones(num_edges, dtype=np.float64)
+        multiplier[flooded] = 2.0
+        metadata["flood_affected_edges"] = len(flooded)
+
+    ban = _zone_edges(edge_index, ban_zones, conservative=True)
+    blocked = _zone_edges(edge_index, blocking_zones, conservative=True)
+    if len(ban) or len(blocked):
+        banned = np.zeros(num_edges, dtype=bool)
+        banned[ban] = True
+        banned[blocked] = True
+        metadata["ban_affected_edges"] = len(ban)
+        metadata["blocked_edges_count"] = len(blocked)
+
+    return multiplier, banned, metadata
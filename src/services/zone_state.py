@@ -0,0 +1,88 @@
+# src/services/zone_state.py
+"""
+Các vùng ngập / vùng cấm đang có hiệu lực phía server (do người vận hành khai báo).
+
+Mỗi thay đổi tăng `version` và báo cho các hàm đã đăng ký qua subscribe (vd. cache vector tile
+chỉ xóa các ô quanh vùng vừa đổi). Request tìm đường vẫn tự gửi vùng của mình như trước.
+"""
+import itertools
+import threading
+import time
+
+from src.app.core import metrics
+from .weight_service import ZoneLimitError, parse_zone
+
+ZONE_KINDS = ("flood", "ban")
+
+
+class ZoneState:
+    def __init__(self):
+        self._zones = {}
+        self._ids = itertools.count(1)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def subscribe(self, listener):
+        """listener(zone, removed) được gọi sau mỗi lần thêm / xóa một vùng."""
+        self._listeners.append(listener)
+
+    def _changed(self, zones: list, removed: bool):
+        metrics.set_gauge("active_zones", len(self._zones))
+        for zone in zones:
+            for listener in self._listeners:
+                listener(zone, removed)
+
+    def add(self, kind: str, geometry: dict) -> dict:
+        """
+        Thêm một vùng (geometry được chuẩn hóa như vùng gửi kèm request, xem weight_service.parse_zone);
+        ValueError nếu loại vùng hoặc geometry không hợp lệ hay vượt giới hạn kích thước.
+        """
+        if kind not in ZONE_KINDS:
+            raise ValueError(f"loại vùng không hợp lệ: {kind} (hỗ trợ: {', '.join(ZONE_KINDS)})")
+        try:
+            geom = parse_zone(geometry).shape
+        except ZoneLimitError:
+            raise
+        except Exception as e:
+            raise ValueError(f"geometry không hợp lệ: {e}")
+
+        with self._lock:
+            zone = {
+                "id": next(self._ids), "kind": kind, "geometry": geom.__geo_interface__,
+                "bounds": list(geom.bounds), "created_at": time.time(), "shape": geom,
+            }
+            self._zones[zone["id"]] = zone
+            self.version += 1
+        self._changed([zone], removed=False)
+        return zone
+
+    def remove(self, zone_id: int) -> dict | None:
+        with self._lock:
+            zone = self._zones.pop(zone_id, None)
+            if zone is not None:
+                self.version += 1
+        if zone is not None:
+            self._changed([zone], removed=True)
+        return zone
+
+    def clear(self) -> int:
+        with self._lock:
+            zones = list(self._zones.values())
+            self._zones.clear()
+            if zones:
+                self.version += 1
+        self._changed(zones, removed=True)
+        return len(zones)
+
+    def zones(self, kind: str = None) -> list:
+        with self._lock:
+            return [z for z in self._zones.values() if kind is None or z["kind"] == kind]
+
+
+def public(zone: dict) -> dict:
+    """Vùng ở dạng trả về cho API (bỏ đối tượng shapely)."""
+    return {k: v for k, v in zone.items() if k != "shape"}
+
+
+zone_state = ZoneState()
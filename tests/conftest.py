@@ -0,0 +1,55 @@
+import math
+import random
+import sys
+from pathlib import Path
+
+import networkx as nx
+import osmnx as ox
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def grid_graph(size: int = 30, seed: int = 0, lon0: float = 105.86, lat0: float = 21.0) -> nx.MultiDiGraph:
+    """Lưới size x size node (hai chiều) quanh Hà Nội, độ dài cạnh >= khoảng cách haversine."""
+    rng = random.Random(seed)
+    step = 0.001
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    for i in range(size):
+        for j in range(size):
+            G.add_node(i * size + j + 1, x=lon0 + j * step, y=lat0 + i * step)
+
+    def _haversine(u, v):
+        a, b = G.nodes[u], G.nodes[v]
+        dlat, dlon = math.radians(b["y"] - a["y"]), math.radians(b["x"] - a["x"])
+        h = math.sin(dlat / 2) ** 2 + math.cos(math.radians(a["y"])) * math.cos(math.radians(b["y"])) * math.sin(dlon / 2) ** 2
+        return 2 * 6371008.8 * math.asin(math.sqrt(h))
+
+    for i in range(size):
+        for j in range(size):
+            u = i * size + j + 1
+            for v in ([u + 1] if j + 1 < size else []) + ([u + size] if i + 1 < size else []):
+                length = _haversine(u, v) * rng.uniform(1.0, 1.5)
+                for a, b in ((u, v), (v, u)):
+                    G.add_edge(a, b, length=length, travel_time=length / (30 / 3.6),
+                               speed_kph=30.0, highway="residential", oneway=False)
+    return G
+
+
+@pytest.fixture
+def grid():
+    return grid_graph()
+
+
+@pytest.fixture
+def regions(tmp_path):
+    """Hai vùng cạnh nhau (graphml trong tmp_path), chưa nạp."""
+    from src.services import pathfinding_service  # noqa: F401  (đăng ký các bộ dựng chỉ mục)
+    from src.services.region_registry import Region
+
+    result = []
+    for name, lon0 in (("west", 105.80), ("east", 105.90)):
+        path = tmp_path / f"{name}.graphml"
+        ox.save_graphml(grid_graph(size=20, lon0=lon0), path)
+        result.append(Region(name, [lon0 - 0.001, 20.999, lon0 + 0.02, 21.02], source=f"graphml:{path}"))
+    return result
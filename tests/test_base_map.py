@@ -0,0 +1,16 @@
+import json
+
+from src.services import vector_tiles
+
+
+def test_base_map_serialized_once_per_version(regions, monkeypatch):
+    west = regions[0]
+    monkeypatch.setattr(vector_tiles, "graph_store", west.store)
+    west.store.reload()
+
+    data = vector_tiles.base_map()
+    assert isinstance(data, bytes) and vector_tiles.base_map() is data
+    base = json.loads(data)
+    assert base["graph_version"] == west.store.current.version
+    assert len(base["network"]["features"]) == west.store.current.indexes["tile_renderer"].compact.num_edges
+    west.store.unload()
@@ -0,0 +1,24 @@
+import osmnx as ox
+
+from src.app.schemas.route_input_format import RouteRequest
+from src.database import columnar_export
+from src.database.load_database import load_graph_from_export
+from src.services import pathfinding_service
+from src.services.compact_graph import CompactGraph
+from src.services.graph_store import GraphStore
+
+
+def test_export_publishes_compact_graph_without_networkx(grid, tmp_path):
+    graphml, out = tmp_path / "grid.graphml", tmp_path / "export"
+    ox.save_graphml(grid, graphml)
+    columnar_export.main(["--graphml", str(graphml), "--out", str(out), "--format", "arrow"])
+
+    store = GraphStore(loader=lambda: load_graph_from_export(str(out)), name="export")
+    version = store.reload()
+    assert isinstance(version.indexes["compact_graph"], CompactGraph) and not version.graph_built
+
+    request = RouteRequest(start_point={"lat": 21.0, "lon": 105.86}, end_point={"lat": 21.02, "lon": 105.88})
+    result = pathfinding_service.find_standard_route_compact(request, version.indexes)
+    assert "error" not in result and not version.graph_built
+
+    assert version.graph.number_of_edges() == grid.number_of_edges() and version.graph_built
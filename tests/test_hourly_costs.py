@@ -0,0 +1,26 @@
+import math
+
+import numpy as np
+
+from src.services.compact_graph import build_compact_graph
+from src.services.routing_engine import ContractedGraph, HourlyCosts
+
+
+def test_hourly_costs_match_static_and_stay_lazy(grid):
+    router = ContractedGraph(build_compact_graph(grid))
+    cost = router.base_cost
+    edge_class = np.zeros(len(cost), dtype=np.int8)
+    s, t = 0, router.compact.num_nodes - 1
+    expected, path = router.shortest_path(s, t, cost)
+
+    hourly = HourlyCosts(cost, edge_class, np.full((1, 24), 2.0))
+    total, timed_path = router.shortest_path(s, t, hourly, depart=8 * 3600)
+    assert math.isclose(total, 2 * expected) and timed_path == path
+    assert set(hourly._columns) <= {8, 9}
+
+    # hệ số đổi theo giờ: nội suy giữa hai mốc
+    factors = np.ones((1, 24))
+    factors[0, 9] = 3.0
+    total, _ = router.shortest_path(s, s + 1, HourlyCosts(cost, edge_class, factors), depart=8.5 * 3600)
+    single, _ = router.shortest_path(s, s + 1, cost)
+    assert math.isclose(total, 2 * single)
@@ -0,0 +1,21 @@
+import geopandas as gpd
+from shapely.geometry import LineString
+
+from src.database.ingest_pipeline import EDGE_SCHEMA, _to_copy_frame
+
+
+def test_list_valued_columns_coerced_for_copy():
+    line = LineString([(105.86, 21.0), (105.87, 21.0)])
+    edges = gpd.GeoDataFrame({
+        "u": [1, 2], "v": [2, 3], "key": [0, 0],
+        "highway": [["residential", "service"], "primary"],
+        "oneway": [[False, True], "False"],
+        "length": [[10.0, 12.5], 3.0],
+        "lanes": [["2", "3"], None],
+    }, geometry=[line, line], crs="EPSG:4326")
+
+    frame = _to_copy_frame(edges, EDGE_SCHEMA)
+    assert frame["highway"].tolist() == ["['residential', 'service']", "primary"]
+    assert frame["oneway"].tolist() == [True, False]
+    assert frame["length"].tolist() == [12.5, 3.0]
+    assert frame["lanes"].tolist()[0] == "['2', '3']"
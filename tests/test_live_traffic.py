@@ -0,0 +1,38 @@
+import numpy as np
+
+from src.services.compact_graph import build_compact_graph
+from src.services.live_traffic import LiveTraffic
+
+
+def _observe(traffic, edges, speed_kph, timestamp):
+    c = traffic.compact
+    return traffic.apply(c.node_osmid[c.edge_source[edges]], c.node_osmid[c.edge_target[edges]],
+                         c.edge_key[edges], np.full(len(edges), speed_kph), np.full(len(edges), timestamp))
+
+
+def test_small_changes_keep_weight_version(grid):
+    traffic = LiveTraffic(build_compact_graph(grid), factor_step=0.1, publish_seconds=0)
+    edges = np.arange(10)
+    assert _observe(traffic, edges, 15.0, 1000.0) == 10
+    version, factor = traffic.snapshot()
+    assert version == 1 and np.allclose(factor[edges], 2.0, rtol=0.05)
+
+    # 15 -> 14.8 km/h: hệ số làm tròn không đổi
+    assert _observe(traffic, edges, 14.8, 1001.0) == 10
+    assert traffic.snapshot()[0] == 1
+    assert _observe(traffic, edges, 10.0, 1002.0) == 10
+    assert traffic.snapshot()[0] == 2
+
+
+def test_publish_rate_limited(grid):
+    traffic = LiveTraffic(build_compact_graph(grid), factor_step=0.1, publish_seconds=3600)
+    changed = []
+    traffic.subscribe(changed.append)
+    _observe(traffic, np.arange(5), 15.0, 1000.0)
+    _observe(traffic, np.arange(5, 10), 15.0, 1000.0)
+    assert traffic.version == 1 and traffic.stats()["pending_edges"] == 5
+
+    assert traffic.flush() == 5
+    assert traffic.version == 2 and sorted(np.concatenate(changed)) == list(range(10))
+    assert traffic.expire(now=1000.0 + traffic.ttl + 1) == 10
+    assert traffic.flush() == 10 and traffic.snapshot() == (3, None)
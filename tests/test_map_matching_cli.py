@@ -0,0 +1,19 @@
+import json
+
+import osmnx as ox
+
+from src.services import map_matching
+
+
+def test_batch_stdout_is_only_jsonl(grid, tmp_path, monkeypatch, capsys):
+    graphml = tmp_path / "grid.graphml"
+    ox.save_graphml(grid, graphml)
+    traces = tmp_path / "traces.jsonl"
+    traces.write_text(json.dumps({"id": "a", "points": [[21.0005, 105.8601], [21.0005, 105.8635], [21.003, 105.8645]]}) + "\n")
+    monkeypatch.setattr(map_matching, "_worker_matcher", None)
+
+    map_matching.main([str(traces), "--out", "-", "--graphml", str(graphml), "--workers", "1"])
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 1 and json.loads(lines[0])["id"] == "a"
+    assert "[map-matching]" in err
@@ -0,0 +1,32 @@
+import math
+
+import numpy as np
+
+from src.services.compact_graph import build_compact_graph
+from src.services.routing_engine import ContractedGraph
+
+
+def test_trivial_goal_at_interior_source_settled_up_front(grid):
+    router = ContractedGraph(build_compact_graph(grid))
+    cost = router.base_cost
+    s = next(iter(router.chain_of))          # node giữa chuỗi (góc lưới)
+    near = int(router.se_target[router.chain_of[s][0][0]])
+
+    dist, parent, keys = router._search(s, [s, near], cost)
+    assert dist[keys[0]] == 0.0 and router._path(parent, keys[0]) == []
+    assert len(dist) < router.compact.num_nodes / 10
+    assert router.one_to_many(s, [s], cost) == [0.0]
+
+
+def test_paths_match_shortest_path(grid):
+    router = ContractedGraph(build_compact_graph(grid))
+    cost = router.base_cost
+    nodes = [0, next(iter(router.chain_of)), 455, 899]
+    for s in nodes:
+        for t, (c, path) in zip(nodes, router.paths_within(s, nodes, cost, math.inf)):
+            if s == t:
+                assert (c, path) == (0.0, [])
+                continue
+            expected, expected_path = router.shortest_path(s, t, cost)
+            assert math.isclose(c, expected) and math.isclose(float(np.sum(cost[path])), expected)
+            assert router.compact.edge_source[path[0]] == s and router.compact.edge_target[path[-1]] == t
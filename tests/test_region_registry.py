@@ -0,0 +1,40 @@
+
+from src.services.region_registry import RegionRegistry, estimate_bytes
+
+
+def _points(region):
+    lon = (region.bbox[0] + region.bbox[2]) / 2
+    lat = (region.bbox[1] + region.bbox[3]) / 2
+    return [lat], [lon]
+
+
+def test_estimate_counts_python_indexes(regions):
+    west = regions[0]
+    version = west.store.reload()
+    router = version.indexes["profiles"]["car"].router
+    # danh sách kề Python của ContractedGraph (~28 byte / phần tử)
+    lists = sum(len(getattr(router, name)) * 28 for name in ("_se_indptr", "_se_target", "_lat", "_lon"))
+    empty = estimate_bytes(version)
+    assert empty > lists
+
+    # cache chuyển tiếp tính theo số mục đang có, không theo sức chứa
+    cache = version.indexes["map_matchers"]["car"].cache
+    assert empty < cache.max_entries * 100
+    for i in range(2000):
+        cache.put(i, i + 1, 10.0, list(range(i, i + 8)), 50.0)
+    assert estimate_bytes(version) - empty > 2000 * 100
+
+
+def test_second_region_evicts_first_under_budget(regions):
+    west, east = regions
+    registry = RegionRegistry(regions, memory_budget=1 << 40)
+    with registry.acquire(*_points(west)):
+        pass
+    assert west.loaded and west.bytes > 0
+
+    registry.memory_budget = int(west.bytes * 1.5)   # vừa đủ cho một vùng
+    with registry.acquire(*_points(east)) as version:
+        assert version is east.store.current
+    assert east.loaded and not west.loaded
+    assert west.evictions == 1 and west.bytes == 0
+    assert registry.stats()["memory_bytes"] <= registry.memory_budget
@@ -0,0 +1,64 @@
+import functools
+import math
+
+from src.app.schemas.route_input_format import RouteRequest
+from src.services import route_subscriptions, vector_tiles
+from src.services.region_registry import RegionRegistry
+
+
+def _tile(z, lat, lon):
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return z, x, y
+
+
+def _box(lon0, lat0, lon1, lat1):
+    return {"type": "Polygon", "coordinates": [[[lon0, lat0], [lon1, lat0], [lon1, lat1], [lon0, lat1], [lon0, lat0]]]}
+
+
+def test_region_tiles_use_region_graph_and_zones(regions, monkeypatch):
+    west = regions[0]
+    registry = RegionRegistry(regions)
+    monkeypatch.setattr(vector_tiles, "region_registry", registry)
+    west.zones.subscribe(functools.partial(vector_tiles._on_zone_changed, name=west.name))
+
+    z, x, y = _tile(16, 21.005, 105.805)
+    before, etag = vector_tiles.get_tile(z, x, y, west.name)
+    assert west.loaded and b"roads" in before and b"ban" not in before
+
+    west.zones.add("ban", _box(105.803, 21.003, 105.807, 21.007))
+    after, etag_after = vector_tiles.get_tile(z, x, y, west.name)
+    assert etag_after != etag and b"ban" in after
+    west.store.unload()
+
+
+def test_region_subscription_indexed_and_recomputed(regions, monkeypatch):
+    west = regions[0]
+    registry = RegionRegistry(regions)
+    monkeypatch.setattr(route_subscriptions, "region_registry", registry)
+    monkeypatch.setattr(route_subscriptions.pathfinding_service, "region_registry", registry)
+    subs = route_subscriptions.SubscriptionRegistry()
+    subs._worker = object()     # không chạy thread tính lại: kiểm tra trực tiếp các đăng ký bị đánh dấu
+    subs.watch(west.name)
+
+    request = RouteRequest(start_point={"lat": 21.001, "lon": 105.801}, end_point={"lat": 21.015, "lon": 105.815})
+    sub = subs.subscribe(request)
+    assert sub.store == west.name and "error" not in sub.result
+    assert sub.result["graph_version"].startswith(f"{west.name}-")
+    assert len(sub.edges) and subs.stats()["indexed_edges"] == len(sub.edges)
+
+    # vùng cấm của vùng cắt ngang tuyến -> đăng ký được đánh dấu tính lại
+    lon, lat = sub.result["route"]["geometry"]["coordinates"][len(sub.result["path"]) // 2]
+    with subs._lock:
+        subs._dirty.clear()
+    west.zones.add("ban", _box(lon - 0.0002, lat - 0.0002, lon + 0.0002, lat + 0.0002))
+    assert subs._dirty.get(sub.id) == "zone"
+
+    # vùng nạp lại -> mọi đăng ký của vùng được tính lại
+    with subs._lock:
+        subs._dirty.clear()
+    west.store.reload()
+    assert subs._dirty.get(sub.id) == "graph"
+    subs.unsubscribe(sub.id)
+    west.store.unload()
@@ -0,0 +1,38 @@
+import json
+import threading
+
+from src.services import request_log
+from src.services.routing_executor import routing_executor
+
+
+class _Store:
+    def __init__(self):
+        self.hooks = []
+
+    def subscribe(self, fn):
+        self.hooks.append(fn)
+
+
+def test_warmup_hook_registered_before_log_exists(tmp_path, monkeypatch):
+    path = tmp_path / "requests.jsonl"
+    warmed = threading.Event()
+    monkeypatch.setattr(request_log, "warm_caches", lambda path, top_n, kinds: warmed.set())
+
+    store = _Store()
+    request_log.start_warmup(store, str(path), top_n=10)
+    assert len(store.hooks) == 1 and not warmed.is_set()
+
+    path.write_text("")
+    store.hooks[0](None)
+    assert warmed.wait(5)
+
+
+def test_warmup_routes_run_on_routing_executor(tmp_path, monkeypatch):
+    path = tmp_path / "requests.jsonl"
+    route = {"start_point": {"lat": 21.0, "lon": 105.86}, "end_point": {"lat": 21.01, "lon": 105.87}}
+    path.write_text(json.dumps({"t": 0, "k": "route", "q": route}) + "\n")
+
+    calls = []
+    monkeypatch.setattr(routing_executor, "call", lambda fn, *args, **kwargs: calls.append(args) or {})
+    summary = request_log.warm_caches(str(path), top_n=10, geocode_interval=0)
+    assert calls == [("route", route)] and summary["route"] == 1
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+import pytest
+
+from src.services.compact_graph import build_compact_graph
+from src.services.routing_engine import ContractedGraph, RouteRepair
+from src.services.routing_executor import Deadline, DeadlineExceededError
+
+
+@pytest.fixture
+def router(grid):
+    return ContractedGraph(build_compact_graph(grid))
+
+
+def test_update_matches_full_search(router):
+    n = router.compact.num_nodes
+    repair = RouteRepair(router, 0, n - 1)
+    cost = router.edge_costs()
+    total, path = repair.update(cost)
+    assert total == pytest.approx(router.shortest_path(0, n - 1, cost)[0])
+    assert float(cost[path].sum()) == pytest.approx(total)
+
+    cost[path[len(path) // 2]] = np.inf
+    total, path = repair.update(cost)
+    assert total == pytest.approx(router.shortest_path(0, n - 1, cost)[0])
+    assert np.isfinite(cost[path]).all()
+
+
+def test_update_resumes_after_deadline(router):
+    n = router.compact.num_nodes
+    repair = RouteRepair(router, 0, n - 1)
+    cost = router.edge_costs()
+    expired = Deadline(time.monotonic() - 1)
+
+    with pytest.raises(DeadlineExceededError):
+        repair.update(cost, deadline=expired, check_every=1)
+    # cùng chi phí, không cạnh nào đổi: vẫn phải tìm tiếp chứ không trả g dở dang của lần trước
+    total, path = repair.update(cost)
+    assert total == pytest.approx(router.shortest_path(0, n - 1, cost)[0])
+    assert float(cost[path].sum()) == pytest.approx(total)
+
+    repair.update(cost)
+    cost[path[0]] *= 3
+    with pytest.raises(DeadlineExceededError):
+        repair.update(cost, deadline=expired, check_every=1)
+    total, _ = repair.update(cost)
+    assert total == pytest.approx(router.shortest_path(0, n - 1, cost)[0])
@@ -0,0 +1,64 @@
+import pytest
+
+from src.services import pathfinding_service
+from src.services.graph_store import graph_store
+from src.services.region_registry import RegionRegistry
+
+sessions = pathfinding_service.route_sessions
+
+
+def _open_session(session_id, version):
+    router = version.indexes["profiles"]["car"].router
+    with sessions.checkout(session_id, router, 0, router.compact.num_nodes - 1) as repair:
+        repair.update(router.edge_costs())
+
+
+@pytest.fixture
+def default_graph(grid):
+    yield graph_store.publish(grid)
+    graph_store.unload()
+    sessions.clear()
+
+
+def test_sessions_dropped_when_default_graph_changes(default_graph, grid):
+    _open_session("a", default_graph)
+    graph_store.publish(grid)
+    assert "a" not in sessions._entries
+
+    _open_session("b", graph_store.current)
+    graph_store.unload()
+    assert "b" not in sessions._entries
+
+
+def test_region_sessions_follow_their_own_store(default_graph, grid, regions, monkeypatch):
+    west = regions[0]
+    monkeypatch.setattr(pathfinding_service, "region_registry", RegionRegistry([west]))
+    pathfinding_service._watch_route_sessions(west.store)
+    west_version = west.store.reload()
+    _open_session("west", west_version)
+    _open_session("default", default_graph)
+
+    # đồ thị mặc định đổi phiên bản: phiên của vùng vẫn giữ
+    graph_store.publish(grid)
+    assert "west" in sessions._entries and "default" not in sessions._entries
+
+    # vùng bị đẩy ra: phiên của vùng bị bỏ, không giữ phiên bản đã unload trong bộ nhớ
+    west.store.unload()
+    assert "west" not in sessions._entries
+
+    _open_session("west", west.store.reload())
+    west.store.reload()
+    assert "west" not in sessions._entries
+
+
+def test_sessions_evicted_over_memory_budget(default_graph, monkeypatch):
+    _open_session("a", default_graph)
+    size = sessions._bytes
+    assert size == sessions._sizes["a"] > 0
+
+    monkeypatch.setattr(sessions, "max_bytes", int(size * 1.5))
+    _open_session("b", default_graph)
+    assert list(sessions._entries) == ["b"] and sessions._bytes == sessions._sizes["b"]
+
+    sessions.drop("b")
+    assert sessions._bytes == 0
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from src.app.schemas.route_input_format import RouteRequest
+from src.services import route_subscriptions
+from src.services.graph_store import graph_store
+
+
+@pytest.fixture
+def registry(grid):
+    graph_store.publish(grid)
+    registry = route_subscriptions.SubscriptionRegistry()
+    registry.on_graph_published(graph_store.current)
+    yield registry
+    graph_store.unload()
+
+
+def _request():
+    return RouteRequest(start_point={"lat": 21.001, "lon": 105.861}, end_point={"lat": 21.02, "lon": 105.88})
+
+
+def test_attach_and_delete_require_token(registry):
+    sub = registry.subscribe(_request())
+    assert sub.result is not None and len(sub.token) >= 32
+    loop = asyncio.new_event_loop()
+    try:
+        assert registry.attach(sub.id, "", loop) is None
+        assert registry.attach(sub.id, sub.token[:-1] + "x", loop) is None
+        assert registry.authorize(sub.id, "guess") is None
+        assert registry.attach(sub.id, sub.token, loop) is not None
+    finally:
+        loop.close()
+    assert registry.authorize(sub.id, sub.token) is sub
+    assert registry.unsubscribe(sub.id)
+
+
+def test_tokens_are_not_sequential(registry):
+    a, b = registry.subscribe(_request()), registry.subscribe(_request())
+    assert a.token != b.token
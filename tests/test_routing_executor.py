@@ -0,0 +1,26 @@
+import threading
+
+import pytest
+
+from src.services.routing_executor import DeadlineExceededError, QueueFullError, RoutingExecutor
+
+
+def test_call_runs_on_pool_with_deadline():
+    executor = RoutingExecutor(max_workers=1, max_queue=4)
+    assert executor.call(lambda x, deadline: (x, deadline.remaining() > 0), 3) == (3, True)
+    executor.shutdown()
+
+
+def test_call_respects_queue_bound_and_timeout():
+    executor = RoutingExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+    running, _ = executor.submit(lambda deadline: release.wait(5))
+    queued, _ = executor.submit(lambda deadline: None)   # chiếm chỗ duy nhất trong hàng đợi
+    with pytest.raises(QueueFullError):
+        executor.call(lambda deadline: None)
+    release.set()
+    running.result(timeout=5), queued.result(timeout=5)
+
+    with pytest.raises(DeadlineExceededError):
+        executor.call(lambda deadline: threading.Event().wait(1), timeout=0.05)
+    executor.shutdown()
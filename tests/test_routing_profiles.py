@@ -0,0 +1,21 @@
+import numpy as np
+
+from src.services.compact_graph import build_compact_graph
+from src.services.routing_profiles import PROFILES, profile_weights
+
+
+def test_car_uses_edge_speed_only_where_maxspeed_is_tagged(grid):
+    # speed_kph = 30 ở mọi cạnh (như osmnx điền khi thiếu maxspeed); chỉ một cạnh có maxspeed thật
+    posted = next(iter(grid.edges(keys=True)))
+    grid.edges[posted]["maxspeed"] = "50"
+    grid.edges[posted]["speed_kph"] = 50.0
+
+    compact = build_compact_graph(grid)
+    car = PROFILES["car"]
+    weights = profile_weights(compact, car)
+    speed = compact.length / weights * 3.6
+
+    has_maxspeed = compact.strings["maxspeed"][0] >= 0
+    assert has_maxspeed.sum() == 1
+    assert np.allclose(speed[has_maxspeed], 50.0)
+    assert np.allclose(speed[~has_maxspeed], car.speeds["residential"])
@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+from fastapi import Body, FastAPI
+from fastapi.testclient import TestClient
+
+from src.app.core.body_limit import BodySizeLimitMiddleware
+from src.services import weight_service
+from src.services.compact_graph import build_compact_graph
+from src.services.routing_engine import EdgeSpatialIndex
+
+
+def _circle(lon, lat, radius, n):
+    ring = [[lon + radius * math.cos(2 * math.pi * i / n), lat + radius * math.sin(2 * math.pi * i / n)]
+            for i in range(n)]
+    return {"type": "Polygon", "coordinates": [ring + [ring[0]]]}
+
+
+def test_ban_zones_cover_every_edge_of_the_original_shape(grid):
+    edge_index = EdgeSpatialIndex(build_compact_graph(grid))
+    num_edges = len(edge_index.geometries)
+    for i, radius in enumerate((0.0031, 0.0047, 0.0063, 0.0089)):
+        zone = _circle(105.875 + i * 0.0003, 21.014, radius, 900)
+        prepared = weight_service.parse_zone(zone)
+        exact = np.unique(edge_index.query(prepared.shape))
+
+        _, banned, _ = weight_service.compute_edge_overlay(edge_index, num_edges, ban_areas=[zone])
+        assert banned[exact].all()
+
+        # vùng ngập vẫn được đơn giản hóa (không cần bảo toàn), kết quả xấp xỉ vùng gốc
+        multiplier, _, _ = weight_service.compute_edge_overlay(edge_index, num_edges, flood_areas=[zone])
+        flooded = np.flatnonzero(multiplier > 1)
+        assert abs(len(flooded) - len(exact)) <= 0.1 * len(exact)
+
+
+def test_overlay_reuses_preprocessed_zones(grid, monkeypatch):
+    edge_index = EdgeSpatialIndex(build_compact_graph(grid))
+    zone = _circle(105.87, 21.01, 0.002, 40)
+    zones = weight_service.preprocess_zones([], [zone], [])
+
+    def fail(*zone_lists):
+        raise AssertionError("preprocess_zones chạy lại")
+
+    monkeypatch.setattr(weight_service, "preprocess_zones", fail)
+    _, banned, metadata = weight_service.compute_edge_overlay(
+        edge_index, len(edge_index.geometries), [], [], [zone], zones=zones
+    )
+    assert banned.sum() == metadata["ban_affected_edges"] > 0
+
+
+def _app(limit):
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, max_bytes=limit, paths=("/zones",))
+
+    @app.post("/zones")
+    async def zones(ban_areas: list = Body(..., embed=True)):
+        return {"count": len(ban_areas)}
+
+    @app.post("/other")
+    async def other(ban_areas: list = Body(..., embed=True)):
+        return {"count": len(ban_areas)}
+
+    return TestClient(app)
+
+
+def test_body_limit_rejects_before_parsing():
+    client = _app(1000)
+    small = b'{"ban_areas": [1, 2]}'
+    big = b'{"ban_areas": [' + b",".join([b"1"] * 2000) + b"]}"
+    assert client.post("/zones", content=small, headers={"content-type": "application/json"}).json() == {"count": 2}
+    assert client.post("/zones", content=big, headers={"content-type": "application/json"}).status_code == 413
+    # chunked, không có Content-Length
+    chunked = client.post("/zones", content=iter([big[:600], big[600:]]), headers={"content-type": "application/json"})
+    assert chunked.status_code == 413
+    assert client.post("/other", content=big, headers={"content-type": "application/json"}).status_code == 200